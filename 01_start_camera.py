@@ -1,25 +1,43 @@
+import argparse
 import cv2
 import numpy as np
 
+from src.data_source.depth_recording import DepthRecorder
 from src.data_source.ps4_data_source import PS4DataSource
 from src.depth import get_stereo_depth_algo
 
 if __name__ == '__main__':
-    data_source = PS4DataSource()
+    parser = argparse.ArgumentParser(description='Live stereo preview with disparity')
+    parser.add_argument('--record', default=None, help='write frames and disparity to this .depth recording')
+    args = parser.parse_args()
+
+    # brightness and calibration load in the background while the first frames arrive
+    data_source = PS4DataSource(fast_startup=True, brightness_mode='auto')
     depth_algo = get_stereo_depth_algo('bm', smoothen=True)
     # depth_algo = get_stereo_depth_algo('sgbm', smoothen=True)
-    for frame_r, frame_l in data_source.stream(grayscale=True):
+    # pick up params saved by the depth calibration UI without restarting
+    data_source.enable_hot_reload(depth_algo)
+    display = None # reused side-by-side preview buffer
+    # the preview disparity is normalized to 0..1, float16 keeps it compact
+    recorder = DepthRecorder(args.record, disparity_dtype=np.float16) if args.record else None
+    # capture, rectification and disparity run on separate threads
+    for frame_r, frame_l, disparity in data_source.stream_pipelined(depth_algo, grayscale=True):
         if frame_r is None or frame_l is None:
             break
 
-        disparity = depth_algo.compute_disparity(frame_l, frame_r)
-
-        cv2.imshow('stereo', np.concatenate([frame_r, frame_l], axis=1))
+        if display is None:
+            print('Startup (s):', data_source.get_startup_report())
+            display = np.empty((frame_r.shape[0], frame_r.shape[1] * 2) + frame_r.shape[2:], frame_r.dtype)
+        cv2.imshow('stereo', np.concatenate([frame_r, frame_l], axis=1, out=display))
 
         if not disparity is None:
             cv2.imshow('disparity', disparity)
+            if recorder is not None:
+                recorder.write(frame_r, frame_l, disparity)
 
         if cv2.waitKey(1) == ord('q'):
                 break
 
-    data_source.close_stream()
\ No newline at end of file
+    if recorder is not None:
+        recorder.close()
+    data_source.close_stream()
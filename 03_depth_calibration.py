@@ -1,9 +1,9 @@
 import cv2
 
 from pathlib import Path
-from stereovision.calibration import StereoCalibration
 
 from src.calibration.depth_calibration_ui import DepthCalibrationUI
+from src.data_source.rectification import RectificationMaps
 
 if __name__ == '__main__':
     frame_path = './data/calibration/pairs'
@@ -15,7 +15,8 @@ if __name__ == '__main__':
     frame_r = cv2.imread(frame_r_path)
     frame_l = cv2.imread(frame_l_path)
 
-    calibration = StereoCalibration(input_folder=calibration_params)
+    frame_height, frame_width = frame_r.shape[:2]
+    calibration = RectificationMaps(calibration_params, (frame_width, frame_height))
     frame_r, frame_l = calibration.rectify((frame_r, frame_l))
 
     frame_r = cv2.cvtColor(frame_r, cv2.COLOR_BGR2GRAY)
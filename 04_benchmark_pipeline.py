@@ -0,0 +1,23 @@
+import argparse
+import json
+
+from src.benchmark.stereo_pipeline import DEFAULT_CONFIGS, run
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Per-stage stereo pipeline benchmark')
+    parser.add_argument('--recording', default=None, help='recorded side-by-side video or .raw dump, synthetic frames if omitted')
+    parser.add_argument('--frames', type=int, default=50)
+    parser.add_argument('--algos', nargs='+', default=None, help='subset of configs, e.g. bm sgbm+wls')
+    parser.add_argument('--output', default=None, help='write the JSON report here instead of stdout')
+    args = parser.parse_args()
+
+    configs = DEFAULT_CONFIGS
+    if args.algos:
+        configs = [(name.split('+')[0], name.endswith('+wls')) for name in args.algos]
+
+    report = json.dumps(run(args.recording, args.frames, configs), indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(report)
+    else:
+        print(report)
@@ -0,0 +1,30 @@
+import argparse
+import json
+
+from src.calibration.param_tuner import ParamTuner, load_pairs
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Search stereo matcher params within the slider ranges')
+    parser.add_argument('--pairs', default='./data/calibration/pairs', help='.depth recording or folder with left_*/right_* images')
+    parser.add_argument('--max-pairs', type=int, default=9)
+    parser.add_argument('--algo', choices=['bm', 'sgbm'], default='bm')
+    parser.add_argument('--no-smoothen', action='store_true', help='tune for the pipeline without the WLS filter')
+    parser.add_argument('--latency-budget-ms', type=float, default=None, help='max median disparity time per frame')
+    parser.add_argument('--candidates', type=int, default=27)
+    parser.add_argument('--eta', type=int, default=3, help='1/eta of the candidates survive each rung')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=None, help='config to write, the algorithm\'s own config if omitted')
+    parser.add_argument('--dry-run', action='store_true', help='only print the best params')
+    args = parser.parse_args()
+
+    pairs = load_pairs(args.pairs, args.max_pairs)
+    tuner = ParamTuner(pairs, args.algo, smoothen=not args.no_smoothen, latency_budget_ms=args.latency_budget_ms,
+                       candidates=args.candidates, eta=args.eta, workers=args.workers, seed=args.seed)
+    params, report = tuner.tune()
+    print(json.dumps({'params': params, 'report': report}, indent=2))
+
+    if not report['feasible']:
+        print('No candidate met the latency budget, nothing saved')
+    elif not args.dry_run:
+        print(f'Saved to {tuner.save(params, args.output)}')
@@ -0,0 +1,132 @@
+""" Checks the asyncio streaming API on synthetic frames.
+
+- fan-out: three subscribers with different skip policies share one capture,
+  the lossless one must see every frame, the slow ones must skip
+- cancellation: cancelling a task iterating astream() releases the capture
+  exactly once, on the capture thread and never during a read
+- responsiveness: worst event loop lag while streaming with disparity
+
+Exits with code 1 when a check fails.
+
+    python -m src.benchmark.async_stream --frames 40
+"""
+import argparse
+import asyncio
+import json
+import sys
+import threading
+import time
+
+from src.benchmark.synthetic import SyntheticDataSource
+from src.data_source.async_stream import AsyncStreamHub
+from src.depth import get_stereo_depth_algo
+
+
+class CheckedDataSource(SyntheticDataSource):
+    """ Paced like a camera, records how the capture is used and released. """
+    def __init__(self, fps=60, **kwargs):
+        self.fps = fps
+        self.reading = False
+        self.read_threads = set()
+        self.releases = []
+        super().__init__(**kwargs)
+
+    def _read_frame(self, reuse_buffers=True):
+        self.reading = True
+        self.read_threads.add(threading.current_thread().name)
+        time.sleep(1 / self.fps)
+        frame = super()._read_frame(reuse_buffers)
+        self.reading = False
+        return frame
+
+    def close_stream(self):
+        self.releases.append({'thread': threading.current_thread().name, 'during_read': self.reading})
+        super().close_stream()
+
+
+def released_cleanly(data_source):
+    return (len(data_source.releases) == 1 and not data_source.releases[0]['during_read']
+            and data_source.read_threads == {data_source.releases[0]['thread']})
+
+
+async def _consume(subscription, delay=0.0):
+    async for _ in subscription:
+        await asyncio.sleep(delay)
+
+
+async def check_fan_out(frames, fps):
+    data_source = CheckedDataSource(fps, num_frames=frames)
+    depth_algo = get_stereo_depth_algo('bm', smoothen=False)
+    async with AsyncStreamHub(data_source, depth_algo, grayscale=True) as hub:
+        lossless = hub.subscribe(maxsize=2, skip='block')
+        freshest = hub.subscribe(maxsize=1, skip='oldest')
+        decimated = hub.subscribe(maxsize=1, skip='newest', every=3)
+        await asyncio.gather(_consume(lossless), _consume(freshest, 0.1), _consume(decimated, 0.05))
+        stats = hub.get_stats()
+
+    return {'frames': stats['frames'],
+            'subscribers': stats['subscribers'],
+            'released_cleanly': released_cleanly(data_source),
+            'passed': bool(stats['frames'] == frames
+                           and lossless.delivered == frames and lossless.dropped == 0
+                           and freshest.dropped > 0
+                           and decimated.delivered + decimated.dropped == (frames + 2) // 3
+                           and released_cleanly(data_source))}
+
+
+async def check_cancellation(fps, cancel_after=5):
+    data_source = CheckedDataSource(fps)
+    received = 0
+
+    async def consume():
+        nonlocal received
+        async for _ in data_source.astream(grayscale=True):
+            received += 1
+
+    task = asyncio.get_running_loop().create_task(consume())
+    while received < cancel_after:
+        await asyncio.sleep(0.01)
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+    return {'received': received,
+            'releases': data_source.releases,
+            'passed': released_cleanly(data_source)}
+
+
+async def check_loop_lag(frames, fps, interval=0.005):
+    data_source = CheckedDataSource(fps, num_frames=frames)
+    depth_algo = get_stereo_depth_algo('sgbm', smoothen=True)
+    lags, streaming = [], True
+
+    async def ticker():
+        while streaming:
+            start = time.perf_counter()
+            await asyncio.sleep(interval)
+            lags.append((time.perf_counter() - start - interval) * 1000)
+
+    tick = asyncio.get_running_loop().create_task(ticker())
+    async for _ in data_source.astream(depth_algo, grayscale=True):
+        pass
+    streaming = False
+    await tick
+    return {'max_loop_lag_ms': max(lags), 'ticks': len(lags)}
+
+
+async def run(frames=40, fps=60):
+    return {'fan_out': await check_fan_out(frames, fps),
+            'cancellation': await check_cancellation(fps),
+            'loop_lag': await check_loop_lag(frames // 2, fps)}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--frames', type=int, default=40)
+    parser.add_argument('--fps', type=int, default=60)
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args.frames, args.fps))
+    print(json.dumps(report, indent=2))
+    sys.exit(0 if report['fan_out']['passed'] and report['cancellation']['passed'] else 1)
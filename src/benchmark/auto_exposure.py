@@ -0,0 +1,135 @@
+""" Closed-loop check of the auto-exposure controller against a simulated camera.
+
+The simulated camera renders a textured scene whose light level drifts
+(and jumps) over time, applies exposure/gain with a few frames of delay
+like real drivers do, and counts how often it is reconfigured. Exits with
+code 1 when brightness does not settle near the target; the same check
+runs as tests/test_auto_exposure.py.
+
+    python -m src.benchmark.auto_exposure --frames 600
+"""
+import argparse
+import cv2
+import json
+import numpy as np
+import sys
+import time
+
+from src.benchmark.synthetic import make_side_by_side, make_synthetic_pair
+from src.data_source.auto_exposure import luminance_stats
+from src.data_source.ps4_data_source import PS4DataSource
+
+
+class SimulatedCamera():
+    """ Minimal cv2.VideoCapture stand-in with exposure and gain.
+
+    Pixel value = raw pixel * light * 2**(exposure + 6) * (1 + gain / 16),
+    clipped to 255. Settings take effect after `latency` frames.
+    """
+    def __init__(self, raw_frame, light=lambda frame_idx: 1.0, exposure=-6.0, gain=0.0, latency=2, seed=0):
+        self.raw_frame = raw_frame
+        self.light = light
+        self.latency = latency
+        self.rng = np.random.default_rng(seed)
+        self.props = {cv2.CAP_PROP_EXPOSURE: exposure, cv2.CAP_PROP_GAIN: gain}
+        self.frame_idx = 0
+        self.sets = 0
+        self.read_seconds = 0.0 # time spent rendering the last frame
+        self._queued = [] # (frame_idx when effective, prop, value)
+        self._active = dict(self.props)
+
+    def isOpened(self):
+        return True
+
+    def get(self, prop):
+        return self.props.get(prop, 0.0)
+
+    def set(self, prop, value):
+        if prop in self.props:
+            self.props[prop] = value
+            self._queued.append((self.frame_idx + self.latency, prop, value))
+            self.sets += 1
+        return True
+
+    def read(self, image=None):
+        start = time.perf_counter()
+        for item in [item for item in self._queued if item[0] <= self.frame_idx]:
+            self._active[item[1]] = item[2]
+            self._queued.remove(item)
+        scale = self.light(self.frame_idx) * 2 ** (self._active[cv2.CAP_PROP_EXPOSURE] + 6) \
+            * (1 + self._active[cv2.CAP_PROP_GAIN] / 16)
+        # a little temporal noise, growing with the gain
+        scale *= 1 + self.rng.normal(0, 0.01 * (1 + self._active[cv2.CAP_PROP_GAIN] / 8))
+        self.frame_idx += 1
+        frame = cv2.convertScaleAbs(self.raw_frame, dst=image, alpha=scale)
+        self.read_seconds = time.perf_counter() - start
+        return True, frame
+
+    def release(self):
+        pass
+
+
+def daylight(frames):
+    # slow drift over the run plus a sudden 3x jump (a lamp switched on) half way
+    def light(frame_idx):
+        drift = 0.6 + 0.4 * np.sin(frame_idx / frames * np.pi)
+        return drift * (3.0 if frame_idx > frames // 2 else 1.0)
+    return light
+
+
+class SimulatedCameraDataSource(PS4DataSource):
+    def __init__(self, light, **kwargs):
+        self.light = light
+        super().__init__(calibrate_camera=False, brightness_mode='auto', **kwargs)
+
+    def _load_camera_firmware(self):
+        pass
+
+    def _open_capture_source(self):
+        frame_l, frame_r, _ = make_synthetic_pair(self.frame_height, self.frame_width, color=True)
+        self.cap = SimulatedCamera(make_side_by_side(frame_r, frame_l), self.light)
+
+    def _adapt_brightness_using_config(self, config_path=None):
+        pass # start from the simulated camera's defaults
+
+
+def run(frames=600, fps=25, tolerance=20.0):
+    data_source = SimulatedCameraDataSource(daylight(frames))
+    controller = data_source.auto_exposure
+    luminance, overhead_ms = [], []
+
+    for _ in range(frames):
+        start = time.perf_counter()
+        frame = data_source._read_frame(reuse_buffers=False)
+        # what the controller adds to a read: apply() plus submit()
+        overhead_ms.append((time.perf_counter() - start - data_source.cap.read_seconds) * 1000)
+        luminance.append(luminance_stats(frame)[0])
+        time.sleep(1 / fps) # the controller meters at the camera's pace
+
+    data_source.close_stream()
+    luminance = np.array(luminance)
+    # skip the start and the half after the jump before judging the settled state
+    settle = frames // 10
+    settled = np.concatenate([luminance[settle:frames // 2], luminance[frames // 2 + settle:]])
+    error = np.abs(settled - controller.target)
+
+    return {'frames': frames,
+            'target': controller.target,
+            'settled_mean_abs_error': float(error.mean()),
+            'settled_max_abs_error': float(error.max()),
+            'adjustments': controller.adjustments,
+            'camera_sets': data_source.cap.sets,
+            'read_overhead_p99_ms': float(np.percentile(overhead_ms, 99)),
+            'final': controller.get_stats(),
+            'passed': bool(error.mean() < tolerance)}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--frames', type=int, default=600)
+    parser.add_argument('--fps', type=int, default=25)
+    args = parser.parse_args()
+
+    report = run(args.frames, args.fps)
+    print(json.dumps(report, indent=2))
+    sys.exit(0 if report['passed'] else 1)
@@ -0,0 +1,62 @@
+""" Import cost of the camera entry points, measured in a fresh interpreter.
+
+Fails (exit code 1) when a module pulls in one of the heavy modules that
+must stay lazy, or when an import exceeds --budget-ms. The same checks run
+as tests in tests/test_import_time.py.
+
+    python -m src.benchmark.import_time --budget-ms 800
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ENTRY_MODULES = ('src.data_source.ps4_data_source', 'src.depth', 'src.telemetry')
+# only loaded when the feature using them is used
+LAZY_MODULES = ('matplotlib', 'stereovision', 'http.server', 'src.depth.stereo_depth')
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def measure_import(module):
+    # -X importtime reports 'import time: self [us] | cumulative | name' on stderr
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            capture_output=True, text=True, cwd=REPO_ROOT)
+    if result.returncode != 0:
+        raise RuntimeError(f'Importing {module} failed:\n{result.stderr}')
+
+    cumulative = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, total, name = line[len('import time:'):].split('|')
+        cumulative[name.strip()] = int(total) / 1000
+    return cumulative
+
+
+def check(modules=ENTRY_MODULES, budget_ms=None):
+    report, failures = {}, []
+    for module in modules:
+        cumulative = measure_import(module)
+        loaded_lazy = [name for name in LAZY_MODULES if name in cumulative]
+        report[module] = {'import_ms': cumulative.get(module),
+                          'modules': len(cumulative),
+                          'lazy_modules_loaded': loaded_lazy}
+        if loaded_lazy:
+            failures.append(f'{module} imports {", ".join(loaded_lazy)}')
+        if budget_ms is not None and cumulative.get(module, 0) > budget_ms:
+            failures.append(f'{module} takes {cumulative[module]:.0f}ms, budget {budget_ms}ms')
+    return report, failures
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--modules', nargs='+', default=list(ENTRY_MODULES))
+    parser.add_argument('--budget-ms', type=float, default=None)
+    args = parser.parse_args()
+
+    report, failures = check(args.modules, args.budget_ms)
+    print(json.dumps(report, indent=2))
+    for failure in failures:
+        print(f'FAIL: {failure}')
+    sys.exit(1 if failures else 0)
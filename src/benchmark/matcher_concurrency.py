@@ -0,0 +1,49 @@
+""" Per-frame latency of smoothed disparity with sequential vs concurrent
+left/right matchers.
+
+    python -m src.benchmark.matcher_concurrency --frames 50
+"""
+import argparse
+import json
+import numpy as np
+import time
+
+from src.benchmark.synthetic import make_synthetic_pair
+from src.depth import get_stereo_depth_algo
+
+
+def measure_latency(depth_algo, frame_l, frame_r, frames, warmup=3):
+    for _ in range(warmup):
+        depth_algo.compute_disparity(frame_l, frame_r)
+
+    latencies = []
+    for _ in range(frames):
+        start = time.perf_counter()
+        depth_algo.compute_disparity(frame_l, frame_r)
+        latencies.append(time.perf_counter() - start)
+    latencies = np.array(latencies) * 1000
+    return {'p50_ms': float(np.percentile(latencies, 50)),
+            'p99_ms': float(np.percentile(latencies, 99)),
+            'mean_ms': float(latencies.mean())}
+
+
+def run(frames=50, algos=('bm', 'sgbm')):
+    frame_l, frame_r, _ = make_synthetic_pair()
+    report = {}
+    for algo_type in algos:
+        sequential = measure_latency(get_stereo_depth_algo(algo_type, smoothen=True),
+                                     frame_l, frame_r, frames)
+        concurrent = measure_latency(get_stereo_depth_algo(algo_type, smoothen=True, concurrent_matchers=True),
+                                     frame_l, frame_r, frames)
+        report[algo_type] = {'sequential': sequential,
+                             'concurrent': concurrent,
+                             'speedup_p50': sequential['p50_ms'] / concurrent['p50_ms']}
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--frames', type=int, default=50)
+    parser.add_argument('--algos', nargs='+', default=['bm', 'sgbm'])
+    args = parser.parse_args()
+    print(json.dumps(run(args.frames, args.algos), indent=2))
@@ -0,0 +1,95 @@
+""" Quality vs latency of disparity post-processing against the WLS path.
+
+Runs every configuration on a sequence of noisy synthetic pairs with known
+disparity and reports, per configuration, the p50 latency of the whole
+disparity step and the error against ground truth:
+- bad_pixels: share of pixels more than 1 px off (invalid counts as bad)
+- invalid: share of pixels without a disparity
+- mae_px: mean absolute error over valid pixels
+
+    python -m src.benchmark.postprocessing --frames 20
+"""
+import argparse
+import cv2
+import json
+import numpy as np
+import time
+
+from src.benchmark.synthetic import make_synthetic_pair
+from src.depth import get_stereo_depth_algo
+from src.depth.depth_map import DISP_SCALE
+from src.depth.postprocessing import DisparityPostProcessor
+
+CONFIGS = {
+    'left': dict(smoothen=False),
+    'wls': dict(smoothen=True),
+    'wls+confidence': dict(smoothen=True, postprocessor=dict(min_confidence=64)),
+    'left+fill+median': dict(smoothen=False, postprocessor=dict()),
+    'left+lr+fill+median': dict(smoothen=False, postprocessor=dict(lr_check=True)),
+    'left+lr+fill+median+temporal': dict(smoothen=False, postprocessor=dict(lr_check=True, temporal_alpha=0.5)),
+}
+
+
+def make_sequence(frames, noise=4.0, seed=0):
+    # one static scene, fresh sensor noise per frame so temporal filtering has work to do
+    frame_l, frame_r, gt = make_synthetic_pair(seed=seed)
+    rng = np.random.default_rng(seed)
+    sequence = []
+    for _ in range(frames):
+        noisy = [np.clip(frame + rng.normal(0, noise, frame.shape), 0, 255).astype(np.uint8)
+                 for frame in (frame_l, frame_r)]
+        sequence.append(tuple(noisy))
+    return sequence, gt
+
+
+def evaluate(disparity, gt, min_disparity):
+    valid = disparity > (min_disparity - 1) * DISP_SCALE
+    error = np.abs(disparity.astype(np.float32) / DISP_SCALE - gt)
+    return {'bad_pixels': float(np.mean(~valid | (error > 1))),
+            'invalid': float(np.mean(~valid)),
+            'mae_px': float(error[valid].mean()) if valid.any() else None}
+
+
+def benchmark_config(algo_type, options, sequence, gt, pyramid_level=1):
+    options = dict(options)
+    if options.get('postprocessor') is not None:
+        options['postprocessor'] = DisparityPostProcessor(**options['postprocessor'])
+    depth_algo = get_stereo_depth_algo(algo_type, pyramid_level=pyramid_level, **options)
+    min_disparity = depth_algo.get_params()['MinDISP']
+
+    # ground truth at matching resolution, disparities shrink with the image
+    scale = 2 ** pyramid_level
+    height, width = gt.shape
+    gt = cv2.resize(gt, (width // scale, height // scale), interpolation=cv2.INTER_NEAREST) / scale
+
+    latencies, scores = [], []
+    for frame_l, frame_r in sequence:
+        start = time.perf_counter()
+        # metric keeps the fixed-point scale, otherwise the WLS input is rescaled
+        disparity = depth_algo._compute_raw_disparity(*depth_algo._prepare_frames(frame_l, frame_r), metric=True)
+        latencies.append((time.perf_counter() - start) * 1000)
+        scores.append(evaluate(disparity, gt[:disparity.shape[0], :disparity.shape[1]], min_disparity))
+
+    # the first frames warm up the matchers (and the temporal filter), judge the rest
+    scores = scores[len(scores) // 4:]
+    report = {key: float(np.mean([score[key] for score in scores if score[key] is not None]))
+              for key in scores[0]}
+    report['p50_ms'] = float(np.percentile(latencies[1:], 50))
+    return report
+
+
+def run(frames=20, algos=('bm', 'sgbm'), configs=CONFIGS):
+    sequence, gt = make_sequence(frames)
+    return {algo_type: {name: benchmark_config(algo_type, options, sequence, gt)
+                        for name, options in configs.items()}
+            for algo_type in algos}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--frames', type=int, default=20)
+    parser.add_argument('--algos', nargs='+', default=['bm', 'sgbm'])
+    parser.add_argument('--configs', nargs='+', default=list(CONFIGS), choices=list(CONFIGS))
+    args = parser.parse_args()
+    configs = {name: CONFIGS[name] for name in args.configs}
+    print(json.dumps(run(args.frames, args.algos, configs), indent=2))
@@ -0,0 +1,109 @@
+""" Per-stage benchmark of the stereo pipeline on synthetic or recorded frames.
+
+Stages: _extract_stereo, rectification, grayscale conversion, pyrDown,
+the BM/SGBM matcher with and without WLS, and normalization. Reports
+p50/p99 latency per stage, end-to-end throughput and peak memory as JSON.
+"""
+import cv2
+import numpy as np
+import sys
+import time
+import tracemalloc
+
+from src.benchmark.synthetic import SyntheticDataSource
+from src.data_source.file_data_source import FileDataSource
+from src.depth import get_stereo_depth_algo
+
+try:
+    import resource # not available on Windows
+except ImportError:
+    resource = None
+
+DEFAULT_CONFIGS = (('bm', False), ('bm', True), ('sgbm', False), ('sgbm', True))
+
+
+class StageTimer():
+    def __init__(self):
+        self.samples = {}
+
+    def time(self, stage, func, *args):
+        start = time.perf_counter()
+        result = func(*args)
+        self.samples.setdefault(stage, []).append(time.perf_counter() - start)
+        return result
+
+    def report(self):
+        report = {}
+        for stage, samples in self.samples.items():
+            samples = np.array(samples) * 1000
+            report[stage] = {'p50_ms': float(np.percentile(samples, 50)),
+                             'p99_ms': float(np.percentile(samples, 99)),
+                             'mean_ms': float(samples.mean()),
+                             'samples': len(samples)}
+        return report
+
+
+def _peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def open_data_source(recording=None, calibration_params='./src/data_source/calibration_params'):
+    if recording is None:
+        return SyntheticDataSource(calibration_params=calibration_params)
+    return FileDataSource(recording, pacing='fast', loop=True, calibration_params=calibration_params)
+
+
+def benchmark_config(data_source, algo_type, smoothen, frames=50, warmup=5):
+    depth_algo = get_stereo_depth_algo(algo_type, smoothen=smoothen)
+    timer = StageTimer()
+
+    tracemalloc.start()
+    start = None
+    for i in range(warmup + frames):
+        if i == warmup:
+            # drop warm-up samples (first remap, matcher buffers, ...)
+            timer = StageTimer()
+            tracemalloc.reset_peak()
+            start = time.perf_counter()
+
+        raw = data_source._read_frame(reuse_buffers=False)
+        if raw is None:
+            break
+        frame_r, frame_l = timer.time('extract', data_source._extract_stereo, raw)
+        if data_source.calibrate_camera:
+            frame_r, frame_l = timer.time('rectify', data_source.frame_calibration.rectify, (frame_r, frame_l))
+        frame_r, frame_l = timer.time('grayscale', lambda: (cv2.cvtColor(frame_r, cv2.COLOR_BGR2GRAY),
+                                                            cv2.cvtColor(frame_l, cv2.COLOR_BGR2GRAY)))
+        frame_l, frame_r = timer.time('pyrdown', depth_algo._prepare_frames, frame_l, frame_r)
+        disparity = timer.time('matcher', depth_algo._compute_raw_disparity, frame_l, frame_r)
+        timer.time('normalize', depth_algo._normalize_disparity, disparity)
+
+    elapsed = time.perf_counter() - start if start is not None else 0.0
+    _, peak_traced = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    measured = len(timer.samples.get('normalize', []))
+    return {'algo': algo_type,
+            'wls': smoothen,
+            'frames': measured,
+            'fps': measured / elapsed if elapsed else 0.0,
+            'stages': timer.report(),
+            'peak_traced_mb': peak_traced / (1024 * 1024)}
+
+
+def run(recording=None, frames=50, configs=DEFAULT_CONFIGS, **kwargs):
+    data_source = open_data_source(recording, **kwargs)
+    results = [benchmark_config(data_source, algo_type, smoothen, frames)
+               for algo_type, smoothen in configs]
+    data_source.close_stream()
+
+    return {'source': recording or 'synthetic',
+            'frame_shape': data_source.get_frame_shape(),
+            'opencv': cv2.__version__,
+            'threads': cv2.getNumThreads(),
+            'peak_rss_mb': _peak_rss_mb(),
+            'results': results}
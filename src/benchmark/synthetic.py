@@ -0,0 +1,80 @@
+import cv2
+import numpy as np
+
+from src.data_source.ps4_data_source import PS4DataSource
+
+
+def _texture(rng, height, width):
+    # blurred noise gives the block matchers something to lock on to
+    noise = rng.integers(0, 256, (height, width), dtype=np.uint8)
+    return cv2.GaussianBlur(noise, (3, 3), 0)
+
+
+def make_synthetic_pair(height=800, width=1264, background_disp=16, foreground_disp=48,
+                        color=False, seed=0):
+    """ Rectified stereo pair with known disparity: textured background plus
+    a textured box floating in front of it.
+
+    Returns (frame_l, frame_r, gt_disparity) with gt_disparity in pixels.
+    """
+    rng = np.random.default_rng(seed)
+    margin = foreground_disp + background_disp
+    background = _texture(rng, height, width + margin)
+    foreground = _texture(rng, height // 2, width // 3)
+
+    frame_l = background[:, :width].copy()
+    frame_r = background[:, background_disp:background_disp + width].copy()
+    gt_disparity = np.full((height, width), background_disp, dtype=np.float32)
+
+    y0, x0 = height // 4, width // 3
+    y1, x1 = y0 + foreground.shape[0], x0 + foreground.shape[1]
+    frame_l[y0:y1, x0:x1] = foreground
+    frame_r[y0:y1, x0 - foreground_disp:x1 - foreground_disp] = foreground
+    gt_disparity[y0:y1, x0:x1] = foreground_disp
+
+    if color:
+        frame_l = cv2.cvtColor(frame_l, cv2.COLOR_GRAY2BGR)
+        frame_r = cv2.cvtColor(frame_r, cv2.COLOR_GRAY2BGR)
+    return frame_l, frame_r, gt_disparity
+
+
+def make_side_by_side(frame_r, frame_l, raw_shape=(808, 3448), x_shift=64):
+    # lay the eyes out like the PS4 camera does, see PS4DataSource._extract_stereo
+    height, width = frame_r.shape[:2]
+    raw = np.zeros(raw_shape + frame_r.shape[2:], dtype=frame_r.dtype)
+    raw[:height, x_shift:x_shift + width] = frame_r
+    raw[:height, x_shift + width:x_shift + 2 * width] = frame_l
+    return raw
+
+
+class SyntheticDataSource(PS4DataSource):
+    """ Camera-free data source that cycles through synthetic raw frames. """
+    def __init__(self, num_frames=None, variations=4, **kwargs):
+        self.num_frames = num_frames # None streams forever
+        self.variations = variations
+        self.frames_read = 0
+        super().__init__(**kwargs)
+
+    def _load_camera_firmware(self):
+        pass
+
+    def _adapt_brightness(self):
+        pass
+
+    def _open_capture_source(self):
+        self.cap = None
+        self.raw_frames = []
+        for seed in range(self.variations):
+            frame_l, frame_r, _ = make_synthetic_pair(self.frame_height, self.frame_width, color=True, seed=seed)
+            self.raw_frames.append(make_side_by_side(frame_r, frame_l))
+
+    def _read_frame(self, reuse_buffers=True):
+        if self.num_frames is not None and self.frames_read >= self.num_frames:
+            return None
+        frame = self.raw_frames[self.frames_read % self.variations]
+        self.frames_read += 1
+        return frame
+
+    def close_stream(self):
+        if self.pipeline is not None:
+            self.pipeline.stop()
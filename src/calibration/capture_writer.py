@@ -0,0 +1,146 @@
+import cv2
+import numpy as np
+import os
+import queue
+import threading
+import time
+
+ENCODINGS = ('png', 'npy')
+
+
+class AsyncPairWriter():
+    """ Writes captured stereo pairs on a background thread.
+
+    The capture loop only copies the frames into a bounded queue. 'png'
+    uses a low compression level for speed, 'npy' dumps the raw arrays.
+    The first write error is kept and raised by the next submit() and by
+    close(); the thread keeps draining the queue so close() never blocks.
+    """
+    def __init__(self, dst_folder, encoding='png', png_compression=1, queue_size=8):
+        if encoding not in ENCODINGS:
+            raise ValueError(f'Unknown encoding {encoding}, expected one of {ENCODINGS}')
+        os.makedirs(dst_folder, exist_ok=True)
+        self.dst_folder = dst_folder
+        self.encoding = encoding
+        self.png_params = [cv2.IMWRITE_PNG_COMPRESSION, png_compression]
+
+        self.written = 0
+        self.rejected = 0 # pairs refused because the writer fell behind
+        self.error = None # first exception raised by a write
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = threading.Thread(target=self._run, daemon=True, name='pair-writer')
+        self._thread.start()
+
+    def _write(self, path, frame):
+        if self.encoding == 'npy':
+            np.save(f'{path}.npy', frame)
+        else:
+            if not cv2.imwrite(f'{path}.png', frame, self.png_params):
+                raise OSError(f'Could not write {path}.png')
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            if self.error is not None:
+                continue # drop the rest, the error is reported instead
+            idx, frame_r, frame_l = item
+            try:
+                self._write(os.path.join(self.dst_folder, f'right_{idx}'), frame_r)
+                self._write(os.path.join(self.dst_folder, f'left_{idx}'), frame_l)
+                self.written += 1
+            except Exception as error:
+                self.error = error
+
+    def submit(self, idx, frame_r, frame_l):
+        if self.error is not None:
+            raise self.error
+        # frames may be reused by the data source, so queue copies
+        try:
+            self._queue.put_nowait((idx, frame_r.copy(), frame_l.copy()))
+        except queue.Full:
+            self.rejected += 1
+            return False
+        return True
+
+    def close(self):
+        # the thread drains the queue, the timeout only matters if it died anyway
+        while self._thread.is_alive():
+            try:
+                self._queue.put(None, timeout=0.1)
+                break
+            except queue.Full:
+                pass
+        self._thread.join()
+        if self.error is not None:
+            raise self.error
+
+
+class SharpnessTrigger():
+    """ Decides when to capture a calibration pair without a countdown.
+
+    Fires once the view has been steady for stable_frames frames, both eyes
+    are sharp enough (variance of the Laplacian) and the view differs from
+    the last captured one, so the board is held still in a new pose.
+    Statistics are computed on a downscaled grayscale copy to stay cheap.
+    """
+    def __init__(self, min_sharpness=100.0, max_motion=2.0, stable_frames=5,
+                 min_change=8.0, min_interval=0.5, downscale=4):
+        self.min_sharpness = min_sharpness
+        self.max_motion = max_motion # mean abs difference between consecutive frames
+        self.stable_frames = stable_frames
+        self.min_change = min_change # mean abs difference to the last captured frame
+        self.min_interval = min_interval
+        self.downscale = downscale
+
+        self.sharpness = 0.0
+        self.motion = 0.0
+        self._stable = 0
+        self._prev = None
+        self._candidate = None # view of the pair update() last proposed
+        self._last_capture = None
+        self._last_capture_time = 0.0
+
+    def _small_gray(self, frame):
+        if frame.ndim == 3:
+            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        height, width = frame.shape[:2]
+        return cv2.resize(frame, (width // self.downscale, height // self.downscale),
+                          interpolation=cv2.INTER_AREA)
+
+    @staticmethod
+    def _sharpness(small):
+        _, std = cv2.meanStdDev(cv2.Laplacian(small, cv2.CV_16S))
+        return float(std[0][0] ** 2)
+
+    def update(self, frame_r, frame_l):
+        small_r, small_l = self._small_gray(frame_r), self._small_gray(frame_l)
+        self.sharpness = min(self._sharpness(small_r), self._sharpness(small_l))
+
+        self.motion = float('inf')
+        if self._prev is not None:
+            self.motion = cv2.norm(small_r, self._prev, cv2.NORM_L1) / small_r.size
+        self._prev = small_r
+        self._stable = self._stable + 1 if self.motion <= self.max_motion else 0
+
+        if self._stable < self.stable_frames or self.sharpness < self.min_sharpness:
+            return False
+        if time.monotonic() - self._last_capture_time < self.min_interval:
+            return False
+        if self._last_capture is not None:
+            change = cv2.norm(small_r, self._last_capture, cv2.NORM_L1) / small_r.size
+            if change < self.min_change:
+                return False
+
+        self._candidate = small_r
+        return True
+
+    def confirm(self):
+        """ Records the pair update() proposed as captured, once the writer accepted it.
+
+        Until then a rejected pair does not hold back the next capture.
+        """
+        self._last_capture = self._candidate
+        self._last_capture_time = time.monotonic()
+        self._stable = 0
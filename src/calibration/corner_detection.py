@@ -0,0 +1,108 @@
+import cv2
+import hashlib
+import json
+import numpy as np
+import os
+
+from concurrent.futures import ProcessPoolExecutor
+
+CACHE_FILE = 'corner_cache.json'
+SUBPIX_CRITERIA = (cv2.TERM_CRITERIA_MAX_ITER + cv2.TERM_CRITERIA_EPS, 30, 0.01)
+
+
+def file_hash(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def load_frame(path, grayscale=False):
+    # calibration pairs are written either as .png or as raw .npy arrays
+    path = str(path)
+    if path.endswith('.npy'):
+        frame = np.load(path)
+        if grayscale and frame.ndim == 3:
+            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        return frame
+    return cv2.imread(path, cv2.IMREAD_GRAYSCALE if grayscale else cv2.IMREAD_COLOR)
+
+
+def detect_corners(path, rows, columns, downscale=1.0):
+    """ Chessboard corners of one image as an (N, 2) float32 array, None if not found.
+
+    With downscale < 1 the board is searched on a resized copy and the
+    corners are refined with cornerSubPix on the full-resolution image,
+    same window and criteria as StereoCalibrator._get_corners.
+    """
+    gray = load_frame(path, grayscale=True)
+    if gray is None:
+        return None
+
+    search = gray
+    if downscale < 1.0:
+        search = cv2.resize(gray, None, fx=downscale, fy=downscale, interpolation=cv2.INTER_AREA)
+    found, corners = cv2.findChessboardCorners(search, (rows, columns))
+    if not found:
+        return None
+
+    corners = corners / downscale if downscale < 1.0 else corners
+    corners = cv2.cornerSubPix(gray, corners.astype(np.float32), (11, 11), (-1, -1), SUBPIX_CRITERIA)
+    return corners.reshape(-1, 2)
+
+
+def _detect_job(args):
+    path, rows, columns, downscale = args
+    corners = detect_corners(path, rows, columns, downscale)
+    return path, None if corners is None else corners.tolist()
+
+
+class CornerCache():
+    """ Detected corners per image, keyed by the image's content hash.
+
+    Stored as JSON next to the calibration pairs, so re-running the
+    calibration after adding a few pairs only processes the new images.
+    Images without a board are cached too (as null).
+    """
+    def __init__(self, folder):
+        self.path = os.path.join(folder, CACHE_FILE)
+        self.entries = {}
+        if os.path.isfile(self.path):
+            with open(self.path, 'r') as f:
+                self.entries = json.load(f)
+
+    @staticmethod
+    def key(image_hash, rows, columns, downscale):
+        return f'{image_hash}:{rows}x{columns}@{downscale}'
+
+    def save(self):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.entries, f)
+        os.replace(tmp_path, self.path)
+
+
+def detect_corners_parallel(paths, rows, columns, downscale=1.0, workers=None, cache=None):
+    """ Map each image path to its corners (or None), using a process pool
+    for everything the cache does not already know. """
+    paths = [str(path) for path in paths]
+    keys = {path: CornerCache.key(file_hash(path), rows, columns, downscale) for path in paths}
+
+    missing = [path for path in paths if cache is None or keys[path] not in cache.entries]
+    detected = {}
+    if missing:
+        jobs = [(path, rows, columns, downscale) for path in missing]
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for path, corners in executor.map(_detect_job, jobs):
+                detected[path] = corners
+                if cache is not None:
+                    cache.entries[keys[path]] = corners
+        if cache is not None:
+            cache.save()
+
+    results = {}
+    for path in paths:
+        corners = detected[path] if path in detected else cache.entries[keys[path]]
+        results[path] = None if corners is None else np.array(corners, dtype=np.float32)
+    return results
@@ -5,10 +5,18 @@ import yaml
 from matplotlib import pyplot as plt
 from matplotlib.widgets import Slider, Button
 
+from src.calibration.disparity_preview import DisparityPreviewWorker
 from src.depth import get_stereo_depth_algo
 
 class DepthCalibrationUI():
-    def __init__(self, frame_r, frame_l, depth_algo_type='bm', smoothen_depth=True, config_path='src/calibration/configs'):
+    """ Sliders for the matcher params next to the resulting disparity.
+
+    Slider changes only queue a request, a DisparityPreviewWorker recomputes
+    in the background (debounced, preview first, then full resolution) and
+    a timer on the UI thread picks up its results.
+    """
+    def __init__(self, frame_r, frame_l, depth_algo_type='bm', smoothen_depth=True, config_path='src/calibration/configs',
+                 debounce=0.15, poll_interval=50):
         self.frame_r = frame_r
         self.frame_l = frame_l
         self.depth_algo_type = depth_algo_type
@@ -16,17 +24,24 @@ class DepthCalibrationUI():
 
         self.depth_algo = get_stereo_depth_algo(depth_algo_type, smoothen=smoothen_depth)
         self.loading_settings = False
+        self.worker = DisparityPreviewWorker(self.depth_algo, frame_l, frame_r, debounce=debounce)
 
         self.__init_display()
         self.__init_slider_info()
         self.__init_sliders()
         self.__slider_update()
+
+        # results are drawn from the matplotlib thread, the worker never touches the figure
+        self.timer = self.fig.canvas.new_timer(interval=poll_interval)
+        self.timer.add_callback(self.__show_result)
+        self.timer.start()
+        self.fig.canvas.mpl_connect('close_event', self.__close)
         plt.show()
 
     def __init_display(self, cmap='plasma'):
         placeholder = np.random.uniform(0, 1, (600, 800))
 
-        plt.subplots(1,2)
+        self.fig, _ = plt.subplots(1,2)
         plt.subplots_adjust(left=0.15, bottom=0.5)
 
         plt.subplot(1,2,1)
@@ -34,6 +49,11 @@ class DepthCalibrationUI():
 
         plt.subplot(1,2,2)
         self.disp_plot = plt.imshow(placeholder, cmap=cmap)
+        # fixed extent, so the coarser preview is stretched over the full-size area
+        scale = 2 ** self.depth_algo.pyramid_level
+        height, width = self.frame_l.shape[0] // scale, self.frame_l.shape[1] // scale
+        self.disp_plot.set_extent((-0.5, width - 0.5, height - 0.5, -0.5))
+        self.disp_title = plt.title('')
 
         plt.colorbar()
 
@@ -85,12 +105,21 @@ class DepthCalibrationUI():
         for key, curr_slider in self.sliders.items():
             self.curr_slider_val[key] = int(curr_slider.val)
 
-        self.depth_algo.load_params(self.curr_slider_val)
-            
         if not self.loading_settings:
-            disparity = self.depth_algo.compute_disparity(self.frame_l, self.frame_r)
-            self.disp_plot.set_data(disparity)
-            plt.draw()
+            self.worker.request(self.curr_slider_val)
+
+    def __show_result(self):
+        result = self.worker.poll()
+        if result is None:
+            return
+        stage, _key, disparity, elapsed_ms = result
+        self.disp_plot.set_data(disparity)
+        self.disp_title.set_text(f'{stage} ({elapsed_ms:.0f} ms)')
+        self.fig.canvas.draw_idle()
+
+    def __close(self, _event=None):
+        self.timer.stop()
+        self.worker.stop()
 
     def __save_slider_info(self, _event=None):
         self.buttons['save'].label.set_text("Saving...")
@@ -101,6 +130,8 @@ class DepthCalibrationUI():
         with open(self.slider_info_yaml, 'w') as f:
             yaml.dump(self.slider_info, f)
 
+        # the matchers live in the worker, only the params are needed to save them
+        self.depth_algo.matcher_params = dict(self.curr_slider_val)
         self.depth_algo.save_params()
 
         self.buttons['save'].label.set_text("Save to file")
@@ -112,6 +143,7 @@ class DepthCalibrationUI():
         with open(self.slider_info_yaml, 'r') as f:
             self.slider_info = yaml.safe_load(f)
         
+        # each set_val fires __slider_update, the flag keeps it to one request below
         for key, items in self.slider_info.items():
             self.sliders[key].set_val(items['default'])
 
@@ -0,0 +1,126 @@
+import cv2
+import threading
+import time
+
+from collections import OrderedDict
+
+from src.depth import MAX_PYRAMID_LEVEL
+
+
+class DisparityPreviewWorker():
+    """ Recomputes disparity for the calibration UI off the event thread.
+
+    request() only records the newest parameters. The worker waits until
+    they have been stable for `debounce` seconds, so dragging a slider
+    computes once instead of once per tick, and intermediate values are
+    dropped. Each request first gets a preview one pyramid level coarser
+    (at most MAX_PYRAMID_LEVEL), then the full-resolution map unless a
+    newer request came in meanwhile.
+    Results are memoized per parameter tuple (LRU), revisiting a setting
+    shows the full map right away.
+    """
+    def __init__(self, depth_algo, frame_l, frame_r, debounce=0.15, cache_size=64):
+        self.frame_l = frame_l
+        self.frame_r = frame_r
+        self.debounce = debounce
+        self.cache_size = cache_size
+        # the worker thread owns both clones, matchers are never shared across threads
+        preview_level = min(depth_algo.pyramid_level + 1, MAX_PYRAMID_LEVEL)
+        self.algos = {'preview': depth_algo._clone(pyramid_level=preview_level),
+                      'full': depth_algo._clone()}
+        self.caches = {'preview': OrderedDict(), 'full': OrderedDict()}
+
+        self.computed = 0
+        self.cache_hits = 0
+        self._request = None # (key, params, time of the request)
+        self._result = None # (stage, key, disparity, milliseconds)
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True, name='disparity-preview')
+        self._thread.start()
+
+    @staticmethod
+    def key(params):
+        return tuple(sorted(params.items()))
+
+    def request(self, params):
+        params = dict(params)
+        with self._lock:
+            self._request = (self.key(params), params, time.monotonic())
+        self._wake.set()
+
+    def poll(self):
+        """ Newest unseen result as (stage, params key, disparity, ms), or None. """
+        with self._lock:
+            result, self._result = self._result, None
+        return result
+
+    def _publish(self, stage, key, disparity, elapsed_ms):
+        with self._lock:
+            self._result = (stage, key, disparity, elapsed_ms)
+
+    def _is_current(self, key):
+        with self._lock:
+            return self._request is not None and self._request[0] == key
+
+    def _wait_until_settled(self):
+        # returns the newest request once nothing changed for `debounce` seconds,
+        # settings that are already memoized are shown without waiting
+        while not self._stop.is_set():
+            with self._lock:
+                request = self._request
+                remaining = request[2] + self.debounce - time.monotonic()
+                if remaining <= 0 or request[0] in self.caches['full']:
+                    # anything requested from here on wakes the worker again
+                    self._wake.clear()
+                    return request
+            time.sleep(remaining)
+        return None
+
+    def _compute(self, stage, key, params):
+        cache = self.caches[stage]
+        if key in cache:
+            cache.move_to_end(key)
+            self.cache_hits += 1
+            return cache[key], 0.0
+
+        start = time.perf_counter()
+        depth_algo = self.algos[stage]
+        depth_algo.load_params(params)
+        disparity = depth_algo.compute_disparity(self.frame_l, self.frame_r)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        self.computed += 1
+
+        cache[key] = disparity
+        if len(cache) > self.cache_size:
+            cache.popitem(last=False)
+        return disparity, elapsed_ms
+
+    def _run(self):
+        while not self._stop.is_set():
+            if not self._wake.wait(0.1):
+                continue
+            self._wake.clear()
+            request = self._wait_until_settled()
+            if request is None:
+                break
+            key, params, _ = request
+
+            for stage in ('preview', 'full'):
+                if stage == 'preview' and key in self.caches['full']:
+                    continue # the full map is already known
+                if not self._is_current(key):
+                    break # a newer request is waiting, this one is stale
+                try:
+                    disparity, elapsed_ms = self._compute(stage, key, params)
+                except (cv2.error, ValueError) as error:
+                    # e.g. a combination the matcher rejects, keep showing the last good map
+                    print(f'Preview failed: {error}')
+                    break
+                self._publish(stage, key, disparity, elapsed_ms)
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        self._thread.join()
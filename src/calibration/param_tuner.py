@@ -0,0 +1,220 @@
+import cv2
+import math
+import numpy as np
+import os
+import time
+import yaml
+
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from src.depth import get_stereo_depth_algo
+from src.depth.depth_map import DISP_SCALE
+from src.depth.matcher_config import WLS_KEYS
+from src.depth.postprocessing import lr_consistent
+
+SLIDER_CONFIGS = {'bm': 'src/calibration/configs/stereoBM_sliders.yaml',
+                  'sgbm': 'src/calibration/configs/stereoSGBM_sliders.yaml'}
+# weights of the quality terms, each term is within 0..1
+WEIGHTS = {'invalid': 1.0, 'lr_error': 1.0, 'roughness': 0.5}
+ROUGHNESS_CAP = 4 # pixels, larger jumps count as depth edges, not noise
+
+
+def load_search_space(slider_yaml):
+    """ {key: (min, max, valstep)} from a DepthCalibrationUI slider file, plus its defaults. """
+    with open(slider_yaml, 'r') as f:
+        slider_info = yaml.safe_load(f)
+    space = {key: (info['min'], info['max'], info['valstep']) for key, info in slider_info.items()}
+    defaults = {key: info['default'] for key, info in slider_info.items()}
+    return space, defaults
+
+
+def sample_params(space, rng):
+    params = {}
+    for key, (low, high, step) in space.items():
+        value = low + step * int(rng.integers(0, int(round((high - low) / step)) + 1))
+        # the sliders hand ints to the matchers unless the step is fractional
+        params[key] = int(value) if float(step).is_integer() else round(float(value), 6)
+    return params
+
+
+def load_pairs(source, limit=None, calibration_params='./src/data_source/calibration_params'):
+    """ Grayscale (frame_l, frame_r) pairs from a .depth recording or a folder of left_*/right_* images.
+
+    Recordings are already rectified, image folders are rectified here when
+    calibration params exist (like 03_depth_calibration.py does).
+    """
+    pairs = []
+    if str(source).endswith('.depth'):
+        from src.data_source.depth_recording import DepthRecording
+        recording = DepthRecording(source)
+        # spread the pairs over the whole recording
+        count = len(recording) if limit is None else min(limit, len(recording))
+        for idx in np.linspace(0, len(recording) - 1, count).astype(int):
+            frame_r, frame_l = recording.frames(idx)
+            pairs.append((frame_l, frame_r))
+    else:
+        calibration = None
+        for frame_r_path in sorted(Path(source).glob('right_*.png'))[:limit]:
+            frame_r = cv2.imread(str(frame_r_path))
+            frame_l = cv2.imread(str(frame_r_path).replace('right', 'left'))
+            if calibration is None and os.path.isdir(calibration_params):
+                from src.data_source.rectification import RectificationMaps
+                frame_height, frame_width = frame_r.shape[:2]
+                calibration = RectificationMaps(calibration_params, (frame_width, frame_height))
+            if calibration is not None:
+                frame_r, frame_l = calibration.rectify((frame_r, frame_l), reuse_buffers=False)
+            pairs.append((frame_l, frame_r))
+
+    if not pairs:
+        raise ValueError(f'no stereo pairs found in {source}')
+    return [tuple(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame for frame in pair)
+            for pair in pairs]
+
+
+def score_disparity(disparity, right_disparity, min_disparity):
+    """ Quality terms of one raw fixed-point disparity map, lower is better. """
+    valid = disparity > (min_disparity - 1) * DISP_SCALE
+    consistent = lr_consistent(disparity, right_disparity, threshold=1.0)
+
+    # mean horizontal and vertical jump between valid neighbours, capped at depth edges
+    pixels = disparity.astype(np.float32) / DISP_SCALE
+    jumps = np.concatenate([np.abs(np.diff(pixels, axis=0))[valid[1:] & valid[:-1]],
+                            np.abs(np.diff(pixels, axis=1))[valid[:, 1:] & valid[:, :-1]]])
+    jumps = np.minimum(jumps, ROUGHNESS_CAP)
+
+    return {'invalid': float(np.mean(~valid)),
+            'lr_error': float(np.mean(~consistent[valid])) if valid.any() else 0.0,
+            'roughness': float(jumps.mean() / ROUGHNESS_CAP) if jumps.size else 0.0}
+
+
+def evaluate_params(depth_algo, matcher_params, pairs, latency_budget_ms=None):
+    """ Cost of matcher_params on pairs, latency over budget makes a candidate infeasible.
+
+    Quality is judged on the raw left/right matcher output, latency on the
+    whole disparity step the camera pipeline runs (matchers and WLS).
+    """
+    try:
+        depth_algo.load_params(matcher_params)
+        terms, latencies = [], []
+        for frame_l, frame_r in pairs:
+            frame_l, frame_r = depth_algo._prepare_frames(frame_l, frame_r)
+            # one match per pair, scored and timed; the filter stages run on the same output
+            start = time.perf_counter()
+            disparity, right_disparity = depth_algo._match(frame_l, frame_r, depth_algo._needs_right_disparity())
+            depth_algo._finish_disparity(disparity, right_disparity, frame_l, frame_r, metric=True)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+            if right_disparity is None:
+                # the pipeline does not need it, only the score does
+                right_disparity = depth_algo.right_matcher.compute(frame_r, frame_l)
+            terms.append(score_disparity(disparity, right_disparity, matcher_params['MinDISP']))
+    except (cv2.error, ValueError) as e:
+        # combinations the schema or the matcher rejects, e.g. an even block size
+        return {'cost': math.inf, 'feasible': False, 'error': str(e).strip().splitlines()[-1]}
+
+    report = {key: float(np.mean([term[key] for term in terms])) for key in WEIGHTS}
+    report['latency_ms'] = float(np.median(latencies))
+    report['cost'] = sum(WEIGHTS[key] * report[key] for key in WEIGHTS)
+    report['feasible'] = latency_budget_ms is None or report['latency_ms'] <= latency_budget_ms
+    if not report['feasible']:
+        # ranks behind every feasible candidate, closer to the budget is better
+        report['cost'] += sum(WEIGHTS.values()) + report['latency_ms'] / latency_budget_ms
+    return report
+
+
+_worker = {}
+
+
+def _init_worker(pairs, algo_type, smoothen, pyramid_level, latency_budget_ms):
+    # pairs are sent once per process, candidates only carry their params
+    cv2.setNumThreads(1) # parallelism comes from the pool, not from OpenCV
+    _worker['pairs'] = pairs
+    _worker['latency_budget_ms'] = latency_budget_ms
+    _worker['depth_algo'] = get_stereo_depth_algo(algo_type, smoothen, pyramid_level=pyramid_level)
+
+
+def _evaluate_in_worker(matcher_params, pair_count):
+    return evaluate_params(_worker['depth_algo'], matcher_params, _worker['pairs'][:pair_count],
+                           _worker['latency_budget_ms'])
+
+
+class ParamTuner():
+    """ Successive-halving search over the DepthCalibrationUI slider ranges.
+
+    Every candidate is scored on a few pairs, the best 1/eta survive and
+    are scored again on eta times as many pairs, until one rung uses all
+    pairs. Candidates are evaluated in a process pool. Latency measured
+    next to other workers is inflated, so the finalists are timed again
+    one after another before the latency budget decides.
+
+    Quality is scored on the raw matcher output, so the WLS sliders (LMBDA,
+    SIGMA) are not searched and keep their configured values.
+    """
+    def __init__(self, pairs, algo_type='bm', smoothen=True, pyramid_level=1, latency_budget_ms=None,
+                 slider_yaml=None, candidates=27, eta=3, min_pairs=1, finalists=3, workers=None, seed=0):
+        self.pairs = pairs
+        self.algo_type = algo_type
+        self.smoothen = smoothen
+        self.pyramid_level = pyramid_level
+        self.latency_budget_ms = latency_budget_ms
+        self.candidates = candidates
+        self.eta = eta
+        self.min_pairs = min_pairs
+        self.finalists = finalists
+        self.workers = workers or os.cpu_count()
+        self.rng = np.random.default_rng(seed)
+
+        self.depth_algo = get_stereo_depth_algo(algo_type, smoothen, pyramid_level=pyramid_level)
+        space, slider_defaults = load_search_space(slider_yaml or SLIDER_CONFIGS[algo_type])
+        self.space = {key: value for key, value in space.items() if key not in WLS_KEYS}
+        self.slider_defaults = {key: value for key, value in slider_defaults.items() if key not in WLS_KEYS}
+        self.history = [] # (rung, pair count, params, report)
+
+    def _initial_candidates(self):
+        # the current config and the slider defaults compete with the random samples,
+        # keys without a slider keep their configured value
+        base = dict(self.depth_algo.get_params())
+        candidates = [base, {**base, **self.slider_defaults}]
+        while len(candidates) < self.candidates:
+            candidates.append({**base, **sample_params(self.space, self.rng)})
+        return candidates
+
+    def _rung_sizes(self):
+        sizes, pair_count = [], min(self.min_pairs, len(self.pairs))
+        while pair_count < len(self.pairs):
+            sizes.append(pair_count)
+            pair_count *= self.eta
+        return sizes + [len(self.pairs)]
+
+    def tune(self):
+        survivors = self._initial_candidates()
+        rungs = self._rung_sizes()
+        with ProcessPoolExecutor(self.workers, initializer=_init_worker,
+                                 initargs=(self.pairs, self.algo_type, self.smoothen,
+                                           self.pyramid_level, self.latency_budget_ms)) as pool:
+            for rung, pair_count in enumerate(rungs):
+                start = time.perf_counter()
+                reports = list(pool.map(_evaluate_in_worker, survivors, [pair_count] * len(survivors)))
+                ranked = sorted(zip(survivors, reports), key=lambda item: item[1]['cost'])
+                self.history += [(rung, pair_count, params, report) for params, report in ranked]
+                print(f'rung {rung}: {len(survivors)} candidates on {pair_count} pairs, '
+                      f'best cost {ranked[0][1]["cost"]:.4f} ({time.perf_counter() - start:.1f}s)')
+
+                keep = self.finalists if rung == len(rungs) - 1 else max(self.finalists, math.ceil(len(ranked) / self.eta))
+                survivors = [params for params, report in ranked[:keep] if math.isfinite(report['cost'])]
+                if not survivors:
+                    raise RuntimeError('no candidate could be evaluated')
+
+        # serial timing without pool contention decides the latency constraint
+        finals = sorted(((params, evaluate_params(self.depth_algo, params, self.pairs, self.latency_budget_ms))
+                         for params in survivors), key=lambda item: item[1]['cost'])
+        return finals[0]
+
+    def save(self, matcher_params, config_path=None):
+        """ Writes matcher_params through AbstractDisparity.save_params, to the algorithm's config by default. """
+        if config_path is not None:
+            self.depth_algo.config_path = config_path
+        self.depth_algo.load_params(dict(matcher_params))
+        self.depth_algo.save_params()
+        return self.depth_algo.config_path
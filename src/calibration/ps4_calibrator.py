@@ -1,13 +1,14 @@
 import cv2
 import numpy as np
-import os
 import time
 
 from pathlib import Path
-from stereovision.calibration import StereoCalibrator, StereoCalibration
-from stereovision.exceptions import ChessboardNotFoundError
 
+from src.calibration.capture_writer import AsyncPairWriter, SharpnessTrigger
+from src.calibration.corner_detection import CornerCache, detect_corners_parallel, load_frame
+from src.calibration.stereo_solver import StereoSolver
 from src.data_source.ps4_data_source import PS4DataSource
+from src.data_source.rectification import RectificationMaps
 
 """ ! IMPORTANT !
 
@@ -26,54 +27,63 @@ class PS4Calibratior():
 
         self.data_source = PS4DataSource(self.camera_index, calibrate_camera=False) # Create capture source
 
-    def capture_data(self, dst_folder='./data/calibration/pairs'):
-        os.makedirs(dst_folder, exist_ok=True)
+    def capture_data(self, dst_folder='./data/calibration/pairs', trigger='sharpness', encoding='png'):
+        # pairs are encoded and written on a background thread, the stream never blocks on disk
+        writer = AsyncPairWriter(dst_folder, encoding=encoding)
+        sharpness_trigger = SharpnessTrigger() if trigger == 'sharpness' else None
 
-        # Record start time
-        start = time.time()
-        for frame_r, frame_l in self.data_source.stream():
-            if frame_r is None or frame_l is None:
-                break
-
-            # How much time has passed from start
-            cntdwn_timer = int(time.time() - start)
-
-            # If cowntdown is zero - let's record next image
-            if cntdwn_timer >= self.cnt_interval:            
-                self.counter += 1
-
-                # Save the frames
-                frame_name = f'{dst_folder}/right_{self.counter}.png'
-                cv2.imwrite(frame_name, frame_r)
-                
-                frame_name = f'{dst_folder}/left_{self.counter}.png'
-                cv2.imwrite(frame_name, frame_l)
-
-                # Display text and wait for person to asimilate
-                print (f'Frame captured [{self.counter} of {self.total_photos}] ')
-                time.sleep(1)
+        try:
+            # Record start time
+            start = time.time()
+            for frame_r, frame_l in self.data_source.stream():
+                if frame_r is None or frame_l is None:
+                    break
 
-                # Record new start time
-                start = time.time()
+                # How much time has passed from start
+                cntdwn_timer = int(time.time() - start)
 
-            # Stop recording if all images were recorded
-            if self.counter >= self.total_photos:
-                break
+                if sharpness_trigger is not None:
+                    # capture as soon as the board is held still, sharp and in a new pose
+                    capture = sharpness_trigger.update(frame_r, frame_l)
+                else:
+                    # If cowntdown is zero - let's record next image
+                    capture = cntdwn_timer >= self.cnt_interval
 
-            # Resize images to fit on the screen
-            frame_r = cv2.resize(frame_r, (640, 480))
-            frame_l = cv2.resize(frame_l, (640, 480))
+                if capture and writer.submit(self.counter + 1, frame_r, frame_l):
+                    if sharpness_trigger is not None:
+                        sharpness_trigger.confirm()
+                    self.counter += 1
+                    print (f'Frame captured [{self.counter} of {self.total_photos}] ')
 
-            # Draw cowntdown counter, seconds
-            cv2.putText(frame_r, str(cntdwn_timer), (50,50), self.display_font, 2.0, (0,0,255),4, cv2.LINE_AA)
-            cv2.imshow("Frame Right", np.concatenate([frame_r, frame_l], axis=1))
-            key = cv2.waitKey(1) & 0xFF
+                    # Record new start time
+                    start = time.time()
 
-            # Press 'Q' key to quit, or wait till all photos are taken
-            if cv2.waitKey(1) == ord('q'):
+                # Stop recording if all images were recorded
+                if self.counter >= self.total_photos:
                     break
 
-        self.data_source.close_stream()
+                # Resize images to fit on the screen
+                frame_r = cv2.resize(frame_r, (640, 480))
+                frame_l = cv2.resize(frame_l, (640, 480))
+
+                # Draw cowntdown counter (seconds) or the sharpness score
+                if sharpness_trigger is not None:
+                    status = f'{self.counter}/{self.total_photos} sharpness {sharpness_trigger.sharpness:.0f}'
+                    cv2.putText(frame_r, status, (20,40), self.display_font, 1.0, (0,0,255),2, cv2.LINE_AA)
+                else:
+                    cv2.putText(frame_r, str(cntdwn_timer), (50,50), self.display_font, 2.0, (0,0,255),4, cv2.LINE_AA)
+                cv2.imshow("Frame Right", np.concatenate([frame_r, frame_l], axis=1))
+
+                # Press 'Q' key to quit, or wait till all photos are taken
+                if cv2.waitKey(1) & 0xFF == ord('q'):
+                        break
+        finally:
+            # flushes the last batch and stops the writer thread even if the capture failed,
+            # a write error is raised after the stream is released
+            try:
+                writer.close()
+            finally:
+                self.data_source.close_stream()
 
     def _draw_line(self, img, start, end, color=(0, 0, 255)):
         cv2.line(img, start, end, color, 2, 8)
@@ -89,38 +99,66 @@ class PS4Calibratior():
         return result
 
     def calculate_calibration_params(self, frame_path='./data/calibration/pairs', 
-            calib_rows=6, calib_columns=9, calib_square_size=2.5):
+            calib_rows=6, calib_columns=9, calib_square_size=2.5,
+            downscale=1.0, workers=None, show_corners=False,
+            output_folder=None, warm_start=True):
 
+        # by default the folder PS4DataSource loads, a running stream with hot reload picks it up
+        output_folder = output_folder or self.data_source.calibration_params
         frame_width, frame_height = self.data_source.get_frame_shape()
-        calibrator = StereoCalibrator(calib_rows, calib_columns, calib_square_size, (frame_width, frame_height))
-
-        for frame_r_path in Path(frame_path).glob('right_*.png'):
-            frame_idx = frame_r_path.stem.split('_')[-1]
-
+        # an existing export seeds the solve, so adding pairs doesn't start from scratch
+        solver = StereoSolver(calib_rows, calib_columns, calib_square_size, (frame_width, frame_height),
+                              warm_start=output_folder if warm_start else None)
+
+        pairs = []
+        for frame_r_path in sorted(Path(frame_path).glob('right_*')):
+            if frame_r_path.suffix not in ('.png', '.npy'):
+                continue
             frame_r_path = str(frame_r_path)
-            frame_l_path = frame_r_path.replace('right', 'left')
+            pairs.append((frame_r_path, frame_r_path.replace('right', 'left')))
 
-            frame_r = cv2.imread(frame_r_path,1)
-            frame_l = cv2.imread(frame_l_path,1)
+        # every image is searched once, in parallel, and remembered by content hash
+        corner_cache = CornerCache(frame_path)
+        corners = detect_corners_parallel([path for pair in pairs for path in pair],
+                                          calib_rows, calib_columns, downscale, workers, corner_cache)
 
-            try:
-                calibrator._get_corners(frame_r)
-                calibrator._get_corners(frame_l)
-            except ChessboardNotFoundError as error:
-                print (error)
+        last_pair = None
+        for frame_r_path, frame_l_path in pairs:
+            frame_idx = Path(frame_r_path).stem.split('_')[-1]
+            corners_r, corners_l = corners[frame_r_path], corners[frame_l_path]
+
+            if corners_r is None or corners_l is None:
+                print ("No chessboard could be found.")
                 print ("Pair No "+ str(frame_idx) + " ignored")
-            else:
-                calibrator.add_corners((frame_r, frame_l), True)
+                continue
+
+            # the right frame is the stereovision "left" side
+            solver.add_pair(frame_r_path, corners_r, corners_l)
+            last_pair = (frame_r_path, frame_l_path)
+
+            if show_corners:
+                for path, found in ((frame_r_path, corners_r), (frame_l_path, corners_l)):
+                    frame = load_frame(path)
+                    cv2.drawChessboardCorners(frame, (calib_rows, calib_columns), found.reshape(-1, 1, 2), True)
+                    cv2.imshow('Chessboard', frame)
+                    cv2.waitKey(0)
+
+        if last_pair is None:
+            print ('No usable calibration pairs found in ' + frame_path)
+            return
+
+        frame_r = load_frame(last_pair[0])
+        frame_l = load_frame(last_pair[1])
 
         print ('End cycle')
 
-        print ('Starting calibration... It can take several minutes!')
-        calibration = calibrator.calibrate_cameras()
-        calibration.export('calibration_params')
-        print ('Calibration complete!')
+        print ('Starting calibration...')
+        solution = solver.solve()
+        solver.export(solution, output_folder)
+        print (f'Calibration complete! rms {solver.rms:.3f}px, {len(solver.pruned)} pairs pruned')
 
         # Lets rectify and show last pair after  calibration
-        calibration = StereoCalibration(input_folder='calibration_params')
+        calibration = RectificationMaps(output_folder, (frame_width, frame_height))
         rectified_pair = calibration.rectify((frame_r, frame_l))
 
         result = self._display_calibration_lines([frame_r, frame_l])
@@ -0,0 +1,222 @@
+import cv2
+import hashlib
+import json
+import numpy as np
+import os
+import shutil
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+MANIFEST_FILE = 'calibration_manifest.json'
+SIDES = ('left', 'right')
+
+CRITERIA = (cv2.TERM_CRITERIA_MAX_ITER + cv2.TERM_CRITERIA_EPS, 100, 1e-5)
+# same model as StereoCalibrator.calibrate_cameras, solved per camera first;
+# a shared focal length ties both cameras, so only the joint stage can apply it
+INTRINSIC_FLAGS = cv2.CALIB_FIX_ASPECT_RATIO + cv2.CALIB_ZERO_TANGENT_DIST
+STEREO_FLAGS = INTRINSIC_FLAGS + cv2.CALIB_SAME_FOCAL_LENGTH + cv2.CALIB_USE_INTRINSIC_GUESS
+
+
+def corners_hash(*corners):
+    """ Content key of a pair, a recaptured image gives other corners. """
+    digest = hashlib.sha1()
+    for points in corners:
+        digest.update(np.ascontiguousarray(points, np.float32).tobytes())
+    return digest.hexdigest()
+
+
+def load_calibration(folder):
+    """ Intrinsics and extrinsics of a stereovision export, None if incomplete. """
+    params = {}
+    names = [f'{name}_{side}' for name in ('cam_mats', 'dist_coefs') for side in SIDES]
+    for name in names + ['rot_mat', 'trans_vec']:
+        path = os.path.join(folder, f'{name}.npy')
+        if not os.path.isfile(path):
+            return None
+        params[name] = np.load(path)
+    return params
+
+
+class StereoSolver():
+    """ Stereo calibration in stages instead of one opaque stereoCalibrate call.
+
+    1. intrinsics of both cameras, solved in parallel (OpenCV drops the GIL)
+    2. extrinsics, refining both intrinsics from stage 1 with one shared
+       focal length like StereoCalibrator
+    3. pairs whose reprojection error is an outlier are pruned and both
+       stages re-run, starting from the previous solution
+
+    When warm_start points at an existing export, its intrinsics and
+    extrinsics seed the first round, so adding a few pairs converges in a
+    handful of iterations. Sides follow stereovision: 'left' is the first
+    frame of the pair handed to rectify.
+    """
+    def __init__(self, rows, columns, square_size, image_size, warm_start=None,
+                 max_pair_error=1.0, outlier_factor=3.0, max_rounds=5, min_pairs=5):
+        self.image_size = tuple(image_size) # (width, height)
+        self.max_pair_error = max_pair_error # pixels, pairs below this are never pruned
+        self.outlier_factor = outlier_factor # ... pairs above factor * median always are
+        self.max_rounds = max_rounds
+        self.min_pairs = min_pairs
+
+        pattern_size = (rows, columns)
+        corner_coordinates = np.zeros((np.prod(pattern_size), 3), np.float32)
+        corner_coordinates[:, :2] = np.indices(pattern_size).T.reshape(-1, 2)
+        self.corner_coordinates = corner_coordinates * square_size
+
+        self.keys = []
+        self.image_points = {side: [] for side in SIDES}
+        self.pruned = {} # key -> reprojection error when it was dropped
+        self.pair_hashes = {} # key -> corners_hash of the pair
+        self.pair_errors = {}
+        self._previously_pruned = {} # key -> {'error', 'hash'} from the warm start manifest
+        self.rms = None
+
+        self.guess = load_calibration(warm_start) if warm_start else None
+        if self.guess is not None:
+            print(f'Warm start from {warm_start}')
+            # pairs pruned by the previous solve stay pruned while their content is unchanged
+            manifest_path = os.path.join(warm_start, MANIFEST_FILE)
+            if os.path.isfile(manifest_path):
+                with open(manifest_path, 'r') as f:
+                    self._previously_pruned = json.load(f).get('pruned', {})
+
+    def add_pair(self, key, corners_left, corners_right):
+        pair_hash = corners_hash(corners_left, corners_right)
+        previous = self._previously_pruned.get(key)
+        # entries without a hash come from older manifests, their pair may have been recaptured
+        if isinstance(previous, dict) and previous.get('hash') == pair_hash:
+            self.pruned[key] = previous['error']
+        self.pair_hashes[key] = pair_hash
+        self.keys.append(key)
+        self.image_points['left'].append(np.asarray(corners_left, np.float32).reshape(-1, 1, 2))
+        self.image_points['right'].append(np.asarray(corners_right, np.float32).reshape(-1, 1, 2))
+
+    def _active(self):
+        return [i for i, key in enumerate(self.keys) if key not in self.pruned]
+
+    def _object_points(self, count):
+        return [self.corner_coordinates] * count
+
+    def _solve_intrinsics(self, side, active, guess):
+        points = [self.image_points[side][i] for i in active]
+        flags = INTRINSIC_FLAGS
+        if guess is not None:
+            cam_mat, dist_coefs = guess[f'cam_mats_{side}'].copy(), guess[f'dist_coefs_{side}'].copy()
+            flags += cv2.CALIB_USE_INTRINSIC_GUESS
+        else:
+            # without a guess only the fx/fy ratio of the input matrix is used
+            cam_mat, dist_coefs = np.eye(3), np.zeros(5)
+        rms, cam_mat, dist_coefs = cv2.calibrateCamera(
+            self._object_points(len(points)), points, self.image_size,
+            cam_mat, dist_coefs, flags=flags, criteria=CRITERIA)[:3]
+        return rms, cam_mat, dist_coefs
+
+    def _solve_stereo(self, active, intrinsics, guess):
+        # updates intrinsics in place with the jointly refined ones
+        flags = STEREO_FLAGS
+        rot_mat, trans_vec = None, None
+        if guess is not None:
+            rot_mat, trans_vec = guess['rot_mat'].copy(), guess['trans_vec'].copy()
+            flags += cv2.CALIB_USE_EXTRINSIC_GUESS
+
+        (rms, intrinsics['cam_mats_left'], intrinsics['dist_coefs_left'],
+         intrinsics['cam_mats_right'], intrinsics['dist_coefs_right'],
+         rot_mat, trans_vec, e_mat, f_mat, _, _, errors) = cv2.stereoCalibrateExtended(
+            self._object_points(len(active)),
+            [self.image_points['left'][i] for i in active],
+            [self.image_points['right'][i] for i in active],
+            intrinsics['cam_mats_left'], intrinsics['dist_coefs_left'],
+            intrinsics['cam_mats_right'], intrinsics['dist_coefs_right'],
+            self.image_size, rot_mat, trans_vec, criteria=CRITERIA, flags=flags)
+        return rms, rot_mat, trans_vec, e_mat, f_mat, errors.max(axis=1)
+
+    def _solve_round(self, active, guess, executor):
+        start = time.perf_counter()
+        futures = {side: executor.submit(self._solve_intrinsics, side, active, guess) for side in SIDES}
+        solution = {}
+        for side, future in futures.items():
+            rms, solution[f'cam_mats_{side}'], solution[f'dist_coefs_{side}'] = future.result()
+            print(f'  {side} intrinsics rms {rms:.3f}px')
+
+        rms, rot_mat, trans_vec, e_mat, f_mat, errors = self._solve_stereo(active, solution, guess)
+        solution.update(rot_mat=rot_mat, trans_vec=trans_vec, e_mat=e_mat, f_mat=f_mat)
+        print(f'  stereo rms {rms:.3f}px over {len(active)} pairs ({time.perf_counter() - start:.1f}s)')
+        return rms, solution, errors
+
+    def _outliers(self, active, errors):
+        limit = max(self.max_pair_error, self.outlier_factor * float(np.median(errors)))
+        order = np.argsort(errors)[::-1]
+        # never prune below min_pairs, worst pairs go first
+        budget = len(active) - self.min_pairs
+        return [(active[i], float(errors[i])) for i in order[:max(budget, 0)] if errors[i] > limit]
+
+    def solve(self):
+        """ Runs the staged solve, returns the parameters as a dict of arrays. """
+        if len(self._active()) < self.min_pairs:
+            raise ValueError(f'Need at least {self.min_pairs} pairs, got {len(self._active())}')
+
+        guess = self.guess
+        with ThreadPoolExecutor(max_workers=len(SIDES)) as executor:
+            for round_idx in range(self.max_rounds):
+                active = self._active()
+                print(f'Calibration round {round_idx + 1}')
+                self.rms, solution, errors = self._solve_round(active, guess, executor)
+                self.pair_errors = {self.keys[i]: float(error) for i, error in zip(active, errors)}
+
+                outliers = self._outliers(active, errors)
+                if not outliers or round_idx == self.max_rounds - 1:
+                    break
+                for i, error in outliers:
+                    print(f'  pruned {self.keys[i]} ({error:.2f}px)')
+                    self.pruned[self.keys[i]] = error
+                # the next round starts from this solution instead of from scratch
+                guess = solution
+
+        solution.update(self._rectify(solution))
+        return solution
+
+    def _rectify(self, solution):
+        rectified = {}
+        (rectified['rect_trans_left'], rectified['rect_trans_right'],
+         rectified['proj_mats_left'], rectified['proj_mats_right'],
+         rectified['disp_to_depth_mat'], rectified['valid_boxes_left'], rectified['valid_boxes_right']) = cv2.stereoRectify(
+            solution['cam_mats_left'], solution['dist_coefs_left'],
+            solution['cam_mats_right'], solution['dist_coefs_right'],
+            self.image_size, solution['rot_mat'], solution['trans_vec'], flags=0)
+
+        for side in SIDES:
+            (rectified[f'undistortion_map_{side}'], rectified[f'rectification_map_{side}']) = cv2.initUndistortRectifyMap(
+                solution[f'cam_mats_{side}'], solution[f'dist_coefs_{side}'],
+                rectified[f'rect_trans_{side}'], rectified[f'proj_mats_{side}'],
+                self.image_size, cv2.CV_32FC1)
+        return rectified
+
+    def export(self, solution, output_folder):
+        """ Writes the stereovision file layout, then the manifest.
+
+        Every file is written into a staging folder and renamed into place,
+        the manifest goes last and marks the export as complete: the hot
+        reloader of a running PS4DataSource only reacts to the manifest, so
+        it never loads a mix of old and new files.
+        """
+        os.makedirs(output_folder, exist_ok=True)
+        staging = output_folder.rstrip('/\\') + '.tmp'
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(staging)
+
+        for name, value in solution.items():
+            np.save(os.path.join(staging, f'{name}.npy'), value)
+        manifest = {'created': time.time(),
+                    'image_size': list(self.image_size),
+                    'rms': self.rms,
+                    'pairs': self.pair_errors,
+                    'pruned': {key: {'error': error, 'hash': self.pair_hashes[key]}
+                               for key, error in self.pruned.items()}}
+        with open(os.path.join(staging, MANIFEST_FILE), 'w') as f:
+            json.dump(manifest, f, indent=2)
+
+        for name in sorted(os.listdir(staging), key=lambda name: name == MANIFEST_FILE):
+            os.replace(os.path.join(staging, name), os.path.join(output_folder, name))
+        os.rmdir(staging)
@@ -0,0 +1,225 @@
+import asyncio
+
+from concurrent.futures import ThreadPoolExecutor
+
+SKIP_POLICIES = ('oldest', 'newest', 'block')
+
+_END = object() # pushed to every subscription when the stream ends
+
+
+class _StreamError():
+    def __init__(self, error):
+        self.error = error
+
+
+class Subscription():
+    """ One consumer of an AsyncStreamHub, an async iterator of (frame_r, frame_l, disparity).
+
+    Only every `every`-th frame of the shared stream is offered to it. When
+    its queue of `maxsize` items is full, skip='oldest' drops the oldest
+    queued frame (always the freshest frame, like StageQueue), 'newest'
+    drops the incoming one and 'block' makes the hub wait, which slows the
+    capture down for every subscriber.
+    """
+    def __init__(self, hub, maxsize=1, skip='oldest', every=1):
+        if skip not in SKIP_POLICIES:
+            raise ValueError(f'Unknown skip policy {skip}, expected one of {SKIP_POLICIES}')
+        if maxsize < 1 or every < 1:
+            raise ValueError('maxsize and every must be at least 1')
+        self.hub = hub
+        self.maxsize = maxsize
+        self.skip = skip
+        self.every = every
+
+        self.delivered = 0
+        self.dropped = 0
+        self._queue = asyncio.Queue(maxsize)
+        self._ended = False
+        self._blocked_put = None # the hub waiting for room, cancelled by close()
+
+    async def _offer(self, frame_idx, item):
+        if self._ended or frame_idx % self.every:
+            return
+        if not self._queue.full():
+            self._queue.put_nowait(item)
+        elif self.skip == 'oldest':
+            self._queue.get_nowait()
+            self._queue.put_nowait(item)
+            self.dropped += 1
+        elif self.skip == 'newest':
+            self.dropped += 1
+        else:
+            await self._put_blocking(item)
+
+    async def _put_blocking(self, item):
+        self._blocked_put = asyncio.ensure_future(self._queue.put(item))
+        try:
+            await self._blocked_put
+        except asyncio.CancelledError:
+            if not self._ended:
+                raise # the hub itself is being cancelled
+        finally:
+            self._blocked_put = None
+
+    async def _finish(self):
+        # end of stream, a lossless subscriber gets its queued frames before the end marker
+        if self.skip == 'block' and not self._ended:
+            await self._put_blocking(_END)
+            self._ended = True
+
+    def _end(self, marker=_END):
+        # the end marker always fits, it replaces the oldest frame if needed
+        if self._ended:
+            return
+        self._ended = True
+        if self._queue.full():
+            self._queue.get_nowait()
+            self.dropped += 1
+        self._queue.put_nowait(marker)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        item = await self._queue.get()
+        if item is _END:
+            self._queue.put_nowait(_END) # stay ended for repeated calls
+            raise StopAsyncIteration
+        if isinstance(item, _StreamError):
+            raise item.error
+        self.delivered += 1
+        return item
+
+    def close(self):
+        # frees a blocked hub, frames still queued are discarded
+        self.hub._unsubscribe(self)
+        self._ended = True
+        if self._blocked_put is not None:
+            self._blocked_put.cancel()
+        while not self._queue.empty():
+            self._queue.get_nowait()
+        self._queue.put_nowait(_END)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+    def get_stats(self):
+        return {'delivered': self.delivered, 'dropped': self.dropped,
+                'queued': self._queue.qsize(), 'skip': self.skip, 'every': self.every}
+
+
+class AsyncStreamHub():
+    """ Shares one PS4DataSource capture between asyncio subscribers.
+
+    A producer task reads frames on a dedicated capture thread (the capture
+    object is only ever used from that thread) and rectifies them and
+    computes disparity on a processing executor, while the next read is
+    already running. Frames are not taken from the buffer pool, they are
+    shared by all subscribers and outlive the read.
+
+    aclose() cancels the producer, ends every subscription and releases the
+    capture through close_stream(), queued behind any read still in flight.
+    """
+    def __init__(self, data_source, depth_algo=None, grayscale=False, executor=None, release_capture=True):
+        self.data_source = data_source
+        self.depth_algo = depth_algo
+        self.grayscale = grayscale
+        self.release_capture = release_capture
+        self.tracer = data_source.tracer
+
+        self.frames = 0
+        self.subscriptions = []
+        self._capture_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='ps4-async-capture')
+        # one thread by default, matchers must not run concurrently
+        self._own_executor = executor is None
+        self._executor = executor or ThreadPoolExecutor(max_workers=1, thread_name_prefix='ps4-async-process')
+        self._producer = None
+        self._closed = False
+
+    def subscribe(self, maxsize=1, skip='oldest', every=1):
+        if self._closed:
+            raise RuntimeError('AsyncStreamHub is closed')
+        subscription = Subscription(self, maxsize, skip, every)
+        self.subscriptions.append(subscription)
+        self.start()
+        return subscription
+
+    def _unsubscribe(self, subscription):
+        if subscription in self.subscriptions:
+            self.subscriptions.remove(subscription)
+
+    def start(self):
+        # needs a running event loop, subscribe() calls it
+        if self._producer is None and not self._closed:
+            self._producer = asyncio.get_running_loop().create_task(self._produce())
+        return self
+
+    def _read(self):
+        with self.tracer.span('capture'):
+            return self.data_source._read_frame(reuse_buffers=False)
+
+    def _process(self, frame):
+        with self.tracer.span('rectify'):
+            frame_r, frame_l = self.data_source._process_frame(frame, self.grayscale, reuse_buffers=False)
+        disparity = None
+        if self.depth_algo is not None:
+            with self.tracer.span('disparity'):
+                disparity = self.depth_algo.compute_disparity(frame_l, frame_r)
+        self.tracer.count('frames')
+        return frame_r, frame_l, disparity
+
+    async def _produce(self):
+        loop = asyncio.get_running_loop()
+        end = _END
+        try:
+            next_frame = loop.run_in_executor(self._capture_executor, self._read)
+            while True:
+                frame = await next_frame
+                if frame is None:
+                    break
+                # capture the next frame while this one is processed
+                next_frame = loop.run_in_executor(self._capture_executor, self._read)
+                item = await loop.run_in_executor(self._executor, self._process, frame)
+                for subscription in list(self.subscriptions):
+                    await subscription._offer(self.frames, item)
+                self.frames += 1
+        except Exception as error:
+            end = _StreamError(error)
+        else:
+            for subscription in list(self.subscriptions):
+                await subscription._finish()
+        finally:
+            for subscription in list(self.subscriptions):
+                subscription._end(end)
+
+    async def aclose(self):
+        if self._closed:
+            return
+        self._closed = True
+        if self._producer is not None:
+            self._producer.cancel()
+            try:
+                await self._producer
+            except asyncio.CancelledError:
+                pass
+
+        loop = asyncio.get_running_loop()
+        if self.release_capture:
+            with self.tracer.span('release'):
+                await loop.run_in_executor(self._capture_executor, self.data_source.close_stream)
+        # let processing still in flight finish before its executor goes away
+        executors = [self._capture_executor] + ([self._executor] if self._own_executor else [])
+        await loop.run_in_executor(None, lambda: [executor.shutdown(wait=True) for executor in executors])
+
+    async def __aenter__(self):
+        return self.start()
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    def get_stats(self):
+        return {'frames': self.frames,
+                'subscribers': [subscription.get_stats() for subscription in self.subscriptions]}
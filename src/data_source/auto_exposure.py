@@ -0,0 +1,155 @@
+import cv2
+import numpy as np
+import threading
+import time
+
+
+def luminance_stats(frame, step=8, bins=32):
+    """ Mean luminance (0..255), clipped fraction and histogram of every step-th pixel.
+
+    The green channel stands in for luminance, it carries most of it and
+    needs no colour conversion.
+    """
+    sample = frame[::step, ::step]
+    if sample.ndim == 3:
+        sample = sample[..., 1]
+    sample = np.ascontiguousarray(sample)
+    hist = cv2.calcHist([sample], [0], None, [bins], [0, 256]).ravel()
+    hist /= max(hist.sum(), 1)
+    centers = (np.arange(bins) + 0.5) * (256 / bins)
+    return float(hist @ centers), float(hist[-1]), hist
+
+
+class AutoExposureController():
+    """ Drives CAP_PROP_EXPOSURE and CAP_PROP_GAIN towards a target brightness.
+
+    The capture loop hands every frame to submit(), which only keeps a
+    subsampled copy; metering runs on a background thread. New settings are
+    queued and written by apply(), called from the capture loop between two
+    reads, so the capture object is never touched from two threads.
+
+    Exposure is in the driver's log2 seconds units (as on Windows), so a
+    brightness ratio r maps to an exposure step of log2(r). Exposure moves
+    first and gain only takes over at the exposure limits, which keeps noise
+    low. Adjustments start once the error leaves deadband and stop once it is
+    inside deadband / 2 (hysteresis), each step is capped and steps are at
+    least min_interval apart with settle_frames frames between them.
+    """
+    def __init__(self, target=110.0, deadband=12.0, max_exposure_step=0.5, max_gain_step=2.0,
+                 exposure_range=(-10.0, -2.0), gain_range=(0.0, 63.0),
+                 min_interval=0.2, settle_frames=3, sample_step=8):
+        self.target = target
+        self.deadband = deadband
+        self.max_exposure_step = max_exposure_step
+        self.max_gain_step = max_gain_step
+        self.exposure_range = exposure_range
+        self.gain_range = gain_range
+        self.min_interval = min_interval
+        self.settle_frames = settle_frames
+        self.sample_step = sample_step
+
+        self.exposure = None # current settings, read from the capture on the first apply
+        self.gain = None
+        self.luminance = None
+        self.adjusting = False
+        self.adjustments = 0
+
+        self._pending = None
+        self._sample = None
+        self._frames_since_change = 0
+        self._last_change = 0.0
+        self._lock = threading.Lock()
+        self._new_sample = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True, name='auto-exposure')
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def submit(self, frame):
+        # called from the capture loop; drops the previous sample if not metered yet
+        sample = np.ascontiguousarray(frame[::self.sample_step, ::self.sample_step])
+        with self._lock:
+            self._sample = sample
+            self._frames_since_change += 1
+        self._new_sample.set()
+
+    def apply(self, cap):
+        """ Writes queued settings to cap, call between reads on the capture thread. """
+        if self.exposure is None:
+            self.exposure = cap.get(cv2.CAP_PROP_EXPOSURE)
+            self.gain = cap.get(cv2.CAP_PROP_GAIN)
+        with self._lock:
+            pending, self._pending = self._pending, None
+        if pending is None:
+            return False
+        exposure, gain = pending
+        if exposure != self.exposure:
+            cap.set(cv2.CAP_PROP_EXPOSURE, exposure)
+        if gain != self.gain:
+            cap.set(cv2.CAP_PROP_GAIN, gain)
+        self.exposure, self.gain = exposure, gain
+        return True
+
+    def _run(self):
+        while not self._stop.is_set():
+            if not self._new_sample.wait(0.1):
+                continue
+            self._new_sample.clear()
+            with self._lock:
+                sample, self._sample = self._sample, None
+                frames_since_change = self._frames_since_change
+            if sample is None or self.exposure is None:
+                continue
+            # already subsampled, meter every pixel of the sample
+            self.luminance, _, _ = luminance_stats(sample, step=1)
+            if frames_since_change >= self.settle_frames:
+                self._update(self.luminance)
+
+    def _update(self, luminance):
+        error = self.target - luminance
+        # hysteresis: start outside the deadband, keep going until well inside it
+        if abs(error) > self.deadband:
+            self.adjusting = True
+        elif abs(error) < self.deadband / 2:
+            self.adjusting = False
+        if not self.adjusting or time.monotonic() - self._last_change < self.min_interval:
+            return
+
+        exposure, gain = self._next_settings(luminance)
+        if (exposure, gain) == (self.exposure, self.gain):
+            return # pinned at the limits
+        with self._lock:
+            self._pending = (exposure, gain)
+            self._frames_since_change = 0
+        self._last_change = time.monotonic()
+        self.adjustments += 1
+
+    def _next_settings(self, luminance):
+        ratio = self.target / max(luminance, 1.0)
+        exposure_step = float(np.clip(np.log2(ratio), -self.max_exposure_step, self.max_exposure_step))
+        low, high = self.exposure_range
+        exposure, gain = self.exposure, self.gain
+
+        if ratio < 1 and gain > self.gain_range[0]:
+            # too bright: drop the gain before shortening the exposure
+            gain = max(self.gain_range[0], gain - self.max_gain_step)
+        elif ratio > 1 and exposure >= high:
+            # too dark at the longest exposure: only gain can help
+            gain = min(self.gain_range[1], gain + self.max_gain_step)
+        else:
+            exposure = float(np.clip(exposure + exposure_step, low, high))
+        return exposure, gain
+
+    def get_stats(self):
+        return {'luminance': self.luminance,
+                'exposure': self.exposure,
+                'gain': self.gain,
+                'adjusting': self.adjusting,
+                'adjustments': self.adjustments}
+
+    def stop(self):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
@@ -0,0 +1,182 @@
+import cv2
+import json
+import numpy as np
+import os
+import time
+
+from src.depth.depth_map import DISP_SCALE
+
+MAGIC = b'PS4DEPTH'
+ALIGNMENT = 64 # every array starts on a 64 byte boundary, so views are aligned
+DISPARITY_DTYPES = (np.int16, np.float16)
+FRAME_ENCODINGS = ('raw', 'png')
+
+# one fixed-size entry per record, the .idx file is a flat array of these
+INDEX_DTYPE = np.dtype([('timestamp', '<f8'),
+                        ('frame_r_offset', '<u8'), ('frame_r_length', '<u8'),
+                        ('frame_l_offset', '<u8'), ('frame_l_length', '<u8'),
+                        ('disparity_offset', '<u8'), ('disparity_length', '<u8')])
+
+
+def _index_path(path):
+    return os.path.splitext(path)[0] + '.idx'
+
+
+def _padding(offset):
+    return -offset % ALIGNMENT
+
+
+class DepthRecorder():
+    """ Appends rectified frames and their disparity to a recording.
+
+    Layout: <name>.depth starts with a header (magic, length, JSON) and then
+    holds the arrays of every record back to back, <name>.idx one INDEX_DTYPE
+    entry per record. An index entry is only written once its data is on
+    disk, so a recording cut short by a crash is still readable.
+
+    Disparity is stored as int16 fixed point (value * disparity_scale, the
+    matchers' raw int16 output is kept as is) or float16. Frames are stored
+    raw, which the reader maps without copying, or as lossless PNG.
+    """
+    def __init__(self, path, disparity_dtype=np.int16, disparity_scale=DISP_SCALE, frame_encoding='raw'):
+        if disparity_dtype not in DISPARITY_DTYPES:
+            raise ValueError(f'Unsupported disparity dtype {disparity_dtype}, expected one of {DISPARITY_DTYPES}')
+        if frame_encoding not in FRAME_ENCODINGS:
+            raise ValueError(f'Unknown frame encoding {frame_encoding}, expected one of {FRAME_ENCODINGS}')
+        self.path = path
+        self.disparity_dtype = np.dtype(disparity_dtype)
+        self.disparity_scale = disparity_scale
+        self.frame_encoding = frame_encoding
+
+        self.count = 0
+        self.header = None
+        self._data = open(path, 'wb')
+        self._index = open(_index_path(path), 'wb')
+
+    def _write_header(self, frame, disparity):
+        self.header = {'frame_shape': list(frame.shape), 'frame_dtype': frame.dtype.str,
+                       'frame_encoding': self.frame_encoding,
+                       'disparity_shape': list(disparity.shape), 'disparity_dtype': self.disparity_dtype.str,
+                       'disparity_scale': self.disparity_scale}
+        payload = json.dumps(self.header).encode()
+        self._data.write(MAGIC + np.uint32(len(payload)).tobytes() + payload)
+
+    def _append(self, buffer):
+        # pad to the alignment, then write; returns (offset, length)
+        offset = self._data.tell()
+        self._data.write(b'\0' * _padding(offset))
+        offset += _padding(offset)
+        self._data.write(buffer)
+        return offset, memoryview(buffer).nbytes
+
+    def _encode_frame(self, frame):
+        if self.frame_encoding == 'png':
+            ok, encoded = cv2.imencode('.png', frame, [cv2.IMWRITE_PNG_COMPRESSION, 1])
+            if not ok:
+                raise ValueError('Could not encode frame')
+            return encoded.data
+        return np.ascontiguousarray(frame).data
+
+    def _quantize(self, disparity):
+        if self.disparity_dtype == np.float16:
+            return disparity.astype(np.float16)
+        if disparity.dtype == np.int16:
+            return disparity # already fixed point
+        info = np.iinfo(np.int16)
+        return np.clip(np.rint(disparity * self.disparity_scale), info.min, info.max).astype(np.int16)
+
+    def write(self, frame_r, frame_l, disparity, timestamp=None):
+        if self.header is None:
+            self._write_header(frame_r, disparity)
+        elif list(frame_r.shape) != self.header['frame_shape'] or \
+                list(disparity.shape) != self.header['disparity_shape']:
+            raise ValueError(f'Record {frame_r.shape}/{disparity.shape} does not match the recording header')
+
+        entry = np.zeros(1, INDEX_DTYPE)
+        entry['timestamp'] = time.monotonic() if timestamp is None else timestamp
+        entry['frame_r_offset'], entry['frame_r_length'] = self._append(self._encode_frame(frame_r))
+        entry['frame_l_offset'], entry['frame_l_length'] = self._append(self._encode_frame(frame_l))
+        entry['disparity_offset'], entry['disparity_length'] = self._append(
+            np.ascontiguousarray(self._quantize(disparity)).data)
+
+        self._data.flush()
+        self._index.write(entry.tobytes())
+        self._index.flush()
+        self.count += 1
+
+    def close(self):
+        self._data.close()
+        self._index.close()
+
+
+class DepthRecording():
+    """ Reads a DepthRecorder file with O(1) random access.
+
+    The data file is memory-mapped, raw frames and disparity come back as
+    read-only views into it; only PNG frames are decoded on access.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._data = np.memmap(path, dtype=np.uint8, mode='r')
+        if self._data[:len(MAGIC)].tobytes() != MAGIC:
+            raise ValueError(f'{path} is not a depth recording')
+        header_length = int(self._data[len(MAGIC):len(MAGIC) + 4].view(np.uint32)[0])
+        start = len(MAGIC) + 4
+        self.header = json.loads(self._data[start:start + header_length].tobytes())
+
+        index = np.fromfile(_index_path(path), dtype=INDEX_DTYPE)
+        # ignore entries whose data did not make it to disk
+        end = index['disparity_offset'] + index['disparity_length']
+        self.index = index[end <= len(self._data)]
+        self.timestamps = self.index['timestamp']
+
+        self.frame_shape = tuple(self.header['frame_shape'])
+        self.frame_dtype = np.dtype(self.header['frame_dtype'])
+        self.disparity_shape = tuple(self.header['disparity_shape'])
+        self.disparity_dtype = np.dtype(self.header['disparity_dtype'])
+        self.disparity_scale = self.header['disparity_scale']
+
+    def __len__(self):
+        return len(self.index)
+
+    def _view(self, offset, length, dtype, shape):
+        return self._data[offset:offset + length].view(dtype).reshape(shape)
+
+    def _frame(self, idx, side):
+        offset, length = int(self.index[idx][f'frame_{side}_offset']), int(self.index[idx][f'frame_{side}_length'])
+        if self.header['frame_encoding'] == 'png':
+            return cv2.imdecode(self._data[offset:offset + length], cv2.IMREAD_UNCHANGED)
+        return self._view(offset, length, self.frame_dtype, self.frame_shape)
+
+    def frames(self, idx):
+        return self._frame(idx, 'r'), self._frame(idx, 'l')
+
+    def disparity(self, idx, decode=False):
+        """ Stored disparity view; decode=True returns float32 in pixels. """
+        entry = self.index[idx]
+        disparity = self._view(int(entry['disparity_offset']), int(entry['disparity_length']),
+                               self.disparity_dtype, self.disparity_shape)
+        if not decode:
+            return disparity
+        if self.disparity_dtype == np.int16:
+            return disparity.astype(np.float32) / self.disparity_scale
+        return disparity.astype(np.float32)
+
+    def __getitem__(self, idx):
+        frame_r, frame_l = self.frames(idx)
+        return frame_r, frame_l, self.disparity(idx)
+
+    def seek(self, timestamp):
+        # index of the first record at or after timestamp
+        return int(np.searchsorted(self.timestamps, timestamp))
+
+    def stream(self, start=0, stop=None, pacing='fast'):
+        """ Yields (frame_r, frame_l, disparity), pacing='realtime' follows the timestamps. """
+        stop = len(self) if stop is None else min(stop, len(self))
+        wall_start = time.monotonic()
+        for idx in range(start, stop):
+            if pacing == 'realtime':
+                delay = (self.timestamps[idx] - self.timestamps[start]) - (time.monotonic() - wall_start)
+                if delay > 0:
+                    time.sleep(delay)
+            yield self[idx]
@@ -0,0 +1,156 @@
+import cv2
+import json
+import numpy as np
+import os
+import time
+
+from src.data_source.ps4_data_source import PS4DataSource
+
+PACING_MODES = ('realtime', 'fast')
+
+
+def _raw_sidecars(path):
+    stem = os.path.splitext(path)[0]
+    return f'{stem}.json', f'{stem}_timestamps.npy'
+
+
+class RawFrameWriter():
+    """ Writes side-by-side frames as a raw dump readable by FileDataSource.
+
+    Layout: <name>.raw holds the frames back to back, <name>.json the frame
+    shape/dtype and <name>_timestamps.npy one timestamp (seconds) per frame.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.header_path, self.timestamps_path = _raw_sidecars(path)
+        self.shape = None
+        self.dtype = None
+        self.timestamps = []
+        self._file = open(path, 'wb')
+
+    def write(self, frame, timestamp=None):
+        if self.shape is None:
+            self.shape, self.dtype = frame.shape, frame.dtype
+        elif frame.shape != self.shape or frame.dtype != self.dtype:
+            raise ValueError(f'Frame {frame.shape} {frame.dtype} does not match {self.shape} {self.dtype}')
+
+        self._file.write(np.ascontiguousarray(frame).tobytes())
+        self.timestamps.append(time.monotonic() if timestamp is None else timestamp)
+
+    def close(self):
+        self._file.close()
+        with open(self.header_path, 'w') as f:
+            json.dump({'shape': list(self.shape or ()), 'dtype': str(np.dtype(self.dtype or np.uint8))}, f)
+        np.save(self.timestamps_path, np.asarray(self.timestamps, dtype=np.float64))
+
+
+class FileDataSource(PS4DataSource):
+    """ Replays recorded side-by-side PS4 frames instead of the camera.
+
+    Accepts a video file readable by cv2.VideoCapture or a raw dump written
+    by RawFrameWriter (memory-mapped, so frames are never copied on read).
+    pacing='realtime' follows the recorded timestamps, pacing='fast' reads
+    as fast as possible; loop=True restarts the recording at its end.
+    """
+    def __init__(self, path, pacing='fast', loop=False, **kwargs):
+        if pacing not in PACING_MODES:
+            raise ValueError(f'Unknown pacing {pacing}, expected one of {PACING_MODES}')
+        self.path = path
+        self.pacing = pacing
+        self.loop = loop
+        self.frames_read = 0
+        super().__init__(**kwargs)
+
+    def _load_camera_firmware(self):
+        pass # no hardware involved
+
+    def _adapt_brightness(self):
+        pass # recordings already carry their exposure
+
+    def _open_capture_source(self):
+        self.cap = None
+        self.raw_frames = None
+        self.timestamps = None
+
+        if os.path.splitext(self.path)[1] == '.raw':
+            header_path, timestamps_path = _raw_sidecars(self.path)
+            with open(header_path, 'r') as f:
+                header = json.load(f)
+            self.raw_frames = np.memmap(self.path, dtype=header['dtype'], mode='r').reshape(-1, *header['shape'])
+            if os.path.isfile(timestamps_path):
+                self.timestamps = np.load(timestamps_path)
+        else:
+            self.cap = cv2.VideoCapture(self.path)
+            if not self.cap.isOpened():
+                raise IOError(f'Cannot open recording {self.path}')
+
+        self._frame_idx = 0
+        self._clock_start = None
+
+    def _frame_timestamp(self):
+        if self.timestamps is not None:
+            if self._frame_idx >= len(self.timestamps):
+                return None
+            return self.timestamps[self._frame_idx] - self.timestamps[0]
+        if self.cap is not None:
+            return self.cap.get(cv2.CAP_PROP_POS_MSEC) / 1000
+        return None
+
+    def _rewind(self):
+        self._frame_idx = 0
+        self._clock_start = None
+        if self.cap is not None:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+
+    def _grab(self, image=None):
+        if self.raw_frames is not None:
+            if self._frame_idx >= len(self.raw_frames):
+                return None
+            return self.raw_frames[self._frame_idx]
+
+        ret, frame = self.cap.read(image=image)
+        return frame if ret else None
+
+    def _pace(self, timestamp):
+        if self.pacing != 'realtime' or timestamp is None:
+            return
+        now = time.monotonic()
+        if self._clock_start is None:
+            self._clock_start = now - timestamp
+        delay = self._clock_start + timestamp - now
+        if delay > 0:
+            time.sleep(delay)
+
+    def _read_frame(self, reuse_buffers=True):
+        image = None
+        if self.buffer_pool is not None and reuse_buffers:
+            image = self.buffer_pool.peek('raw')
+
+        frame = self._grab(image)
+        if frame is None and self.loop and self.frames_read > 0:
+            self._rewind()
+            frame = self._grab(image)
+        if frame is None:
+            print('End of recording')
+            return None
+
+        # after the grab, a video reports the position of the frame it just decoded
+        self._pace(self._frame_timestamp())
+        self._frame_idx += 1
+        self.frames_read += 1
+
+        if self.buffer_pool is not None and reuse_buffers and self.cap is not None:
+            self.buffer_pool.track('raw', frame)
+        return frame
+
+    def close_stream(self):
+        # same order as PS4DataSource.close_stream, without a capture for .raw dumps
+        if self.auto_exposure is not None:
+            self.auto_exposure.stop()
+        if self.hot_reloader is not None:
+            self.hot_reloader.stop()
+        if self.pipeline is not None:
+            self.pipeline.stop()
+        if self.cap is not None:
+            self.cap.release()
+        self.raw_frames = None
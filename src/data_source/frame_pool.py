@@ -0,0 +1,52 @@
+import numpy as np
+
+
+class FramePool():
+    """ Named, preallocated frame buffers reused across frames.
+
+    Buffers are handed to OpenCV through `dst=` arguments. OpenCV silently
+    allocates a new array when the buffer does not match, so every result
+    is passed back through `track` and any replacement is counted as an
+    allocation. In steady state allocations_per_frame should approach zero.
+    """
+    def __init__(self):
+        self._buffers = {}
+        self.frames = 0
+        self.allocations = 0
+        self.last_frame_allocations = 0
+        self._frame_allocations = 0
+
+    def _allocate(self, name, array):
+        self._buffers[name] = array
+        self.allocations += 1
+        self._frame_allocations += 1
+        return array
+
+    def get(self, name, shape, dtype=np.uint8):
+        buffer = self._buffers.get(name)
+        if buffer is None or buffer.shape != tuple(shape) or buffer.dtype != dtype:
+            buffer = self._allocate(name, np.empty(shape, dtype=dtype))
+        return buffer
+
+    def peek(self, name):
+        # current buffer for name, None until the first frame went through
+        return self._buffers.get(name)
+
+    def track(self, name, result):
+        if result is not None and result is not self._buffers.get(name):
+            self._allocate(name, result)
+        return result
+
+    def new_frame(self):
+        self.frames += 1
+        self.last_frame_allocations = self._frame_allocations
+        self._frame_allocations = 0
+
+    def get_stats(self):
+        frames = max(self.frames, 1)
+        return {'frames': self.frames,
+                'allocations': self.allocations,
+                'allocations_per_frame': self.allocations / frames,
+                'last_frame_allocations': self.last_frame_allocations,
+                'buffers': len(self._buffers),
+                'bytes': sum(buffer.nbytes for buffer in self._buffers.values())}
@@ -0,0 +1,129 @@
+import os
+import threading
+import time
+
+from src.data_source.rectification import SIDES, SOURCE_PARAMS
+
+# files of a calibration folder whose change triggers a reload; the calibration
+# export renames its .npy files into place one by one and writes the manifest
+# last, so in a folder with a manifest only the manifest says that a complete
+# new calibration is there
+MANIFEST_FILE = 'calibration_manifest.json'
+CALIBRATION_FILES = ['3dmap_set.txt', MANIFEST_FILE]
+# folders without a manifest (stereovision exports, hand-edited files) reload on these
+PARAM_FILES = [f'{name}_{side}.npy' for name in SOURCE_PARAMS for side in SIDES]
+
+
+def _signature(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+class FileWatcher():
+    """ Polls a set of files and reports the ones that changed.
+
+    A change is only reported once the file has looked the same for one
+    more poll, so a file that is still being written is not picked up
+    halfway. Polling keeps it dependency free and works the same on every
+    platform.
+    """
+    def __init__(self, paths, callback, interval=0.5):
+        self.paths = list(paths)
+        self.callback = callback
+        self.interval = interval
+
+        self._known = {path: _signature(path) for path in self.paths}
+        self._pending = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True, name='file-watcher')
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def poll(self):
+        changed = []
+        for path in self.paths:
+            signature = _signature(path)
+            if signature == self._known[path]:
+                self._pending.pop(path, None)
+            elif self._pending.get(path) == signature:
+                # unchanged since the last poll, the write has finished
+                self._known[path] = signature
+                del self._pending[path]
+                changed.append(path)
+            else:
+                self._pending[path] = signature
+        if changed:
+            self.callback(changed)
+        return changed
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.poll()
+            except Exception as error: # a bad file must not kill the watcher
+                print(f'Hot reload failed: {error}')
+
+    def stop(self):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+
+class HotReloader():
+    """ Rebuilds matchers and rectification maps when their files change.
+
+    Everything expensive (parsing, creating matchers and the WLS filter,
+    building remap tables) happens on the watcher thread. The results are
+    staged on the data source and the depth algorithm, which swap them in
+    at the next frame boundary, so the stream never waits and no frame is
+    dropped.
+    """
+    def __init__(self, data_source, depth_algo=None, interval=0.5):
+        self.data_source = data_source
+        self.depth_algo = depth_algo
+        self.reloads = 0
+
+        self.calibration_paths = set()
+        self.param_paths = set()
+        self.manifest_path = os.path.join(data_source.calibration_params, MANIFEST_FILE)
+        if data_source.calibrate_camera:
+            self.calibration_paths = {os.path.join(data_source.calibration_params, name)
+                                      for name in CALIBRATION_FILES + PARAM_FILES}
+            self.param_paths = {os.path.join(data_source.calibration_params, name) for name in PARAM_FILES}
+        paths = set(self.calibration_paths)
+        if depth_algo is not None and depth_algo.config_path:
+            paths.add(depth_algo.config_path)
+        self.watcher = FileWatcher(sorted(paths), self._reload, interval)
+
+    def start(self):
+        self.watcher.start()
+        return self
+
+    def _reload(self, changed):
+        reloaded = False
+        if self.depth_algo is not None and self.depth_algo.config_path in changed:
+            reloaded = True
+            start = time.perf_counter()
+            matcher_params = self.depth_algo._read_matcher_params()
+            self.depth_algo.stage_matchers(matcher_params, self.depth_algo._build_matchers(matcher_params))
+            print(f'Rebuilt matchers from {self.depth_algo.config_path} '
+                  f'in {(time.perf_counter() - start) * 1e3:.1f}ms')
+
+        calibration_changed = self.calibration_paths.intersection(changed)
+        if calibration_changed <= self.param_paths and os.path.isfile(self.manifest_path):
+            calibration_changed = set() # an export in progress, its manifest triggers the reload
+        if calibration_changed:
+            reloaded = True
+            start = time.perf_counter()
+            self.data_source.stage_calibration(self.data_source._build_calibration())
+            print(f'Rebuilt calibration from {self.data_source.calibration_params} '
+                  f'in {(time.perf_counter() - start) * 1e3:.1f}ms')
+        self.reloads += reloaded
+
+    def stop(self):
+        self.watcher.stop()
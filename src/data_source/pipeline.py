@@ -0,0 +1,163 @@
+import threading
+import time
+
+from collections import deque
+
+_STOP = object() # sentinel pushed through the queues on shutdown
+
+
+class StageQueue():
+    """ Bounded queue between two pipeline stages.
+
+    When the queue is full the oldest item is dropped, so the consumer
+    always gets the freshest frame instead of working through a backlog.
+    """
+    def __init__(self, maxsize=2, on_drop=None):
+        self.maxsize = maxsize
+        self.on_drop = on_drop
+        self._items = deque()
+        self._cond = threading.Condition()
+
+        self.dropped = 0 # items thrown away because the consumer was too slow
+        self.max_depth = 0
+
+    def put(self, item):
+        with self._cond:
+            if len(self._items) >= self.maxsize:
+                self._items.popleft()
+                self.dropped += 1
+                if self.on_drop is not None:
+                    self.on_drop()
+            self._items.append(item)
+            self.max_depth = max(self.max_depth, len(self._items))
+            self._cond.notify()
+
+    def get(self, timeout=None):
+        with self._cond:
+            if not self._cond.wait_for(lambda: len(self._items) > 0, timeout):
+                return None
+            return self._items.popleft()
+
+    def depth(self):
+        with self._cond:
+            return len(self._items)
+
+
+class StageStats():
+    def __init__(self):
+        self.processed = 0
+        self.total_latency = 0.0
+        self.last_latency = 0.0
+        self.max_latency = 0.0
+
+    def update(self, latency):
+        self.processed += 1
+        self.total_latency += latency
+        self.last_latency = latency
+        self.max_latency = max(self.max_latency, latency)
+
+    def as_dict(self):
+        mean_latency = self.total_latency / self.processed if self.processed else 0.0
+        return {'processed': self.processed,
+                'mean_latency': mean_latency,
+                'last_latency': self.last_latency,
+                'max_latency': self.max_latency}
+
+
+class StereoPipeline():
+    """ Runs capture, rectification and disparity on separate worker threads.
+
+    OpenCV releases the GIL inside cap.read, remap and the stereo matchers,
+    so the stages overlap instead of waiting on each other.
+    """
+    STAGES = ('capture', 'rectify', 'disparity')
+
+    def __init__(self, data_source, depth_algo=None, grayscale=False, queue_size=2):
+        self.data_source = data_source
+        self.depth_algo = depth_algo
+        self.grayscale = grayscale
+
+        self.tracer = data_source.tracer
+        on_drop = lambda: self.tracer.count('frames_dropped')
+        self.queues = {stage: StageQueue(queue_size, on_drop) for stage in self.STAGES}
+        self.stats = {stage: StageStats() for stage in self.STAGES}
+
+        self._running = threading.Event()
+        self._workers = []
+
+    def start(self):
+        self._running.set()
+        targets = [(self._capture_worker, None, 'capture'),
+                   (self._rectify_worker, 'capture', 'rectify'),
+                   (self._disparity_worker, 'rectify', 'disparity')]
+        for target, src, dst in targets:
+            worker = threading.Thread(target=target, args=(src, dst), daemon=True,
+                                      name=f'ps4-{dst}')
+            worker.start()
+            self._workers.append(worker)
+
+    def stop(self):
+        self._running.clear()
+        for worker in self._workers:
+            worker.join(timeout=1.0)
+        self._workers = []
+
+    def _timed(self, stage, func, *args):
+        with self.tracer.span(stage):
+            start = time.perf_counter()
+            result = func(*args)
+            self.stats[stage].update(time.perf_counter() - start)
+        return result
+
+    def _capture_worker(self, _src, dst):
+        while self._running.is_set():
+            frame = self._timed(dst, self.data_source._read_frame, False)
+            if frame is None:
+                break
+            self.queues[dst].put(frame)
+        self.queues[dst].put(_STOP)
+
+    def _rectify_worker(self, src, dst):
+        while self._running.is_set():
+            frame = self.queues[src].get(timeout=0.1)
+            if frame is None:
+                continue
+            if frame is _STOP:
+                break
+            # frames are queued, so every pair needs its own output arrays
+            pair = self._timed(dst, self.data_source._process_frame, frame, self.grayscale, False)
+            self.queues[dst].put(pair)
+        self.queues[dst].put(_STOP)
+
+    def _disparity_worker(self, src, dst):
+        while self._running.is_set():
+            pair = self.queues[src].get(timeout=0.1)
+            if pair is None:
+                continue
+            if pair is _STOP:
+                break
+            frame_r, frame_l = pair
+            disparity = None
+            if self.depth_algo is not None:
+                disparity = self._timed(dst, self.depth_algo.compute_disparity, frame_l, frame_r)
+            self.tracer.count('frames')
+            self.queues[dst].put((frame_r, frame_l, disparity))
+        self.queues[dst].put(_STOP)
+
+    def results(self):
+        while self._running.is_set():
+            item = self.queues['disparity'].get(timeout=0.1)
+            if item is None:
+                continue
+            if item is _STOP:
+                break
+            yield item
+
+    def get_stats(self):
+        stats = {}
+        for stage in self.STAGES:
+            stats[stage] = self.stats[stage].as_dict()
+            stats[stage]['queue_depth'] = self.queues[stage].depth()
+            stats[stage]['max_queue_depth'] = self.queues[stage].max_depth
+            stats[stage]['dropped'] = self.queues[stage].dropped
+        return stats
@@ -1,30 +1,114 @@
 import cv2
-import json
 import numpy as np
 import os
 import time
 import subprocess
+import threading
+import yaml
 
-from stereovision.calibration import StereoCalibration
+from src.data_source.auto_exposure import AutoExposureController
+from src.data_source.frame_pool import FramePool
+from src.data_source.hot_reload import HotReloader
+from src.data_source.pipeline import StereoPipeline
+from src.data_source.rectification import RectificationMaps
+from src.telemetry import NULL_TRACER
 
 FRAME_INFO = { # move these to config file
     cv2.CAP_PROP_FRAME_WIDTH: 3448,
     cv2.CAP_PROP_FRAME_HEIGHT: 808
 }
 
+PS4_CONFIG = './src/data_source/configs/ps4_config.yaml'
+DEPTH_PARAMS_FILE = '3dmap_set.txt' # matcher params in the calibration folder, legacy key names
+BRIGHTNESS_MODES = ('auto', 'config', 'windows')
+# the only ps4_config.yaml properties written to the camera, in this order; the
+# file also lists stream properties (POS_FRAMES, MODE) and CAP_PROP_SETTINGS,
+# which opens the driver's settings dialog on DSHOW
+BRIGHTNESS_PROPS = (cv2.CAP_PROP_AUTO_EXPOSURE, cv2.CAP_PROP_EXPOSURE, cv2.CAP_PROP_GAIN, cv2.CAP_PROP_BRIGHTNESS)
+
 class PS4DataSource():
     def __init__(self, camera_idx=0, frame_width=1264, frame_height=800,
-            calibrate_camera=True, calibration_params='./src/data_source/calibration_params'):
+            calibrate_camera=True, calibration_params='./src/data_source/calibration_params',
+            use_buffer_pool=False, concurrent_matchers=False, tracer=None, fast_startup=False,
+            brightness_mode='config'):
+        if brightness_mode not in BRIGHTNESS_MODES:
+            raise ValueError(f'Unknown brightness_mode {brightness_mode}, expected one of {BRIGHTNESS_MODES}')
         self.camera_idx   = camera_idx
         self.frame_width  = frame_width
         self.frame_height = frame_height
         self.calibrate_camera = calibrate_camera
         self.calibration_params = calibration_params
         self._skip_brightness_calibration = False
-        self._load_camera_firmware()
-        self._open_capture_source()
-        self._adapt_brightness()
-        self._load_calibration_params()
+        # 'config' applies ps4_config.yaml, 'auto' starts from it and keeps
+        # adjusting exposure/gain while streaming
+        self.brightness_mode = brightness_mode
+        self.auto_exposure = None
+        # capture properties waiting for the capture thread, see _apply_capture_settings
+        self._capture_settings = {}
+        self._capture_settings_lock = threading.Lock()
+        self.pipeline = None
+        self.hot_reloader = None
+        # calibration rebuilt by the hot reloader, swapped in before the next frame
+        self._staged_calibration = None
+        self._staged_lock = threading.Lock()
+        # reuse preallocated per-eye buffers instead of allocating every frame
+        self.buffer_pool = FramePool() if use_buffer_pool else None
+        self.concurrent_matchers = concurrent_matchers
+        # per-stage spans and frame counters, no-ops unless a Tracer is given
+        self.tracer = tracer or NULL_TRACER
+
+        # seconds spent in each startup step, see get_startup_report
+        self.startup_timings = {}
+        self._startup_threads = {}
+        self._startup_errors = {}
+        self._init_started = time.perf_counter()
+        self._timed_startup('firmware', self._load_camera_firmware)
+        self._timed_startup('open_capture', self._open_capture_source)
+        if fast_startup:
+            # exposure and calibration settle while the first frames are read,
+            # only rectification waits for the calibration
+            self._start_in_background('brightness', self._adapt_brightness)
+            self._start_in_background('calibration', self._load_calibration_params)
+        else:
+            self._timed_startup('brightness', self._adapt_brightness)
+            self._timed_startup('calibration', self._load_calibration_params)
+        self.startup_timings['init'] = time.perf_counter() - self._init_started
+
+    def _timed_startup(self, step, func):
+        start = time.perf_counter()
+        try:
+            func()
+        finally:
+            self.startup_timings[step] = time.perf_counter() - start
+
+    def _start_in_background(self, step, func):
+        def run():
+            try:
+                self._timed_startup(step, func)
+            except Exception as error:
+                self._startup_errors[step] = error
+        thread = threading.Thread(target=run, daemon=True, name=f'startup-{step}')
+        self._startup_threads[step] = thread
+        thread.start()
+
+    def _wait_for_startup(self, step):
+        # the thread stays registered, every caller (from any thread) waits for the step
+        # and sees its error; joining a finished thread returns right away
+        thread = self._startup_threads.get(step)
+        if thread is None:
+            return
+        thread.join()
+        self._raise_startup_error(step)
+
+    def _raise_startup_error(self, step):
+        # error of a background step that failed, does not wait for one still running
+        error = self._startup_errors.get(step)
+        if error is not None:
+            raise error
+
+    def get_startup_report(self):
+        # per-step seconds; steps still running in the background are missing
+        return dict(self.startup_timings)
 
     def _load_camera_firmware(self):
         _cwd = os.getcwd()
@@ -45,7 +129,12 @@ class PS4DataSource():
     def _adapt_brightness(self):
         if self._skip_brightness_calibration:
             return
-        self._adapt_brightness_using_windows()  
+        if self.brightness_mode == 'windows':
+            self._adapt_brightness_using_windows()
+            return
+        self._adapt_brightness_using_config()
+        if self.brightness_mode == 'auto':
+            self.auto_exposure = AutoExposureController().start()
 
     def _adapt_brightness_using_windows(self):
         # Using windows camera predefined camera init functionality
@@ -55,54 +144,78 @@ class PS4DataSource():
         subprocess.run('Taskkill /IM WindowsCamera.exe /F', shell=True)
         time.sleep(1)
 
-    def _adapt_brightness_using_config(self):
-        # TODO: find magic numbers for brightness configuration
-        # Step1: load ps4_config.yaml
-        # Step2: self.cap.set(key, value)
-        pass
+    def _adapt_brightness_using_config(self, config_path=PS4_CONFIG):
+        # starting point for the exposure controller, keys are cv2.CAP_PROP_* ids
+        with open(config_path, 'r') as f:
+            brightness_info = {int(key): value for key, value in yaml.safe_load(f)['BRIGHTNESS_INFO'].items()}
+        # may run on a startup thread, the capture thread writes them before its next read
+        self._queue_capture_settings({prop: brightness_info[prop] for prop in BRIGHTNESS_PROPS
+                                      if prop in brightness_info})
 
-    def _load_depth_calibration_params(self):
-        param_path = os.path.join(self.calibration_params, '3dmap_set.txt')
+    def _queue_capture_settings(self, settings):
+        with self._capture_settings_lock:
+            self._capture_settings.update(settings)
+
+    def _apply_capture_settings(self):
+        # only called from the thread that reads frames, the capture is not thread safe
+        if not self._capture_settings:
+            return
+        with self._capture_settings_lock:
+            settings, self._capture_settings = self._capture_settings, {}
+        for prop, value in settings.items():
+            self.cap.set(prop, value)
+
+    def _load_depth_engine(self):
+        # BM + WLS configured by 3dmap_set.txt, the same engine as src.depth
+        param_path = os.path.join(self.calibration_params, DEPTH_PARAMS_FILE)
         if not os.path.isfile(param_path):
-            return None, None, None
+            return None
+        from src.depth.stereo_depth import BMDisparity
+        return BMDisparity(param_path, smoothen=True, use_buffer_pool=self.buffer_pool is not None,
+                           concurrent_matchers=self.concurrent_matchers, tracer=self.tracer)
 
-        with open(param_path, 'r') as f:
-            param_dict = json.load(f)
-        
-        # define algorithm for calculating disparities
-        left_matcher = cv2.StereoBM_create()
-
-        # load params for computing disparity
-        left_matcher.setPreFilterCap(param_dict['preFilterCap'])
-        left_matcher.setMinDisparity(param_dict['minDisparity'])
-        left_matcher.setNumDisparities(param_dict['numberOfDisparities'])
-        left_matcher.setTextureThreshold(param_dict['textureThreshold'])
-        left_matcher.setUniquenessRatio(param_dict['uniquenessRatio'])
-        left_matcher.setSpeckleRange(param_dict['speckleRange'])
-        left_matcher.setSpeckleWindowSize(param_dict['speckleWindowSize'])
-
-        right_matcher = cv2.ximgproc.createRightMatcher(left_matcher)
-
-        # load params for smoothing disparity
-        wls_filter = cv2.ximgproc.createDisparityWLSFilter(left_matcher)
-        wls_filter.setLambda(param_dict['lambda'])
-        wls_filter.setSigmaColor(param_dict['sigma'])
-        return left_matcher, right_matcher, wls_filter
+    def _build_calibration(self):
+        # fixed-point remap tables, cached next to the calibration params
+        frame_calibration = RectificationMaps(self.calibration_params, self.get_frame_shape())
+        return frame_calibration, self._load_depth_engine()
+
+    def _set_calibration(self, frame_calibration, depth_engine):
+        self.frame_calibration = frame_calibration
+        self.depth_engine = depth_engine
+        self.use_disparity = depth_engine is not None
 
     def _load_calibration_params(self):
         if os.path.isdir(self.calibration_params) and self.calibrate_camera:
-            self.frame_calibration = StereoCalibration(input_folder=self.calibration_params)
-            self.left_matcher, self.right_matcher, self.wls_filter = self._load_depth_calibration_params()
-            self.use_disparity = True
+            self._set_calibration(*self._build_calibration())
         else:
             print('Could not load calibration params')
-            self.calibrate_camera  = False
-            self.frame_calibration = None
-            self.left_matcher  = None
-            self.right_matcher = None
-            self.wls_filter    = None
-        if self.left_matcher is None or self.right_matcher is None or self.wls_filter is None:
-            self.use_disparity = False
+            self.calibrate_camera = False
+            self._set_calibration(None, None)
+
+    def stage_calibration(self, calibration):
+        # output of _build_calibration, applied at the start of the next frame
+        with self._staged_lock:
+            self._staged_calibration = (calibration, time.perf_counter())
+
+    def _swap_staged_calibration(self):
+        with self._staged_lock:
+            staged, self._staged_calibration = self._staged_calibration, None
+        if staged is None:
+            return
+        start = time.perf_counter()
+        calibration, staged_at = staged
+        self._set_calibration(*calibration)
+        print(f'Calibration swapped in {(time.perf_counter() - start) * 1e3:.3f}ms '
+              f'({(start - staged_at) * 1e3:.1f}ms after staging)')
+
+    def enable_hot_reload(self, depth_algo=None, interval=0.5):
+        """ Watch the calibration folder (and depth_algo's yaml) and reload on change
+        without restarting the stream, the firmware loader or the brightness setup. """
+        self._wait_for_startup('calibration')
+        if self.hot_reloader is not None:
+            self.hot_reloader.stop()
+        self.hot_reloader = HotReloader(self, depth_algo, interval).start()
+        return self.hot_reloader
 
     def _extract_stereo(self, frame, x_shift=64, y_shift=0, frame_shape=None):
         frame_r = frame[y_shift : y_shift+self.frame_height,
@@ -116,48 +229,144 @@ class PS4DataSource():
 
     def get_frame_shape(self):
         return (self.frame_width, self.frame_height)
+
+    def get_reprojection_matrix(self):
+        # Q for the disparities src.depth computes, derived from the rectified projections:
+        # frame_l is the matcher's left view and is rectified with the stereovision 'right'
+        # params (rectify gets (frame_r, frame_l)), so proj_mats_right is the reference
+        from src.depth.depth_map import reprojection_matrix
+        proj_mats = [np.load(os.path.join(self.calibration_params, f'proj_mats_{side}.npy'))
+                     for side in ('right', 'left')]
+        return reprojection_matrix(*proj_mats)
         
     def calculate_disparity(self, frame_r, frame_l):
+        """ Normalized BM + WLS disparity, frames may be BGR or already grayscale. """
+        self._wait_for_startup('calibration')
         if not self.use_disparity:
             return None
+        return self.depth_engine.compute_disparity(frame_l, frame_r)
 
-        # slightly blur the image and downsample it to half
-        stereo_r = cv2.pyrDown(cv2.cvtColor(frame_r, cv2.COLOR_BGR2GRAY))
-        stereo_l = cv2.pyrDown(cv2.cvtColor(frame_l, cv2.COLOR_BGR2GRAY))
+    def _read_frame(self, reuse_buffers=True):
+        image = None
+        if self.buffer_pool is not None and reuse_buffers:
+            image = self.buffer_pool.peek('raw')
+
+        # exposure settles while frames are read, so it is not waited for, but a failure is reported
+        self._raise_startup_error('brightness')
+        self._apply_capture_settings()
+        # capture frame-by-frame
+        ret, frame = self.cap.read(image=image)
+        # if frame is read correctly ret is True
+        if not ret:
+            print("Can't receive frame (stream end?). Exiting ...")
+            self.tracer.count('frames_failed')
+            return None
 
-        # create disparities
-        left_disp  = self.left_matcher.compute(stereo_l, stereo_r)
-        right_disp = self.right_matcher.compute(stereo_r, stereo_l)
+        if self.buffer_pool is not None and reuse_buffers:
+            self.buffer_pool.track('raw', frame)
+        if self.auto_exposure is not None:
+            # metering runs on the controller's thread, new settings land between reads
+            self.auto_exposure.apply(self.cap)
+            self.auto_exposure.submit(frame)
+        return frame
 
-        # filter disparities
-        disparity = self.wls_filter.filter(left_disp, stereo_l, disparity_map_right=right_disp)
+    def _process_frame(self, frame, grayscale=False, reuse_buffers=True):
+        if 'first_frame' not in self.startup_timings:
+            self._wait_for_startup('calibration')
+            self.startup_timings['first_frame'] = time.perf_counter() - self._init_started
+        # frame boundary, the only place the calibration is replaced
+        self._swap_staged_calibration()
+        frame_r, frame_l = self._extract_stereo(frame)
+        use_pool = self.buffer_pool is not None and reuse_buffers
 
-        local_max = disparity.max()
-        local_min = disparity.min()
+        if self.calibrate_camera:
+            # remap writes into preallocated buffers unless frames outlive the call
+            dst = None
+            if use_pool:
+                dst = [self.buffer_pool.get(name, frame_r.shape, frame_r.dtype)
+                       for name in ('rect_r', 'rect_l')]
+            frame_r, frame_l = self.frame_calibration.rectify((frame_r, frame_l), reuse_buffers, dst)
+            if use_pool:
+                self.buffer_pool.track('rect_r', frame_r)
+                self.buffer_pool.track('rect_l', frame_l)
 
-        disparity_visual = (disparity-local_min)*(1.0/(local_max-local_min))
-        return disparity_visual
+        if grayscale and use_pool:
+            gray_shape = frame_r.shape[:2]
+            frame_r = self.buffer_pool.track('gray_r', cv2.cvtColor(frame_r, cv2.COLOR_BGR2GRAY,
+                                             dst=self.buffer_pool.get('gray_r', gray_shape)))
+            frame_l = self.buffer_pool.track('gray_l', cv2.cvtColor(frame_l, cv2.COLOR_BGR2GRAY,
+                                             dst=self.buffer_pool.get('gray_l', gray_shape)))
+        elif grayscale:
+            frame_r = cv2.cvtColor(frame_r, cv2.COLOR_BGR2GRAY)
+            frame_l = cv2.cvtColor(frame_l, cv2.COLOR_BGR2GRAY)
+
+        return frame_r, frame_l
 
     def stream(self, grayscale=False):
+        # with a buffer pool the yielded frames are overwritten by the next frame
+        tracer = self.tracer
         while True:
-            # capture frame-by-frame
-            ret, frame = self.cap.read()
-            # if frame is read correctly ret is True
-            if not ret:
-                print("Can't receive frame (stream end?). Exiting ...")
+            with tracer.span('capture'):
+                frame = self._read_frame()
+            if frame is None:
                 break
 
-            frame_r, frame_l = self._extract_stereo(frame)
+            with tracer.span('rectify'):
+                frames = self._process_frame(frame, grayscale)
+            tracer.count('frames')
+            yield frames
+            if self.buffer_pool is not None:
+                self.buffer_pool.new_frame()
+        return None, None
 
-            if self.calibrate_camera:
-                frame_r, frame_l = self.frame_calibration.rectify((frame_r, frame_l))
+    def stream_pipelined(self, depth_algo=None, grayscale=False, queue_size=2):
+        # capture, rectification and disparity run on their own threads;
+        # yields (frame_r, frame_l, disparity), disparity is None without depth_algo
+        self.pipeline = StereoPipeline(self, depth_algo, grayscale, queue_size)
+        self.pipeline.start()
+        try:
+            yield from self.pipeline.results()
+        finally:
+            self.pipeline.stop()
 
-            if grayscale:
-                frame_r = cv2.cvtColor(frame_r, cv2.COLOR_BGR2GRAY)
-                frame_l = cv2.cvtColor(frame_l, cv2.COLOR_BGR2GRAY)
+    async def astream(self, depth_algo=None, grayscale=False, maxsize=2, skip='block', every=1, executor=None):
+        """ async for frame_r, frame_l, disparity in data_source.astream(...)
 
-            yield frame_r, frame_l
-        return None, None
+        Capture, rectification and disparity run in executors, the event loop
+        only waits. Lossless like stream() by default; skip='oldest' keeps the
+        freshest frame instead. Leaving the loop or cancelling the task
+        releases the capture. For several consumers of one capture use
+        AsyncStreamHub (src.data_source.async_stream) directly.
+        """
+        from src.data_source.async_stream import AsyncStreamHub
+        hub = AsyncStreamHub(self, depth_algo, grayscale, executor)
+        try:
+            async with hub.subscribe(maxsize, skip, every) as subscription:
+                async for item in subscription:
+                    yield item
+        finally:
+            await hub.aclose()
+
+    def get_buffer_stats(self):
+        if self.buffer_pool is None:
+            return {}
+        return self.buffer_pool.get_stats()
+
+    def get_pipeline_stats(self):
+        if self.pipeline is None:
+            return {}
+        return self.pipeline.get_stats()
+
+    def get_exposure_stats(self):
+        if self.auto_exposure is None:
+            return {}
+        return self.auto_exposure.get_stats()
 
     def close_stream(self):
+        if self.auto_exposure is not None:
+            self.auto_exposure.stop()
+        if self.hot_reloader is not None:
+            self.hot_reloader.stop()
+        if self.pipeline is not None:
+            self.pipeline.stop()
         self.cap.release()
\ No newline at end of file
@@ -0,0 +1,114 @@
+import cv2
+import hashlib
+import numpy as np
+import os
+
+CACHE_VERSION = 1
+CACHE_FILE = 'rectification_cache.npz'
+
+# calibration matrices the remap tables are derived from
+SOURCE_PARAMS = ('cam_mats', 'dist_coefs', 'rect_trans', 'proj_mats')
+SIDES = ('left', 'right')
+
+
+class RectificationMaps():
+    """ Fixed-point (CV_16SC2) undistort/rectify maps for one frame size.
+
+    The maps are built once from the stereovision export and cached in a
+    versioned file inside the calibration folder. The cache is keyed by a
+    hash of the calibration matrices, so re-running the calibration
+    invalidates it automatically.
+    """
+    def __init__(self, calibration_params, frame_shape, interpolation=cv2.INTER_NEAREST):
+        self.calibration_params = calibration_params
+        self.frame_shape = tuple(frame_shape) # (width, height)
+        self.interpolation = interpolation
+        self.cache_path = os.path.join(calibration_params, CACHE_FILE)
+
+        self.maps = {}
+        self._buffers = {}
+        self._load_maps()
+
+    def _source_paths(self):
+        return [os.path.join(self.calibration_params, f'{name}_{side}.npy')
+                for name in SOURCE_PARAMS for side in SIDES]
+
+    def _fingerprint(self):
+        digest = hashlib.sha1()
+        for path in self._source_paths():
+            with open(path, 'rb') as f:
+                digest.update(f.read())
+        digest.update(np.int32(self.frame_shape + (self.interpolation,)).tobytes())
+        return digest.hexdigest()
+
+    def _load_maps(self):
+        fingerprint = self._fingerprint()
+        if not self._load_cache(fingerprint):
+            self._build_maps()
+            self._save_cache(fingerprint)
+
+    def _load_cache(self, fingerprint):
+        if not os.path.isfile(self.cache_path):
+            return False
+        try:
+            with np.load(self.cache_path) as cache:
+                if int(cache['version']) != CACHE_VERSION or str(cache['fingerprint']) != fingerprint:
+                    return False
+                for side in SIDES:
+                    map_interp = cache[f'{side}_interp']
+                    self.maps[side] = (cache[f'{side}_xy'], map_interp if map_interp.size else None)
+        except (OSError, KeyError, ValueError):
+            return False
+        return True
+
+    def _build_maps(self):
+        for side in SIDES:
+            cam_mat, dist_coefs, rect_trans, proj_mat = [
+                np.load(os.path.join(self.calibration_params, f'{name}_{side}.npy'))
+                for name in SOURCE_PARAMS]
+            map_x, map_y = cv2.initUndistortRectifyMap(cam_mat, dist_coefs, rect_trans, proj_mat,
+                                                       self.frame_shape, cv2.CV_32FC1)
+            # nearest neighbour only needs the rounded integer coordinates,
+            # which keeps the output identical to StereoCalibration.rectify
+            self.maps[side] = cv2.convertMaps(map_x, map_y, cv2.CV_16SC2,
+                                              nninterpolation=self.interpolation == cv2.INTER_NEAREST)
+
+    def _save_cache(self, fingerprint):
+        arrays = {'version': np.int32(CACHE_VERSION), 'fingerprint': np.str_(fingerprint)}
+        for side in SIDES:
+            map_xy, map_interp = self.maps[side]
+            arrays[f'{side}_xy'] = map_xy
+            arrays[f'{side}_interp'] = map_interp if map_interp is not None else np.empty(0, np.uint16)
+
+        # write next to the cache and rename, so a crash never leaves half a file
+        tmp_path = self.cache_path + '.tmp'
+        try:
+            with open(tmp_path, 'wb') as f:
+                np.savez(f, **arrays)
+            os.replace(tmp_path, self.cache_path)
+        except OSError as error:
+            print(f'Could not write rectification cache: {error}')
+
+    def _get_buffer(self, side, frame):
+        shape = (self.frame_shape[1], self.frame_shape[0]) + frame.shape[2:]
+        buffer = self._buffers.get(side)
+        if buffer is None or buffer.shape != shape or buffer.dtype != frame.dtype:
+            buffer = np.empty(shape, dtype=frame.dtype)
+            self._buffers[side] = buffer
+        return buffer
+
+    def rectify(self, frames, reuse_buffers=True, dst=None):
+        """ Same contract as StereoCalibration.rectify: first frame uses the left maps.
+
+        With reuse_buffers the returned arrays are overwritten on the next call,
+        dst optionally provides the output pair instead of the internal buffers.
+        """
+        rectified = []
+        for i, (frame, side) in enumerate(zip(frames, SIDES)):
+            map_xy, map_interp = self.maps[side]
+            if dst is not None:
+                out = dst[i]
+            else:
+                out = self._get_buffer(side, frame) if reuse_buffers else None
+            rectified.append(cv2.remap(frame, map_xy, map_interp, self.interpolation, dst=out))
+        return rectified
@@ -1,7 +1,39 @@
-from .stereo_depth import *
+import importlib
 
-def get_stereo_depth_algo(algo_type, smoothen):
+# names are resolved on first use (PEP 562), so importing src.depth or one of
+# its light modules does not load every engine and its dependencies
+_EXPORTS = {
+    'AbstractDisparity': 'stereo_depth',
+    'BMDisparity': 'stereo_depth',
+    'SGBMDisparity': 'stereo_depth',
+    'DEFAULT_BM_CONFIG': 'stereo_depth',
+    'DEFAULT_SGBM_CONFIG': 'stereo_depth',
+    'MAX_PYRAMID_LEVEL': 'stereo_depth',
+    'get_matcher_executor': 'stereo_depth',
+    'MatcherConfig': 'matcher_config',
+    'DepthConverter': 'depth_map',
+    'reprojection_matrix': 'depth_map',
+    'scale_reprojection_matrix': 'depth_map',
+    'DisparityChunkStore': 'disparity_store',
+    'IncrementalDisparity': 'incremental_disparity',
+    'ParallelDisparity': 'parallel_disparity',
+    'DisparityWorkerError': 'parallel_disparity',
+}
+
+def __getattr__(name):
+    module_name = _EXPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f'.{module_name}', __name__), name)
+    globals()[name] = value # later lookups skip __getattr__
+    return value
+
+def __dir__():
+    return sorted(list(globals()) + list(_EXPORTS))
+
+def get_stereo_depth_algo(algo_type, smoothen, **kwargs):
+    from .stereo_depth import BMDisparity, SGBMDisparity
     if algo_type == 'bm':
-        return BMDisparity(smoothen=smoothen)
+        return BMDisparity(smoothen=smoothen, **kwargs)
     else:
-        return SGBMDisparity(smoothen=smoothen)
\ No newline at end of file
+        return SGBMDisparity(smoothen=smoothen, **kwargs)
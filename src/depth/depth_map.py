@@ -0,0 +1,84 @@
+import cv2
+import numpy as np
+
+DISP_SCALE = 16 # StereoBM/SGBM and the WLS filter output disparity * 16 as int16
+DEPTH_DTYPES = (np.float16, np.uint16)
+
+
+def reprojection_matrix(proj_mat_left, proj_mat_right):
+    """ Q of a rectified pair from its 3x4 projection matrices (stereoRectify's P1/P2).
+
+    proj_mat_left belongs to the view the matcher treats as left. With
+    t = P[0, 3] / f for each view the baseline is B = t_left - t_right and
+    a disparity d = x_left - x_right lies at depth f * B / (d - (cx_left -
+    cx_right)), in the units of the calibration. Points come out in the
+    left view's camera frame. For P1 left and P2 right this is the Q
+    stereoRectify returns.
+    """
+    proj_mat_left = np.asarray(proj_mat_left, dtype=np.float64)
+    proj_mat_right = np.asarray(proj_mat_right, dtype=np.float64)
+    focal_length = proj_mat_left[0, 0]
+    cx_left, cy = proj_mat_left[0, 2], proj_mat_left[1, 2]
+    cx_right = proj_mat_right[0, 2]
+    baseline = (proj_mat_left[0, 3] - proj_mat_right[0, 3]) / focal_length
+    if baseline == 0:
+        raise ValueError('projection matrices without a baseline, is the calibration rectified?')
+    return np.array([[1, 0, 0, -cx_left],
+                     [0, 1, 0, -cy],
+                     [0, 0, 0, focal_length],
+                     [0, 0, 1 / baseline, -(cx_left - cx_right) / baseline]], dtype=np.float64)
+
+
+def scale_reprojection_matrix(q_matrix, pyramid_level=0, roi=None):
+    """ Q for disparities computed on a downsampled and/or cropped frame.
+
+    A pixel (x, y, d) at pyramid level L inside roi (rx, ry, ...) maps to
+    (s*x + rx, s*y + ry, s*d) in the frame Q was calibrated for, s = 2**L.
+    """
+    scale = 2 ** pyramid_level
+    offset_x, offset_y = (roi[0], roi[1]) if roi is not None else (0, 0)
+    to_full = np.array([[scale, 0, 0, offset_x],
+                        [0, scale, 0, offset_y],
+                        [0, 0, scale, 0],
+                        [0, 0, 0, 1]], dtype=np.float64)
+    return np.asarray(q_matrix, dtype=np.float64) @ to_full
+
+
+class DepthConverter():
+    """ Turns raw fixed-point disparity into depth through a lookup table.
+
+    Every int16 disparity value has its depth precomputed from Q, so the
+    per-frame cost is a single table lookup and the scale is stable across
+    frames. Depth is in the units of the calibration (the square size used
+    for the chessboard), multiplied by depth_scale. Non-positive disparities,
+    and disparities that would put the point behind the camera, are invalid
+    and map to 0.
+    """
+    def __init__(self, q_matrix, dtype=np.float16, depth_scale=1.0):
+        if dtype not in DEPTH_DTYPES:
+            raise ValueError(f'Unsupported depth dtype {dtype}, expected one of {DEPTH_DTYPES}')
+        self.q_matrix = np.asarray(q_matrix, dtype=np.float64)
+        self.dtype = dtype
+        self.depth_scale = depth_scale
+        self.lut = self._build_lut()
+
+    def _build_lut(self):
+        # index with the uint16 view of the int16 disparity: 0..32767 positive, rest negative
+        raw = np.arange(2 ** 16, dtype=np.uint16).view(np.int16).astype(np.float64)
+        disparity = raw / DISP_SCALE
+        w = self.q_matrix[3, 2] * disparity + self.q_matrix[3, 3]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            depth = self.q_matrix[2, 3] / w * self.depth_scale
+        depth[(disparity <= 0) | ~np.isfinite(depth) | (depth <= 0)] = 0
+
+        if self.dtype == np.uint16:
+            return np.clip(np.rint(depth), 0, np.iinfo(np.uint16).max).astype(np.uint16)
+        return np.minimum(depth, np.finfo(np.float16).max).astype(np.float16)
+
+    def to_depth(self, raw_disparity, out=None):
+        raw_disparity = np.ascontiguousarray(raw_disparity, dtype=np.int16)
+        return np.take(self.lut, raw_disparity.view(np.uint16), out=out)
+
+    def to_points(self, raw_disparity):
+        disparity = raw_disparity.astype(np.float32) / DISP_SCALE
+        return cv2.reprojectImageTo3D(disparity, self.q_matrix, handleMissingValues=True)
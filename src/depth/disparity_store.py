@@ -0,0 +1,97 @@
+import json
+import numpy as np
+import os
+
+META_FILE = 'meta.json'
+
+
+class DisparityChunkStore():
+    """ Directory of fixed-size .npy chunks holding a stack of disparity maps.
+
+    Writing only keeps the current chunk mapped, reading memory-maps the
+    chunk an index falls into, so stacks larger than RAM work both ways.
+    meta.json is rewritten after every finished chunk, a store that was
+    interrupted stays readable up to the last complete chunk.
+    """
+    def __init__(self, path, mode='r', chunk_size=32):
+        if mode not in ('r', 'w'):
+            raise ValueError(f"mode must be 'r' or 'w', got {mode}")
+        self.path = path
+        self.mode = mode
+
+        if mode == 'w':
+            os.makedirs(path, exist_ok=True)
+            self.meta = {'count': 0, 'chunk_size': chunk_size, 'shape': None, 'dtype': None}
+        else:
+            with open(os.path.join(path, META_FILE), 'r') as f:
+                self.meta = json.load(f)
+        self.chunk_size = self.meta['chunk_size']
+
+        self._chunk = None
+        self._chunk_idx = None
+
+    def __len__(self):
+        return self.meta['count']
+
+    def _chunk_path(self, chunk_idx):
+        return os.path.join(self.path, f'chunk_{chunk_idx:05d}.npy')
+
+    def _write_meta(self):
+        tmp_path = os.path.join(self.path, META_FILE + '.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(self.meta, f)
+        os.replace(tmp_path, os.path.join(self.path, META_FILE))
+
+    def reserve(self, count, shape, dtype):
+        """ Writable (count, *shape) view for the next count maps, count <= chunk_size.
+
+        Callers fill it in place (e.g. from several threads) and then call commit.
+        """
+        if self.meta['shape'] is None:
+            self.meta['shape'], self.meta['dtype'] = list(shape), np.dtype(dtype).str
+        elif list(shape) != self.meta['shape']:
+            raise ValueError(f'Disparity shape {tuple(shape)} does not match the store {tuple(self.meta["shape"])}')
+        if self.meta['count'] % self.chunk_size + count > self.chunk_size:
+            raise ValueError('A reservation can not span two chunks')
+
+        chunk_idx, offset = divmod(self.meta['count'], self.chunk_size)
+        if self._chunk_idx != chunk_idx:
+            self._chunk = np.lib.format.open_memmap(self._chunk_path(chunk_idx), mode='w+',
+                                                    dtype=self.meta['dtype'],
+                                                    shape=(self.chunk_size,) + tuple(shape))
+            self._chunk_idx = chunk_idx
+        return self._chunk[offset:offset + count]
+
+    def commit(self, count):
+        self.meta['count'] += count
+        if self.meta['count'] % self.chunk_size == 0:
+            self._chunk.flush()
+            self._chunk, self._chunk_idx = None, None
+        self._write_meta()
+
+    def append(self, disparity):
+        self.reserve(1, disparity.shape, disparity.dtype)[0] = disparity
+        self.commit(1)
+
+    def _load_chunk(self, chunk_idx):
+        if self._chunk_idx != chunk_idx:
+            self._chunk = np.load(self._chunk_path(chunk_idx), mmap_mode='r')
+            self._chunk_idx = chunk_idx
+        return self._chunk
+
+    def __getitem__(self, idx):
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError(f'Index {idx} out of range for {len(self)} disparity maps')
+        chunk_idx, offset = divmod(idx, self.chunk_size)
+        return self._load_chunk(chunk_idx)[offset]
+
+    def __iter__(self):
+        for idx in range(len(self)):
+            yield self[idx]
+
+    def close(self):
+        if self._chunk is not None and self.mode == 'w':
+            self._chunk.flush()
+        self._chunk, self._chunk_idx = None, None
@@ -0,0 +1,169 @@
+import cv2
+import numpy as np
+
+from contextlib import nullcontext
+
+
+class IncrementalDisparity():
+    """ Reuses the previous disparity map for tiles that did not change.
+
+    The prepared (rectified, downsampled) frames are compared with the
+    previous ones tile by tile. Only changed tiles, grown by one tile, are
+    matched again; the matcher gets the tile plus a margin and the search
+    range to its left so the tile interior is computed from full context.
+    Every refresh_interval frames, when too much changed or when new
+    matchers were swapped in, the whole map is recomputed.
+
+    Only the raw fixed-point matcher output is cached and patched. The WLS
+    filter (with its per-frame int16 rescale) and the post-processor run
+    over the whole patched map every frame, exactly like the full-frame
+    path, so patched tiles share one scale with the rest of the map.
+    """
+    def __init__(self, depth_algo, tile_size=32, threshold=12, margin=16,
+                 refresh_interval=30, max_changed_ratio=0.5):
+        self.depth_algo = depth_algo
+        self.tile_size = tile_size
+        self.threshold = threshold # max abs pixel difference that still counts as unchanged
+        self.margin = margin
+        self.refresh_interval = refresh_interval
+        self.max_changed_ratio = max_changed_ratio
+
+        self.prev_l = None
+        self.prev_r = None
+        self.left_raw = None # cached raw matcher output, patched tile by tile
+        self.right_raw = None # ... of the right matcher, when the algorithm needs it
+        self.matcher_params = None # params the cached maps were matched with
+        self.search_range = None # coarse-to-fine range of the last full refresh
+
+        self.frames = 0
+        self.full_refreshes = 0
+        self.tiles_total = 0
+        self.tiles_reused = 0
+        self.last_hit_rate = 0.0
+
+    def reset(self):
+        self.prev_l = None
+        self.prev_r = None
+        self.left_raw = None
+        self.right_raw = None
+
+    def _changed_tiles(self, frame_l, frame_r):
+        height, width = frame_l.shape[:2]
+        diff = cv2.max(cv2.absdiff(frame_l, self.prev_l), cv2.absdiff(frame_r, self.prev_r))
+        if diff.ndim == 3:
+            diff = diff.max(axis=2)
+
+        # pad to whole tiles and reduce every tile to its max difference
+        tiles_y = -(-height // self.tile_size)
+        tiles_x = -(-width // self.tile_size)
+        padded = np.zeros((tiles_y * self.tile_size, tiles_x * self.tile_size), dtype=diff.dtype)
+        padded[:height, :width] = diff
+        tile_diff = padded.reshape(tiles_y, self.tile_size, tiles_x, self.tile_size).max(axis=(1, 3))
+
+        changed = (tile_diff > self.threshold).astype(np.uint8)
+        # neighbours of changed tiles see the moved content inside their matching window
+        return cv2.dilate(changed, np.ones((3, 3), np.uint8)).astype(bool)
+
+    def _search_extent(self):
+        params = self.depth_algo.matcher_params
+        return max(params['MinDISP'] + params['NumOfDisp'], 0)
+
+    def _search_range(self):
+        # strips are matched with the same (possibly narrowed) matchers as the cached map
+        if self.search_range is None:
+            return nullcontext()
+        return self.depth_algo._search_range(*self.search_range)
+
+    def _match_full(self, frame_l, frame_r):
+        left_disp, right_disp = self.depth_algo._match(frame_l, frame_r, self.depth_algo._needs_right_disparity())
+        # matcher output may live in the algorithm's buffer pool, keep own copies
+        self.left_raw = np.array(left_disp)
+        self.right_raw = None if right_disp is None else np.array(right_disp)
+
+    def _update_tiles(self, frame_l, frame_r, changed):
+        height, width = frame_l.shape[:2]
+        size, margin = self.tile_size, self.margin
+        extent = self._search_extent()
+        left_matcher, right_matcher = self.depth_algo.left_matcher, self.depth_algo.right_matcher
+
+        for row in np.flatnonzero(changed.any(axis=1)):
+            # merge neighbouring changed tiles of the row into one strip
+            cols = np.flatnonzero(changed[row])
+            splits = np.flatnonzero(np.diff(cols) > 1) + 1
+            for run in np.split(cols, splits):
+                y0, y1 = row * size, min((row + 1) * size, height)
+                x0, x1 = run[0] * size, min((run[-1] + 1) * size, width)
+                ya, yb = max(0, y0 - margin), min(height, y1 + margin)
+                # the left matcher searches to the left, the right matcher to the right
+                self._match_strip(self.left_raw, left_matcher, frame_l, frame_r, (y0, y1, x0, x1),
+                                  (ya, yb, max(0, x0 - extent - margin), min(width, x1 + margin)))
+                if self.right_raw is not None:
+                    self._match_strip(self.right_raw, right_matcher, frame_r, frame_l, (y0, y1, x0, x1),
+                                      (ya, yb, max(0, x0 - margin), min(width, x1 + extent + margin)), right=True)
+
+    def _match_strip(self, raw, matcher, frame_a, frame_b, tile, window, right=False):
+        # matches the window and pastes its tile part into raw
+        y0, y1, x0, x1 = tile
+        ya, yb, xa, xb = window
+        strip = matcher.compute(np.ascontiguousarray(frame_a[ya:yb, xa:xb]),
+                                np.ascontiguousarray(frame_b[ya:yb, xa:xb]))
+        strip = self.depth_algo._restore_invalid(strip, matcher, right)
+        raw[y0:y1, x0:x1] = strip[y0-ya:y1-ya, x0-xa:x1-xa]
+
+    def _store_frames(self, frame_l, frame_r):
+        # prepared frames may live in the algorithm's buffer pool, keep own copies
+        if self.prev_l is None or self.prev_l.shape != frame_l.shape:
+            self.prev_l, self.prev_r = frame_l.copy(), frame_r.copy()
+        else:
+            np.copyto(self.prev_l, frame_l)
+            np.copyto(self.prev_r, frame_r)
+
+    def compute_raw_disparity(self, frame_l, frame_r):
+        depth_algo = self.depth_algo
+        frame_l, frame_r = depth_algo._prepare_frames(frame_l, frame_r)
+        # frame boundary, the only place matchers are replaced
+        depth_algo._swap_staged_matchers()
+
+        full_refresh = (self.left_raw is None or self.prev_l.shape != frame_l.shape
+                        or self.frames % self.refresh_interval == 0
+                        or depth_algo.matcher_params != self.matcher_params)
+        changed = None
+        if not full_refresh:
+            changed = self._changed_tiles(frame_l, frame_r)
+            full_refresh = changed.mean() > self.max_changed_ratio
+
+        if full_refresh:
+            self.matcher_params = dict(depth_algo.matcher_params)
+            self.search_range = None
+            if depth_algo.coarse_to_fine:
+                self.search_range = depth_algo._coarse_search_range(frame_l, frame_r)
+
+        with self._search_range():
+            if full_refresh:
+                self._match_full(frame_l, frame_r)
+                self.full_refreshes += 1
+                self.last_hit_rate = 0.0
+                tiles = -(-frame_l.shape[0] // self.tile_size) * -(-frame_l.shape[1] // self.tile_size)
+            else:
+                self._update_tiles(frame_l, frame_r, changed)
+                self.last_hit_rate = float(1.0 - changed.mean())
+                tiles = changed.size
+                self.tiles_reused += tiles - int(changed.sum())
+            disparity = depth_algo._finish_disparity(self.left_raw, self.right_raw, frame_l, frame_r)
+
+        self.tiles_total += tiles
+        self.frames += 1
+        self._store_frames(frame_l, frame_r)
+        return disparity
+
+    def compute_disparity(self, frame_l, frame_r):
+        disparity = self.depth_algo._normalize_disparity(self.compute_raw_disparity(frame_l, frame_r))
+        if self.depth_algo.buffer_pool is not None:
+            self.depth_algo.buffer_pool.new_frame()
+        return disparity
+
+    def get_stats(self):
+        return {'frames': self.frames,
+                'full_refreshes': self.full_refreshes,
+                'last_hit_rate': self.last_hit_rate,
+                'hit_rate': self.tiles_reused / self.tiles_total if self.tiles_total else 0.0}
@@ -0,0 +1,261 @@
+import cv2
+import os
+import threading
+import yaml
+
+from collections import OrderedDict
+
+# canonical key -> (type, minimum, maximum), None means unbounded
+_COMMON_FIELDS = {
+    'MinDISP': (int, None, None),
+    'NumOfDisp': (int, 16, None),
+    'SpcklRng': (int, 0, None),
+    'SpklWinSze': (int, 0, None),
+    'UnicRatio': (int, 0, None),
+    'LMBDA': (float, 0, None),
+    'SIGMA': (float, 0, None),
+}
+FIELDS = {
+    'bm': {**_COMMON_FIELDS, 'PreFiltCap': (int, 1, 63), 'TxtrThrshld': (int, 0, None)},
+    'sgbm': {**_COMMON_FIELDS, 'BlockSize': (int, 1, None), 'Disp12MaxDiff': (int, -1, None)},
+}
+
+# params that only configure the WLS filter, everything else configures the matchers
+WLS_KEYS = ('LMBDA', 'SIGMA')
+
+# OpenCV-style names used by 3dmap_set.txt from the old calibration tool
+LEGACY_KEYS = {
+    'minDisparity': 'MinDISP',
+    'numberOfDisparities': 'NumOfDisp',
+    'speckleRange': 'SpcklRng',
+    'speckleWindowSize': 'SpklWinSze',
+    'uniquenessRatio': 'UnicRatio',
+    'lambda': 'LMBDA',
+    'sigma': 'SIGMA',
+    'preFilterCap': 'PreFiltCap',
+    'textureThreshold': 'TxtrThrshld',
+    'blockSize': 'BlockSize',
+    'disp12MaxDiff': 'Disp12MaxDiff',
+}
+
+
+class MatcherConfig():
+    """ Validated matcher params for one algorithm, compiled into OpenCV objects.
+
+    The single place that knows how params map onto StereoBM/StereoSGBM and
+    the WLS filter; the src.depth algorithms and PS4DataSource both build
+    their matchers through it. Legacy keys are renamed, integral values of
+    int fields are cast, anything unknown, missing or out of range raises
+    ValueError listing every problem.
+    """
+    def __init__(self, algo_type, params):
+        if algo_type not in FIELDS:
+            raise ValueError(f'Unknown algo_type {algo_type}, expected one of {tuple(FIELDS)}')
+        self.algo_type = algo_type
+        self.params = self._validate({LEGACY_KEYS.get(key, key): value for key, value in params.items()})
+
+    @classmethod
+    def from_file(cls, path, algo_type):
+        return cls(algo_type, _read_config_file(path))
+
+    def _validate(self, params):
+        fields = FIELDS[self.algo_type]
+        errors = [f'unknown key {key}' for key in params if key not in fields]
+        errors += [f'missing key {key}' for key in fields if key not in params]
+
+        validated = {}
+        for key, (kind, low, high) in fields.items():
+            if key not in params:
+                continue
+            value = params[key]
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                errors.append(f'{key} must be a number, got {value!r}')
+                continue
+            if kind is int:
+                if not float(value).is_integer():
+                    errors.append(f'{key} must be an integer, got {value}')
+                    continue
+                value = int(value)
+            if (low is not None and value < low) or (high is not None and value > high):
+                errors.append(f'{key} must be within {low}..{high}, got {value}')
+            validated[key] = value
+
+        if validated.get('NumOfDisp', 16) % 16:
+            errors.append(f'NumOfDisp must be a multiple of 16, got {validated["NumOfDisp"]}')
+        if self.algo_type == 'sgbm' and validated.get('BlockSize', 1) % 2 == 0:
+            errors.append(f'BlockSize must be odd, got {validated["BlockSize"]}')
+        if errors:
+            raise ValueError(f'Invalid {self.algo_type} matcher params: ' + '; '.join(errors))
+        return validated
+
+    def create_matcher(self):
+        if self.algo_type == 'bm':
+            return cv2.StereoBM_create()
+        return cv2.StereoSGBM_create()
+
+    def configure_matcher(self, left_matcher):
+        params = self.params
+        left_matcher.setMinDisparity(params['MinDISP'])
+        left_matcher.setNumDisparities(params['NumOfDisp'])
+        left_matcher.setSpeckleRange(params['SpcklRng'])
+        left_matcher.setSpeckleWindowSize(params['SpklWinSze'])
+        left_matcher.setUniquenessRatio(params['UnicRatio'])
+
+        if self.algo_type == 'bm':
+            left_matcher.setPreFilterCap(params['PreFiltCap'])
+            left_matcher.setTextureThreshold(params['TxtrThrshld'])
+        else:
+            left_matcher.setBlockSize(params['BlockSize'])
+            left_matcher.setP1(8 * (params['BlockSize'] ** 2))
+            left_matcher.setP2(32 * (params['BlockSize'] ** 2))
+            left_matcher.setDisp12MaxDiff(params['Disp12MaxDiff'])
+
+    def configure_wls_filter(self, wls_filter):
+        wls_filter.setLambda(self.params['LMBDA'])
+        wls_filter.setSigmaColor(self.params['SIGMA'])
+
+    def compile(self, matchers=None, wls_filter=None, wls_search_range=False):
+        """ (left, right, wls) for these params. Only what is not passed in is built,
+        matchers / wls_filter must come from a config with the same values for them.
+        wls_search_range builds the filter for this config's MinDISP/NumOfDisp
+        instead of the matcher defaults, see MatcherCache.get_narrowed. """
+        left_matcher = self.create_matcher() if matchers is None else None
+        if wls_filter is None:
+            # creating the filter zeroes the matcher's texture/uniqueness/speckle settings,
+            # so it has to happen before the matcher is configured; the filter itself
+            # only depends on the unconfigured matcher's defaults (and the search range)
+            wls_source = left_matcher or self.create_matcher()
+            if wls_search_range:
+                wls_source.setMinDisparity(self.params['MinDISP'])
+                wls_source.setNumDisparities(self.params['NumOfDisp'])
+            wls_filter = cv2.ximgproc.createDisparityWLSFilter(wls_source)
+            self.configure_wls_filter(wls_filter)
+        elif left_matcher is not None:
+            # the same defaults a new filter would have set on the matcher
+            cv2.ximgproc.createDisparityWLSFilter(left_matcher)
+        if matchers is not None:
+            return matchers + (wls_filter,)
+
+        self.configure_matcher(left_matcher)
+        right_matcher = cv2.ximgproc.createRightMatcher(left_matcher)
+        return left_matcher, right_matcher, wls_filter
+
+
+_file_cache = {} # path -> ((mtime, size), parsed params)
+_file_cache_lock = threading.Lock()
+
+
+def _read_config_file(path):
+    # yaml configs and the JSON 3dmap_set.txt alike (JSON is valid yaml),
+    # parsed again only when the file changed on disk
+    stat = os.stat(path)
+    signature = (stat.st_mtime_ns, stat.st_size)
+    with _file_cache_lock:
+        cached = _file_cache.get(path)
+    if cached is not None and cached[0] == signature:
+        return dict(cached[1])
+    with open(path, 'r') as f:
+        params = yaml.safe_load(f)
+    with _file_cache_lock:
+        _file_cache[path] = (signature, params)
+    return dict(params)
+
+
+class MatcherCache():
+    """ LRU of compiled (left, right, wls) triples keyed by the validated params.
+
+    Switching back to cached params costs a dictionary lookup. On a miss the
+    matchers or the WLS filter of a cached entry are reused when their part
+    of the params matches, so changing LMBDA only builds a new filter.
+    OpenCV matchers are not thread-safe, keep one cache per algorithm
+    instance; the lock only protects the bookkeeping (the hot reloader
+    builds on its own thread).
+    """
+    def __init__(self, algo_type, maxsize=8):
+        self.algo_type = algo_type
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.reused = 0 # misses that reused the matchers or the filter of another entry
+
+        self._entries = OrderedDict()
+        self._narrowed = OrderedDict() # (params key, min_disp, num_disp) -> (left, right, wls)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _split_key(params):
+        matcher_key = tuple(sorted((key, value) for key, value in params.items() if key not in WLS_KEYS))
+        wls_key = tuple(params.get(key) for key in WLS_KEYS)
+        return matcher_key, wls_key
+
+    def _lookup(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            return entry
+
+    def get(self, matcher_params):
+        """ (validated params, (left, right, wls)), raises ValueError for invalid params.
+
+        The params are a copy, callers may change them without touching the cache.
+        """
+        # params seen before skip validation, they equal a validated entry's
+        try:
+            entry = self._lookup(self._split_key(matcher_params))
+        except TypeError:
+            entry = None # unhashable values, e.g. a YAML list, MatcherConfig rejects them
+        if entry is None:
+            entry = self._build(matcher_params)
+        params, matchers = entry
+        return dict(params), matchers
+
+    def _build(self, matcher_params):
+        config = MatcherConfig(self.algo_type, matcher_params)
+        key = self._split_key(config.params)
+        entry = self._lookup(key) # e.g. legacy key names of cached params
+        if entry is not None:
+            return entry
+
+        with self._lock:
+            matchers = next((matchers[:2] for (matcher_key, _), (_, matchers) in self._entries.items()
+                             if matcher_key == key[0]), None)
+            wls_filter = next((matchers[2] for (_, wls_key), (_, matchers) in self._entries.items()
+                               if wls_key == key[1]), None)
+        entry = (config.params, config.compile(matchers, wls_filter))
+        with self._lock:
+            self.misses += 1
+            self.reused += matchers is not None or wls_filter is not None
+            self._entries[key] = entry
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return entry
+
+    def get_narrowed(self, matcher_params, min_disp, num_disp):
+        """ (left, right, wls) for validated matcher_params searching only
+        min_disp..min_disp+num_disp, e.g. the coarse-to-fine passes.
+
+        Built once per range and kept apart from the regular entries, the
+        WLS filter is created for the narrower range too, so none of their
+        objects are shared with (or reconfigured for) another entry.
+        """
+        key = (self._split_key(matcher_params), min_disp, num_disp)
+        with self._lock:
+            matchers = self._narrowed.get(key)
+            if matchers is not None:
+                self._narrowed.move_to_end(key)
+                self.hits += 1
+                return matchers
+
+        config = MatcherConfig(self.algo_type, {**matcher_params, 'MinDISP': min_disp, 'NumOfDisp': num_disp})
+        matchers = config.compile(wls_search_range=True)
+        with self._lock:
+            self.misses += 1
+            self._narrowed[key] = matchers
+            if len(self._narrowed) > self.maxsize:
+                self._narrowed.popitem(last=False)
+        return matchers
+
+    def get_stats(self):
+        return {'entries': len(self._entries), 'narrowed': len(self._narrowed), 'hits': self.hits, 'misses': self.misses, 'reused': self.reused}
@@ -0,0 +1,262 @@
+import multiprocessing as mp
+import numpy as np
+import queue
+import time
+import weakref
+
+from multiprocessing import shared_memory
+
+BACKPRESSURE_MODES = ('block', 'skip')
+POLL_INTERVAL = 0.5 # seconds between worker liveness checks while waiting for results
+
+
+class DisparityWorkerError(RuntimeError):
+    """ A frame failed inside a worker, or a worker process died. """
+
+
+def _algo_spec(depth_algo):
+    # OpenCV matchers can not be pickled, workers rebuild them from this
+    return type(depth_algo), depth_algo.config_path, depth_algo.get_options(), dict(depth_algo.matcher_params)
+
+
+def _release(processes, shms, tasks):
+    # also the weakref.finalize callback, so it must not reference the ParallelDisparity
+    for _ in processes:
+        tasks.put(None)
+    for process in processes:
+        process.join(timeout=5)
+        if process.is_alive():
+            process.terminate()
+    processes.clear()
+    for in_shm, out_shm in shms:
+        for shm in (in_shm, out_shm):
+            shm.close()
+            try:
+                shm.unlink()
+            except FileNotFoundError:
+                pass
+    shms.clear()
+
+
+def _disparity_worker(algo_spec, slot_names, tasks, results):
+    algo_cls, config_path, options, matcher_params = algo_spec
+    depth_algo = algo_cls(config_path=config_path, **options)
+    depth_algo.load_params(matcher_params)
+
+    slots = [(shared_memory.SharedMemory(name=in_name), shared_memory.SharedMemory(name=out_name))
+             for in_name, out_name in slot_names]
+    try:
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            seq, slot, frame_shape, frame_dtype = task
+            in_shm, out_shm = slots[slot]
+            frames = np.ndarray((2,) + frame_shape, dtype=frame_dtype, buffer=in_shm.buf)
+            try:
+                disparity = depth_algo.compute_disparity(frames[0], frames[1])
+                if disparity.nbytes > out_shm.size:
+                    raise ValueError(f'disparity of {disparity.nbytes} bytes does not fit '
+                                     f'the {out_shm.size} byte output slot')
+                out = np.ndarray(disparity.shape, dtype=disparity.dtype, buffer=out_shm.buf)
+                out[...] = disparity
+                results.put((seq, slot, disparity.shape, disparity.dtype.str, None))
+            except Exception as error:
+                results.put((seq, slot, None, None, repr(error)))
+    finally:
+        for in_shm, out_shm in slots:
+            in_shm.close()
+            out_shm.close()
+
+
+class ParallelDisparity():
+    """ Fans disparity computation out to worker processes.
+
+    Frames travel through shared-memory slots instead of being pickled and
+    results come back in submission order. With backpressure='block',
+    submit waits for a free slot; with 'skip' the frame is dropped instead.
+
+    Use it as a context manager or call close(); shared memory left behind
+    by an exception is released when the object is collected or at exit.
+    """
+    def __init__(self, depth_algo, workers=None, backpressure='block', slots_per_worker=2):
+        if backpressure not in BACKPRESSURE_MODES:
+            raise ValueError(f'Unknown backpressure {backpressure}, expected one of {BACKPRESSURE_MODES}')
+        self.depth_algo = depth_algo
+        self.workers = workers or max(mp.cpu_count() - 1, 1)
+        self.backpressure = backpressure
+        self.num_slots = self.workers * slots_per_worker
+
+        self.submitted = 0
+        self.skipped = 0
+        self.failed = 0
+
+        self._processes = []
+        self._shms = []
+        self._finalizer = None
+        self._frame_shape = None
+        self._frame_dtype = None
+        self._free_slots = []
+        self._done = {} # seq -> (slot, shape, dtype, error), waiting for in-order delivery
+        self._backlog = [] # delivered in order but not yet handed to the caller
+        self._next_seq = 0
+        self._next_out = 0
+
+    def _start(self, frame_shape, frame_dtype):
+        self._frame_shape, self._frame_dtype = frame_shape, np.dtype(frame_dtype)
+        in_size = 2 * int(np.prod(frame_shape)) * self._frame_dtype.itemsize
+        # disparity is at most one float64 per input pixel
+        out_size = int(np.prod(frame_shape[:2])) * np.dtype(np.float64).itemsize
+
+        self._tasks = mp.Queue()
+        self._results = mp.Queue()
+        # registered before anything is allocated; the lists are cleared in place,
+        # so the finalizer always sees what is left
+        self._finalizer = weakref.finalize(self, _release, self._processes, self._shms, self._tasks)
+
+        slot_names = []
+        for _ in range(self.num_slots):
+            in_shm = shared_memory.SharedMemory(create=True, size=in_size)
+            out_shm = shared_memory.SharedMemory(create=True, size=out_size)
+            self._shms.append((in_shm, out_shm))
+            slot_names.append((in_shm.name, out_shm.name))
+        self._free_slots = list(range(self.num_slots))
+
+        for _ in range(self.workers):
+            process = mp.Process(target=_disparity_worker, daemon=True,
+                                 args=(_algo_spec(self.depth_algo), slot_names, self._tasks, self._results))
+            process.start()
+            self._processes.append(process)
+
+    def _check_workers(self):
+        # a dead worker takes its task with it, waiting for the result would hang
+        dead = [process for process in self._processes if process.exitcode is not None]
+        if dead:
+            raise DisparityWorkerError(f'{len(dead)} disparity worker(s) died, exit codes '
+                                       f'{[process.exitcode for process in dead]}')
+
+    def _collect(self, block, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = POLL_INTERVAL if deadline is None else min(POLL_INTERVAL, deadline - time.monotonic())
+            try:
+                seq, slot, shape, dtype, error = self._results.get(block, max(wait, 0))
+            except queue.Empty:
+                if not block:
+                    return False
+                self._check_workers()
+                if deadline is not None and time.monotonic() >= deadline:
+                    return False
+                continue
+            self._done[seq] = (slot, shape, dtype, error)
+            return True
+
+    def submit(self, frame_l, frame_r):
+        if not self._processes:
+            self._start(frame_l.shape, frame_l.dtype)
+        if frame_l.shape != self._frame_shape or frame_r.shape != self._frame_shape:
+            raise ValueError(f'Frames must all have shape {self._frame_shape}')
+
+        while not self._free_slots:
+            if self.backpressure == 'skip':
+                self.skipped += 1
+                return False
+            # slots are freed on delivery, so move the oldest finished result
+            # to the backlog if it is ready, otherwise wait for a worker
+            if self._next_out in self._done:
+                self._backlog.append(self._deliver())
+            else:
+                self._collect(block=True, timeout=1.0)
+
+        self._write_slot(frame_l, frame_r)
+        return True
+
+    def _write_slot(self, frame_l, frame_r):
+        slot = self._free_slots.pop()
+        in_shm, _ = self._shms[slot]
+        frames = np.ndarray((2,) + self._frame_shape, dtype=self._frame_dtype, buffer=in_shm.buf)
+        frames[0] = frame_l
+        frames[1] = frame_r
+        self._tasks.put((self._next_seq, slot, self._frame_shape, self._frame_dtype.str))
+        self._next_seq += 1
+        self.submitted += 1
+
+    def _deliver(self):
+        # (disparity, None) or (None, error message)
+        slot, shape, dtype, error = self._done.pop(self._next_out)
+        self._next_out += 1
+        disparity = None
+        if error is None:
+            _, out_shm = self._shms[slot]
+            disparity = np.ndarray(shape, dtype=dtype, buffer=out_shm.buf).copy()
+        else:
+            self.failed += 1
+        self._free_slots.append(slot)
+        return disparity, error
+
+    def pending(self):
+        return self._next_seq - self._next_out + len(self._backlog)
+
+    def get(self, block=True, timeout=None):
+        """ Next disparity in submission order, None if not ready yet.
+
+        Raises DisparityWorkerError when that frame failed in the worker or
+        when a worker process died while waiting.
+        """
+        if self._backlog:
+            disparity, error = self._backlog.pop(0)
+        elif self._next_out >= self._next_seq:
+            return None
+        else:
+            while self._next_out not in self._done:
+                if not self._collect(block, timeout):
+                    return None
+            disparity, error = self._deliver()
+        if error is not None:
+            raise DisparityWorkerError(f'Disparity worker failed: {error}')
+        return disparity
+
+    def compute_disparity(self, frame_l, frame_r):
+        # drop-in for the pipeline: returns the oldest finished result, so the
+        # output lags a few frames behind but throughput scales with workers;
+        # a failed frame is reported and skipped like a frame that is not ready
+        self.submit(frame_l, frame_r)
+        while self._collect(block=False):
+            pass
+        try:
+            return self.get(block=False)
+        except DisparityWorkerError as error:
+            self._check_workers()
+            print(error)
+            return None
+
+    def _ready(self):
+        while self._collect(block=False):
+            pass
+        while self._backlog or self._next_out in self._done:
+            yield self.get(block=False)
+
+    def imap(self, pairs):
+        for frame_l, frame_r in pairs:
+            self.submit(frame_l, frame_r)
+            yield from self._ready()
+        while self.pending():
+            yield self.get()
+
+    def get_stats(self):
+        return {'workers': self.workers,
+                'submitted': self.submitted,
+                'skipped': self.skipped,
+                'failed': self.failed,
+                'pending': self.pending()}
+
+    def close(self):
+        # a finalizer runs at most once, closing twice is fine
+        if self._finalizer is not None:
+            self._finalizer()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
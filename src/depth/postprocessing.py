@@ -0,0 +1,124 @@
+import cv2
+import numpy as np
+
+from src.depth.depth_map import DISP_SCALE
+
+SOBEL_STEP_GAIN = 4 # a 3x3 Sobel answers a step of h grey levels with 4 * h
+
+
+def lr_consistent(disparity, right_disparity, threshold=1.0, disp_scale=DISP_SCALE):
+    """ Mask of left disparities the right matcher agrees with within threshold pixels. """
+    height, width = disparity.shape
+    columns = np.arange(width, dtype=np.int32)
+    # the right matcher reports negative disparities, match x against x - d
+    target = columns - np.floor(disparity / disp_scale + 0.5).astype(np.int32)
+    inside = target >= 0
+    right = np.take_along_axis(np.abs(right_disparity), np.clip(target, 0, width - 1), axis=1)
+    return inside & (np.abs(disparity.astype(np.int32) - right) <= threshold * disp_scale)
+
+
+class DisparityPostProcessor():
+    """ Cleans up raw fixed-point disparity without the WLS filter.
+
+    Steps, each optional and all vectorized:
+    - left-right consistency check against the right matcher's disparity
+    - invalidation of low-confidence pixels (wls_filter.getConfidenceMap())
+    - hole filling along rows with the farther (smaller) of the two nearest
+      valid neighbours, so holes are not filled with foreground
+    - edge-aware median: 5x5 median except where the guide image has edges
+    - exponential temporal filter, reset where the scene changed
+
+    Works on int16 disparity * DISP_SCALE and returns the same format, so
+    the result can go straight into DepthConverter. For disparity in other
+    units (the rescaled WLS output), pass the units of one pixel as
+    disp_scale and the pixel thresholds follow. After process() the
+    per-pixel confidence (0..1) is available in self.confidence.
+    """
+    def __init__(self, lr_check=False, lr_threshold=1.0, min_confidence=None,
+                 fill_holes=True, median=True, edge_threshold=40, temporal_alpha=None,
+                 temporal_reset=2.0, min_disparity=0):
+        self.lr_check = lr_check # only applied when process() gets the right disparity
+        self.lr_threshold = lr_threshold # pixels
+        self.min_confidence = min_confidence # 0..255 like the WLS confidence map
+        self.fill_holes = fill_holes
+        self.median = median
+        self.edge_threshold = edge_threshold # grey-level step across a pixel that counts as an edge
+        self.temporal_alpha = temporal_alpha # weight of the new frame, None disables it
+        self.temporal_reset = temporal_reset # pixels of change that restart the average
+        self.min_disparity = min_disparity
+
+        self.confidence = None
+        self._history = None
+
+    def get_options(self):
+        # constructor arguments, used to give another thread or process a fresh instance
+        return {'lr_check': self.lr_check, 'lr_threshold': self.lr_threshold,
+                'min_confidence': self.min_confidence, 'fill_holes': self.fill_holes,
+                'median': self.median, 'edge_threshold': self.edge_threshold,
+                'temporal_alpha': self.temporal_alpha, 'temporal_reset': self.temporal_reset,
+                'min_disparity': self.min_disparity}
+
+    def reset(self):
+        self._history = None
+
+    def _lr_consistent(self, disparity, right_disparity, disp_scale=DISP_SCALE):
+        return lr_consistent(disparity, right_disparity, self.lr_threshold, disp_scale)
+
+    @staticmethod
+    def _fill_rows(disparity, valid):
+        height, width = disparity.shape
+        columns = np.broadcast_to(np.arange(width), (height, width))
+        # index of the nearest valid pixel to the left / right, -1 / width if none
+        left = np.maximum.accumulate(np.where(valid, columns, -1), axis=1)
+        right = np.minimum.accumulate(np.where(valid, columns, width)[:, ::-1], axis=1)[:, ::-1]
+
+        rows = np.arange(height)[:, None]
+        left_value = np.where(left >= 0, disparity[rows, np.maximum(left, 0)], np.iinfo(np.int16).max)
+        right_value = np.where(right < width, disparity[rows, np.minimum(right, width - 1)], np.iinfo(np.int16).max)
+        fill = np.minimum(left_value, right_value)
+        # rows without any valid pixel stay invalid
+        return np.where(valid | (fill == np.iinfo(np.int16).max), disparity, fill).astype(np.int16)
+
+    def _edge_aware_median(self, disparity, guide):
+        median = cv2.medianBlur(disparity.astype(np.float32), 5)
+        if guide is None:
+            return median
+        if guide.ndim == 3:
+            guide = cv2.cvtColor(guide, cv2.COLOR_BGR2GRAY)
+        if guide.shape != disparity.shape:
+            guide = cv2.resize(guide, disparity.shape[::-1], interpolation=cv2.INTER_AREA)
+        edges = cv2.magnitude(cv2.Sobel(guide, cv2.CV_32F, 1, 0), cv2.Sobel(guide, cv2.CV_32F, 0, 1))
+        # keep the original values on image edges, where depth discontinuities are
+        return np.where(edges > self.edge_threshold * SOBEL_STEP_GAIN, disparity, median)
+
+    def _temporal(self, disparity, valid, disp_scale=DISP_SCALE):
+        current = disparity.astype(np.float32)
+        if self._history is None or self._history.shape != current.shape:
+            self._history = current
+            return disparity
+        blended = self.temporal_alpha * current + (1 - self.temporal_alpha) * self._history
+        changed = np.abs(current - self._history) > self.temporal_reset * disp_scale
+        # the new frame wins where the scene changed, history covers its invalid pixels
+        self._history = np.where(valid, np.where(changed, current, blended), self._history)
+        return np.rint(self._history).astype(np.int16)
+
+    def process(self, disparity, right_disparity=None, confidence=None, guide=None, disp_scale=DISP_SCALE):
+        valid = disparity > (self.min_disparity - 1) * disp_scale
+        if self.lr_check and right_disparity is not None:
+            valid &= self._lr_consistent(disparity, right_disparity, disp_scale)
+        if confidence is not None and self.min_confidence is not None:
+            valid &= confidence >= self.min_confidence
+
+        # confidence: 1 for pixels that survived the checks, 0 for filled ones
+        self.confidence = valid.astype(np.float32)
+        if confidence is not None:
+            self.confidence *= confidence / 255
+
+        result = disparity
+        if self.fill_holes:
+            result = self._fill_rows(disparity, valid)
+        if self.median:
+            result = np.rint(self._edge_aware_median(result, guide)).astype(np.int16)
+        if self.temporal_alpha is not None:
+            result = self._temporal(result, valid, disp_scale)
+        return result
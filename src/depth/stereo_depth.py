@@ -1,83 +1,414 @@
 import cv2
-from matplotlib.pyplot import sca
 import numpy as np
-from numpy.lib.function_base import disp
+import os
+import threading
+import time
 import yaml
 
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from itertools import islice
+
+from src.data_source.frame_pool import FramePool
+from src.depth.depth_map import DISP_SCALE, DepthConverter, scale_reprojection_matrix
+from src.depth.disparity_store import DisparityChunkStore
+from src.depth.matcher_config import MatcherCache, MatcherConfig
+from src.depth.postprocessing import DisparityPostProcessor
+from src.telemetry import NULL_TRACER
+
 DEFAULT_BM_CONFIG = 'src/depth/configs/stereoBM.yaml'
 DEFAULT_SGBM_CONFIG = 'src/depth/configs/stereoSGBM.yaml'
 
+MAX_PYRAMID_LEVEL = 3
+MATCHER_CACHE_SIZE = 8 # compiled matcher sets kept per algorithm instance
+C2F_MARGIN = 4 # disparities added around the coarse estimate, in pixels of the finer level
+
+_matcher_executor = None
+
+def get_matcher_executor():
+    # persistent pool for running the right matcher next to the left one,
+    # OpenCV releases the GIL inside compute so both really run in parallel
+    global _matcher_executor
+    if _matcher_executor is None:
+        _matcher_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='right-matcher')
+    return _matcher_executor
+
 class AbstractDisparity():
-    def __init__(self, config_path=None, smoothen=True):
+    ALGO_TYPE = None # key of the MatcherConfig schema
+
+    def __init__(self, config_path=None, smoothen=True, use_buffer_pool=False, concurrent_matchers=False,
+                 pyramid_level=1, roi=None, coarse_to_fine=False, tracer=None, postprocessor=None):
+        if not 0 <= pyramid_level <= MAX_PYRAMID_LEVEL:
+            raise ValueError(f'pyramid_level must be within 0..{MAX_PYRAMID_LEVEL}, got {pyramid_level}')
         self.config_path = config_path
         self.smoothen = smoothen
+        # number of pyrDown steps before matching, 1 halves the frames
+        self.pyramid_level = pyramid_level
+        # (x, y, width, height) in input frame pixels, None matches the whole frame
+        self.roi = roi
+        # limit the search range with a disparity estimate one level coarser
+        self.coarse_to_fine = coarse_to_fine
+        # per-stage spans, no-ops unless a Tracer is given
+        self.tracer = tracer or NULL_TRACER
+        # reuse preallocated buffers for the per-frame intermediates
+        self.buffer_pool = FramePool() if use_buffer_pool else None
+        # run left and right matcher at the same time in smoothed mode
+        self.concurrent_matchers = concurrent_matchers
+        # DisparityPostProcessor, cleans the left disparity (or the WLS output) up
+        self.postprocessor = postprocessor
 
         self.left_matcher = None
         self.right_matcher = None
+        self.wls_filter = None
         self.matcher_params = {}
+        self.matcher_cache = MatcherCache(self.ALGO_TYPE, MATCHER_CACHE_SIZE)
+        self.depth_converter = None
+
+        # matchers built off the hot path, swapped in before the next frame
+        self._staged = None
+        self._staged_lock = threading.Lock()
+
+    def _read_matcher_params(self):
+        # validated, legacy keys renamed
+        return MatcherConfig.from_file(self.config_path, self.ALGO_TYPE).params
 
     def _init_matcher_params(self):
-        with open(self.config_path, 'r') as f:
-            self.matcher_params = yaml.safe_load(f)
+        self.matcher_params = self._read_matcher_params()
+
+    def _build_matchers(self, matcher_params):
+        # (left, right, wls) for matcher_params, cached or built next to the live ones
+        return self.matcher_cache.get(matcher_params)[1]
 
     def _init_matchers(self):
-        raise NotImplementedError
+        self.left_matcher, self.right_matcher, self.wls_filter = self._build_matchers(self.matcher_params)
+
+    def stage_matchers(self, matcher_params, matchers):
+        """ Queue matchers from _build_matchers, they replace the live ones
+        at the start of the next frame. Safe to call from any thread. """
+        with self._staged_lock:
+            self._staged = (matcher_params, matchers, time.perf_counter())
+
+    def _swap_staged_matchers(self):
+        with self._staged_lock:
+            staged, self._staged = self._staged, None
+        if staged is None:
+            return
+        start = time.perf_counter()
+        matcher_params, (left_matcher, right_matcher, wls_filter), staged_at = staged
+        self.matcher_params = matcher_params
+        self.left_matcher, self.right_matcher, self.wls_filter = left_matcher, right_matcher, wls_filter
+        print(f'Matchers swapped in {(time.perf_counter() - start) * 1e3:.3f}ms '
+              f'({(start - staged_at) * 1e3:.1f}ms after staging)')
 
-    def _init_wls_filter(self):
-        self.wls_filter = cv2.ximgproc.createDisparityWLSFilter(self.left_matcher)
+    @staticmethod
+    def __int16_scale(mini, maxi):
+        # as floats, int16 maxi - mini can overflow; a flat map has nothing to scale
+        return 255 / (float(maxi) - float(mini)) if maxi > mini else 0.0
 
     def __convert_to_int16(self, disparity):
         ''' code based on 
         https://stackoverflow.com/questions/63675690/disparity-map-post-filtering
+        returns the rescaled disparity and the scale factor applied to it
         '''
-        mini, maxi = disparity.min(), disparity.max() 
+        scale = self.__int16_scale(disparity.min(), disparity.max())
         _disparity = np.int16(disparity)         # convert to signed 16 bit integer to allow overflow
-        _disparity = 255/(maxi-mini)*_disparity  # apply scale factor
+        _disparity = _disparity * scale          # apply scale factor
 
-        _disparity = np.int16(_disparity)
-        return _disparity
+        _disparity = np.int16(_disparity)        # truncates toward zero
+        return _disparity, scale
+
+    def __convert_to_int16_pooled(self, name, disparity):
+        # same float64 scaling and truncation as __convert_to_int16, into pooled buffers
+        mini, maxi, _, _ = cv2.minMaxLoc(disparity)
+        scale = self.__int16_scale(mini, maxi)
+        scaled = self.buffer_pool.get(f'{name}_scaled', disparity.shape, np.float64)
+        np.multiply(disparity, scale, out=scaled)
+        dst = self.buffer_pool.get(name, disparity.shape, np.int16)
+        np.copyto(dst, scaled, casting='unsafe')
+        return dst, scale
+
+    def _pooled(self, name, shape, dtype=np.int16):
+        if self.buffer_pool is None:
+            return None
+        return self.buffer_pool.get(name, shape, dtype)
+
+    def _track(self, name, result):
+        if self.buffer_pool is None:
+            return result
+        return self.buffer_pool.track(name, result)
 
     def _compute_coarse_disparity(self, frame_l, frame_r):
-        return self.left_matcher.compute(frame_l, frame_r)
+        disparity = self._pooled('left_disp', frame_l.shape[:2])
+        return self._track('left_disp', self.left_matcher.compute(frame_l, frame_r, disparity))
 
-    def _compute_smooth_disparity(self, frame_l, frame_r):
-        left_disp = self.left_matcher.compute(frame_l, frame_r)
-        right_disp = self.right_matcher.compute(frame_r, frame_l)
+    def _needs_right_disparity(self):
+        return self.smoothen or (self.postprocessor is not None and self.postprocessor.lr_check)
 
-        left_disp = self.__convert_to_int16(left_disp)
-        right_disp = self.__convert_to_int16(right_disp)
+    def _restore_invalid(self, disparity, matcher, right=False):
+        # matchers mark unmatched pixels with (their MinDisparity - 1) * 16; a narrowed
+        # matcher's value lies inside the configured range, so put back the configured one
+        params = self.matcher_params
+        # createRightMatcher searches -(min + num) + 1 .. -min + 1
+        min_disp = 1 - params['MinDISP'] - params['NumOfDisp'] if right else params['MinDISP']
+        active_min = matcher.getMinDisparity()
+        if active_min != min_disp:
+            disparity[disparity == (active_min - 1) * DISP_SCALE] = (min_disp - 1) * DISP_SCALE
+        return disparity
 
+    def _match(self, frame_l, frame_r, with_right=False):
+        # raw fixed-point (left, right) matcher output, right is None unless asked for
+        if not with_right:
+            left_disp = self._compute_coarse_disparity(frame_l, frame_r)
+            return self._restore_invalid(left_disp, self.left_matcher), None
+        right_disp = self._pooled('right_disp', frame_r.shape[:2])
+        if self.concurrent_matchers:
+            right_future = get_matcher_executor().submit(self.right_matcher.compute, frame_r, frame_l, right_disp)
+            left_disp = self._compute_coarse_disparity(frame_l, frame_r)
+            right_disp = right_future.result()
+        else:
+            left_disp = self._compute_coarse_disparity(frame_l, frame_r)
+            right_disp = self.right_matcher.compute(frame_r, frame_l, right_disp)
+        left_disp = self._restore_invalid(left_disp, self.left_matcher)
+        right_disp = self._restore_invalid(right_disp, self.right_matcher, right=True)
+        return left_disp, self._track('right_disp', right_disp)
+
+    def _finish_disparity(self, left_disp, right_disp, frame_l, frame_r, metric=False):
+        # everything after matching: the WLS filter and/or the post-processor
+        if not self.smoothen:
+            if self.postprocessor is None:
+                return left_disp
+            return self._postprocess(left_disp, frame_l, right_disp)
+
+        # units of one pixel of disparity in the WLS input and output
+        disp_scale = DISP_SCALE
+        if metric:
+            pass # the matchers already return int16 fixed point, rescaling would lose the metric scale
+        elif self.buffer_pool is None:
+            left_disp, scale = self.__convert_to_int16(left_disp)
+            right_disp, _ = self.__convert_to_int16(right_disp)
+            disp_scale = DISP_SCALE * scale
+        else:
+            left_disp, scale = self.__convert_to_int16_pooled('left_disp16', left_disp)
+            right_disp, _ = self.__convert_to_int16_pooled('right_disp16', right_disp)
+            disp_scale = DISP_SCALE * scale
+
+        filtered = self._pooled('filtered_disp', frame_l.shape[:2])
         disparity = self.wls_filter.filter(disparity_map_left=left_disp, left_view=frame_l, 
-                                           disparity_map_right=right_disp, right_view=frame_r)
+                                           disparity_map_right=right_disp, right_view=frame_r,
+                                           filtered_disparity_map=filtered)
+        disparity = self._track('filtered_disp', disparity)
+        if self.postprocessor is not None:
+            # the filter already checked left against right, its confidence says where
+            disparity = self._postprocess(disparity, frame_l, confidence=self.wls_filter.getConfidenceMap(),
+                                          disp_scale=disp_scale)
         return disparity
 
+    def _postprocess(self, disparity, frame_l, right_disparity=None, confidence=None, disp_scale=DISP_SCALE):
+        # the range of the matcher that ran, narrower than the params with coarse-to-fine
+        self.postprocessor.min_disparity = self.left_matcher.getMinDisparity()
+        with self.tracer.span('postprocess'):
+            return self.postprocessor.process(disparity, right_disparity, confidence, guide=frame_l,
+                                              disp_scale=disp_scale)
+
     def _normalize_disparity(self, disparity, max=1):
+        if self.buffer_pool is not None:
+            normalized = self.buffer_pool.get('normalized', disparity.shape, np.float64)
+            normalized = cv2.normalize(disparity, normalized, 0, max, cv2.NORM_MINMAX, cv2.CV_64F)
+            return self.buffer_pool.track('normalized', normalized)
+
         # Normalize the values to a range from 0..1 for a grayscale image
-        local_max = disparity.max()
-        local_min = disparity.min()
+        # as floats, int16 max - min can overflow when invalid pixels hold -32768
+        local_max = float(disparity.max())
+        local_min = float(disparity.min())
 
         disparity = (disparity-local_min)*(max/(local_max-local_min))
         return disparity
 
-    def _update_params(self):
-        self.wls_filter.setLambda(self.matcher_params['LMBDA'])
-        self.wls_filter.setSigmaColor(self.matcher_params['SIGMA'])
+    def _update_params(self, matcher_params):
+        # cached matchers are shared between params, never reconfigure them in place;
+        # invalid params raise before anything live is touched
+        self.matcher_params, matchers = self.matcher_cache.get(matcher_params)
+        self.left_matcher, self.right_matcher, self.wls_filter = matchers
     
+    def _prepare_frames(self, frame_l, frame_r):
+        if self.roi is not None:
+            x, y, width, height = self.roi
+            frame_l = frame_l[y:y+height, x:x+width]
+            frame_r = frame_r[y:y+height, x:x+width]
+
+        # the matchers want grayscale, frames that already are skip the conversion
+        if frame_l.ndim == 3:
+            frame_l = self._track('gray_l', cv2.cvtColor(frame_l, cv2.COLOR_BGR2GRAY,
+                                                         dst=self._pooled('gray_l', frame_l.shape[:2], np.uint8)))
+            frame_r = self._track('gray_r', cv2.cvtColor(frame_r, cv2.COLOR_BGR2GRAY,
+                                                         dst=self._pooled('gray_r', frame_r.shape[:2], np.uint8)))
+
+        # slightly blur the image and downsample it, once per pyramid level
+        for level in range(self.pyramid_level):
+            small_shape = ((frame_r.shape[0] + 1) // 2, (frame_r.shape[1] + 1) // 2) + frame_r.shape[2:]
+            frame_r = self._track(f'pyr{level}_r', cv2.pyrDown(frame_r, dst=self._pooled(f'pyr{level}_r', small_shape, frame_r.dtype)))
+            frame_l = self._track(f'pyr{level}_l', cv2.pyrDown(frame_l, dst=self._pooled(f'pyr{level}_l', small_shape, frame_l.dtype)))
+        return frame_l, frame_r
+
+    @contextmanager
+    def _search_range(self, min_disp, num_disp):
+        # temporarily use matchers and a WLS filter built for the narrower range, cached
+        # per range; the live ones are shared by the matcher cache and never reconfigured
+        live = self.left_matcher, self.right_matcher, self.wls_filter
+        self.left_matcher, self.right_matcher, self.wls_filter = self.matcher_cache.get_narrowed(
+            self.matcher_params, int(min_disp), int(num_disp))
+        try:
+            yield
+        finally:
+            self.left_matcher, self.right_matcher, self.wls_filter = live
+
+    def _coarse_search_range(self, frame_l, frame_r):
+        min_disp, num_disp = self.matcher_params['MinDISP'], self.matcher_params['NumOfDisp']
+        coarse_l, coarse_r = cv2.pyrDown(frame_l), cv2.pyrDown(frame_r)
+
+        # disparities halve with the resolution, num_disp has to stay a multiple of 16
+        coarse_min = min_disp // 2
+        coarse_num = max(16, (num_disp // 2 + 15) // 16 * 16)
+        with self._search_range(coarse_min, coarse_num):
+            coarse = self.left_matcher.compute(coarse_l, coarse_r)
+
+        valid = coarse[coarse > (coarse_min - 1) * 16]
+        if valid.size < 0.05 * coarse.size:
+            return None # not enough texture to trust the estimate
+        low, high = np.percentile(valid, (2, 98)) / 16
+
+        fine_min = max(min_disp, int(np.floor(2 * low)) - C2F_MARGIN)
+        fine_max = min(min_disp + num_disp, int(np.ceil(2 * high)) + C2F_MARGIN)
+        fine_num = max(16, (fine_max - fine_min + 15) // 16 * 16)
+        return fine_min, fine_num
+
+    def _compute_matcher_disparity(self, frame_l, frame_r, metric=False):
+        left_disp, right_disp = self._match(frame_l, frame_r, self._needs_right_disparity())
+        return self._finish_disparity(left_disp, right_disp, frame_l, frame_r, metric)
+
+    def _compute_raw_disparity(self, frame_l, frame_r, metric=False):
+        # frame boundary, the only place matchers are replaced
+        self._swap_staged_matchers()
+        search_range = None
+        if self.coarse_to_fine:
+            search_range = self._coarse_search_range(frame_l, frame_r)
+        if search_range is None:
+            return self._compute_matcher_disparity(frame_l, frame_r, metric)
+        with self._search_range(*search_range):
+            return self._compute_matcher_disparity(frame_l, frame_r, metric)
+
     def compute_disparity(self, frame_l, frame_r):
-        # slightly blur the image and downsample it to half
-        frame_r = cv2.pyrDown(frame_r)
-        frame_l = cv2.pyrDown(frame_l)
+        tracer = self.tracer
+        with tracer.span('pyrdown'):
+            frame_l, frame_r = self._prepare_frames(frame_l, frame_r)
+        with tracer.span('matcher'):
+            disparity = self._compute_raw_disparity(frame_l, frame_r)
+        with tracer.span('normalize'):
+            disparity = self._normalize_disparity(disparity)
 
-        if not self.smoothen:
-            disparity = self._compute_coarse_disparity(frame_l, frame_r)
-        else:
-            disparity = self._compute_smooth_disparity(frame_l, frame_r)
-        disparity = self._normalize_disparity(disparity)
+        if self.buffer_pool is not None:
+            self.buffer_pool.new_frame()
+        return disparity
+
+    def _clone(self, **options):
+        # independent instance with the same options and params, for another thread
+        clone = type(self)(self.config_path, **{**self.get_options(), **options})
+        clone.load_params(dict(self.matcher_params))
+        return clone
+
+    def _compute_batch_item(self, frame_l, frame_r, raw=False):
+        if not raw:
+            return self.compute_disparity(frame_l, frame_r)
+        frame_l, frame_r = self._prepare_frames(frame_l, frame_r)
+        disparity = self._compute_raw_disparity(frame_l, frame_r, metric=True)
+        if self.buffer_pool is not None:
+            self.buffer_pool.new_frame()
         return disparity
 
+    def compute_disparity_batch(self, pairs, out_path=None, chunk_size=32, workers=None, raw=False):
+        """ Disparity of every (frame_l, frame_r) in pairs, an iterator or an (N, 2, H, W) stack.
+
+        Pairs are read chunk_size at a time and split over worker threads, each
+        with its own matchers and buffer pool that live for the whole batch.
+        With out_path the maps go to a DisparityChunkStore on disk and the
+        store is returned, otherwise an (N, H, W) array. raw keeps the int16
+        fixed-point disparity instead of normalizing each map.
+        """
+        self._swap_staged_matchers()
+        workers = workers or os.cpu_count() or 1
+        clones = [self._clone(use_buffer_pool=True) for _ in range(workers)]
+        store = DisparityChunkStore(out_path, 'w', chunk_size) if out_path is not None else None
+        in_memory = []
+
+        def run(clone, chunk, out, indices):
+            for i in indices:
+                out[i] = clone._compute_batch_item(*chunk[i], raw=raw)
+
+        pairs = iter(pairs)
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='batch-disparity') as executor:
+            while True:
+                chunk = list(islice(pairs, chunk_size))
+                if not chunk:
+                    break
+                # the first map of the chunk fixes shape and dtype of the output
+                first = clones[0]._compute_batch_item(*chunk[0], raw=raw)
+                if store is not None:
+                    out = store.reserve(len(chunk), first.shape, first.dtype)
+                else:
+                    out = np.empty((len(chunk),) + first.shape, first.dtype)
+                    in_memory.append(out)
+                out[0] = first
+
+                tasks = [executor.submit(run, clone, chunk, out, indices)
+                         for clone, indices in zip(clones, np.array_split(np.arange(1, len(chunk)), workers))]
+                for task in tasks:
+                    task.result()
+                if store is not None:
+                    store.commit(len(chunk))
+
+        if store is not None:
+            store.close()
+            return DisparityChunkStore(out_path, 'r')
+        if not in_memory:
+            return np.empty((0,))
+        return np.concatenate(in_memory)
+
+    def set_reprojection_matrix(self, q_matrix, depth_dtype=np.float16, depth_scale=1.0):
+        # Q for full-size frames, e.g. PS4DataSource.get_reprojection_matrix()
+        q_matrix = scale_reprojection_matrix(q_matrix, self.pyramid_level, self.roi)
+        self.depth_converter = DepthConverter(q_matrix, depth_dtype, depth_scale)
+
+    def _compute_metric_disparity(self, frame_l, frame_r):
+        if self.depth_converter is None:
+            raise RuntimeError('Call set_reprojection_matrix before computing depth')
+        frame_l, frame_r = self._prepare_frames(frame_l, frame_r)
+        return self._compute_raw_disparity(frame_l, frame_r, metric=True)
+
+    def compute_depth(self, frame_l, frame_r):
+        # depth from the raw fixed-point disparity, no per-frame normalization
+        disparity = self._compute_metric_disparity(frame_l, frame_r)
+        out = self._pooled('depth', disparity.shape, self.depth_converter.dtype)
+        depth = self._track('depth', self.depth_converter.to_depth(disparity, out))
+
+        if self.buffer_pool is not None:
+            self.buffer_pool.new_frame()
+        return depth
+
+    def compute_points(self, frame_l, frame_r):
+        # HxWx3 float32 point cloud in calibration units
+        disparity = self._compute_metric_disparity(frame_l, frame_r)
+        return self.depth_converter.to_points(disparity)
+
+    def get_buffer_stats(self):
+        if self.buffer_pool is None:
+            return {}
+        return self.buffer_pool.get_stats()
+
+    def get_matcher_cache_stats(self):
+        return self.matcher_cache.get_stats()
+
     def load_params(self, matcher_params):
-        self.matcher_params = matcher_params
-        self._update_params()
+        self._update_params(matcher_params)
 
     def save_params(self):
         with open(self.config_path, 'w') as f:
@@ -86,55 +417,32 @@ class AbstractDisparity():
     def get_params(self):
         return self.matcher_params
 
+    def get_options(self):
+        # constructor options, used to rebuild an equivalent instance elsewhere
+        return {'smoothen': self.smoothen,
+                'use_buffer_pool': self.buffer_pool is not None,
+                'concurrent_matchers': self.concurrent_matchers,
+                'pyramid_level': self.pyramid_level,
+                'roi': self.roi,
+                'coarse_to_fine': self.coarse_to_fine,
+                # a fresh instance, temporal state must not be shared
+                'postprocessor': None if self.postprocessor is None else
+                                 DisparityPostProcessor(**self.postprocessor.get_options())}
+
 
 class BMDisparity(AbstractDisparity):
-    def __init__(self, config_path=DEFAULT_BM_CONFIG, smoothen=True):
-        super().__init__(config_path, smoothen)
+    ALGO_TYPE = 'bm'
+
+    def __init__(self, config_path=DEFAULT_BM_CONFIG, smoothen=True, **kwargs):
+        super().__init__(config_path, smoothen, **kwargs)
         self._init_matcher_params()
         self._init_matchers()
-        self._init_wls_filter()
-        self._update_params()
-
-    def _init_matchers(self):
-        self.left_matcher = cv2.StereoBM_create()
-        self.right_matcher = cv2.ximgproc.createRightMatcher(self.left_matcher)
-
-    def _update_params(self):
-        super()._update_params()
-        self.left_matcher.setMinDisparity(self.matcher_params['MinDISP'])
-        self.left_matcher.setNumDisparities(self.matcher_params['NumOfDisp'])
-        self.left_matcher.setPreFilterCap(self.matcher_params['PreFiltCap'])
-        self.left_matcher.setSpeckleRange(self.matcher_params['SpcklRng'])
-        self.left_matcher.setSpeckleWindowSize(self.matcher_params['SpklWinSze'])
-        self.left_matcher.setTextureThreshold(self.matcher_params['TxtrThrshld'])
-        self.left_matcher.setUniquenessRatio(self.matcher_params['UnicRatio'])
-
-        self.right_matcher = cv2.ximgproc.createRightMatcher(self.left_matcher)
 
 
 class SGBMDisparity(AbstractDisparity):
-    def __init__(self, config_path=DEFAULT_SGBM_CONFIG, smoothen=True):
-        super().__init__(config_path, smoothen)
+    ALGO_TYPE = 'sgbm'
+
+    def __init__(self, config_path=DEFAULT_SGBM_CONFIG, smoothen=True, **kwargs):
+        super().__init__(config_path, smoothen, **kwargs)
         self._init_matcher_params()
         self._init_matchers()
-        self._init_wls_filter()
-        self._update_params()
-
-    def _init_matchers(self):
-        self.left_matcher = cv2.StereoSGBM_create()
-        self.right_matcher = cv2.ximgproc.createRightMatcher(self.left_matcher)
-
-    def _update_params(self):
-        super()._update_params()
-        self.left_matcher.setMinDisparity(self.matcher_params['MinDISP'])
-        self.left_matcher.setNumDisparities(self.matcher_params['NumOfDisp'])
-        self.left_matcher.setSpeckleRange(self.matcher_params['SpcklRng'])
-        self.left_matcher.setSpeckleWindowSize(self.matcher_params['SpklWinSze'])
-        self.left_matcher.setUniquenessRatio(self.matcher_params['UnicRatio'])
-
-        self.left_matcher.setBlockSize(self.matcher_params['BlockSize'])
-        self.left_matcher.setP1(8 * (self.matcher_params['BlockSize'] ** 2))
-        self.left_matcher.setP2(32 * (self.matcher_params['BlockSize'] ** 2))
-        self.left_matcher.setDisp12MaxDiff(self.matcher_params['Disp12MaxDiff'])
-
-        self.right_matcher = cv2.ximgproc.createRightMatcher(self.left_matcher)
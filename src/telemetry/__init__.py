@@ -0,0 +1,10 @@
+from .tracer import NULL_TRACER, NullTracer, RingHistogram, Tracer
+
+# the sinks pull in http.server, only import them when one is used (PEP 562)
+_SINKS = ('CallbackSink', 'PrometheusSink', 'format_prometheus')
+
+def __getattr__(name):
+    if name not in _SINKS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    from . import sinks
+    return getattr(sinks, name)
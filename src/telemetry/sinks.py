@@ -0,0 +1,69 @@
+import threading
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+METRIC_PREFIX = 'ps4'
+
+
+def format_prometheus(snapshot, prefix=METRIC_PREFIX):
+    lines = [f'# TYPE {prefix}_stage_latency_seconds summary']
+    for stage, summary in snapshot['stages'].items():
+        for quantile, value in summary.items():
+            if isinstance(quantile, float):
+                lines.append(f'{prefix}_stage_latency_seconds{{stage="{stage}",quantile="{quantile}"}} {value}')
+        lines.append(f'{prefix}_stage_latency_seconds_sum{{stage="{stage}"}} {summary["sum"]}')
+        lines.append(f'{prefix}_stage_latency_seconds_count{{stage="{stage}"}} {summary["count"]}')
+    for name, value in snapshot['counters'].items():
+        lines.append(f'# TYPE {prefix}_{name}_total counter')
+        lines.append(f'{prefix}_{name}_total {value}')
+    return '\n'.join(lines) + '\n'
+
+
+class PrometheusSink():
+    """ Serves the tracer snapshot as Prometheus text on http://host:port/metrics. """
+    def __init__(self, tracer, port=9108, host='127.0.0.1'):
+        self.tracer = tracer
+
+        sink = self
+        class _Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != '/metrics':
+                    self.send_error(404)
+                    return
+                body = format_prometheus(sink.tracer.snapshot()).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *_args):
+                pass # keep scrapes out of the console
+
+        self.server = ThreadingHTTPServer((host, port), _Handler)
+        self.port = self.server.server_address[1]
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True, name='metrics-http')
+        self._thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class CallbackSink():
+    """ Calls callback(snapshot) every interval seconds on a background thread. """
+    def __init__(self, tracer, callback, interval=1.0):
+        self.tracer = tracer
+        self.callback = callback
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True, name='metrics-callback')
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.callback(self.tracer.snapshot())
+
+    def close(self):
+        self._stop.set()
+        self._thread.join(timeout=self.interval + 1)
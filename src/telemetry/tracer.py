@@ -0,0 +1,104 @@
+import numpy as np
+import threading
+import time
+
+
+class RingHistogram():
+    """ Latency samples in a fixed-size ring buffer, no allocation per sample. """
+    def __init__(self, size=1024):
+        self.size = size
+        self._values = np.zeros(size, dtype=np.float64)
+        self.count = 0 # total samples ever recorded
+        self.total = 0.0
+
+    def record(self, value):
+        self._values[self.count % self.size] = value
+        self.count += 1
+        self.total += value
+
+    def values(self):
+        return self._values[:min(self.count, self.size)]
+
+    def summary(self, quantiles=(0.5, 0.9, 0.99)):
+        values = self.values()
+        summary = {'count': self.count, 'sum': self.total}
+        for quantile in quantiles:
+            summary[quantile] = float(np.quantile(values, quantile)) if values.size else 0.0
+        return summary
+
+
+class _Span():
+    __slots__ = ('histogram', 'start')
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter() # monotonic
+        return self
+
+    def __exit__(self, *_exc):
+        self.histogram.record(time.perf_counter() - self.start)
+        return False
+
+
+class Tracer():
+    """ Collects per-stage spans and counters for the hot path.
+
+    Stages get a RingHistogram on first use. snapshot() is what the sinks
+    read; it is cheap enough to call from another thread once a second.
+    """
+    def __init__(self, histogram_size=1024):
+        self.histogram_size = histogram_size
+        self.histograms = {}
+        self.counters = {}
+        self._lock = threading.Lock()
+        # counters are bumped from the capture, processing and drop paths at once
+        self._counter_lock = threading.Lock()
+        self.enabled = True
+
+    def span(self, stage):
+        histogram = self.histograms.get(stage)
+        if histogram is None:
+            with self._lock:
+                histogram = self.histograms.setdefault(stage, RingHistogram(self.histogram_size))
+        return _Span(histogram)
+
+    def count(self, name, value=1):
+        with self._counter_lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def snapshot(self):
+        with self._counter_lock:
+            counters = dict(self.counters)
+        return {'timestamp': time.time(),
+                'stages': {stage: histogram.summary() for stage, histogram in list(self.histograms.items())},
+                'counters': counters}
+
+
+class _NullSpan():
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_exc):
+        return False
+
+
+class NullTracer():
+    """ Default tracer: spans and counters are no-ops. """
+    enabled = False
+    _span = _NullSpan()
+
+    def span(self, _stage):
+        return self._span
+
+    def count(self, _name, _value=1):
+        pass
+
+    def snapshot(self):
+        return {'timestamp': time.time(), 'stages': {}, 'counters': {}}
+
+
+NULL_TRACER = NullTracer()
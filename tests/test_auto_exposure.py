@@ -0,0 +1,12 @@
+""" Closed-loop convergence of the auto-exposure controller on a simulated scene. """
+from src.benchmark.auto_exposure import run
+
+# faster than the benchmark's 25 fps camera to keep the test short, the controller still settles
+FRAMES, FPS = 300, 100
+MAX_MEAN_ERROR = 20.0 # grey levels from the target once settled, the benchmark's tolerance
+
+
+def test_brightness_settles_near_target():
+    report = run(FRAMES, FPS, tolerance=MAX_MEAN_ERROR)
+    assert report['settled_mean_abs_error'] < MAX_MEAN_ERROR, report
+    assert report['adjustments'] > 0
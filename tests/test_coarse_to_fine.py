@@ -0,0 +1,26 @@
+""" Pixels the narrowed coarse-to-fine matchers leave unmatched stay invalid. """
+import numpy as np
+import pytest
+
+from src.benchmark.synthetic import make_synthetic_pair
+from src.depth import get_stereo_depth_algo
+from src.depth.depth_map import DISP_SCALE
+
+
+def _raw_disparity(algo_type, coarse_to_fine, frame_l, frame_r):
+    depth_algo = get_stereo_depth_algo(algo_type, False, coarse_to_fine=coarse_to_fine)
+    raw = depth_algo._compute_raw_disparity(*depth_algo._prepare_frames(frame_l, frame_r))
+    return raw, (depth_algo.get_params()['MinDISP'] - 1) * DISP_SCALE
+
+
+@pytest.mark.parametrize('algo_type', ['bm', 'sgbm'])
+def test_invalid_mask_matches_full_range(algo_type):
+    frame_l, frame_r, _ = make_synthetic_pair(seed=0)
+    full, invalid_value = _raw_disparity(algo_type, False, frame_l, frame_r)
+    narrowed, _ = _raw_disparity(algo_type, True, frame_l, frame_r)
+    full_invalid, narrowed_invalid = full <= invalid_value, narrowed <= invalid_value
+
+    # a narrower search rejects fewer pixels, but not a different set of them
+    assert narrowed_invalid.any()
+    assert np.all(narrowed[narrowed_invalid] == invalid_value)
+    assert (full_invalid & narrowed_invalid).sum() >= 0.99 * narrowed_invalid.sum()
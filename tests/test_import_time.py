@@ -0,0 +1,23 @@
+""" Import cost of the camera entry points, each measured in a fresh interpreter. """
+import pytest
+
+from src.benchmark.import_time import ENTRY_MODULES, LAZY_MODULES, measure_import
+
+# cv2 and numpy dominate; generous, so a cold cache or a slow machine does not fail it
+IMPORT_BUDGET_MS = 1000
+
+
+@pytest.fixture(scope='module', params=ENTRY_MODULES)
+def import_times(request):
+    return request.param, measure_import(request.param)
+
+
+def test_heavy_modules_stay_lazy(import_times):
+    module, cumulative = import_times
+    loaded = [name for name in LAZY_MODULES if name in cumulative]
+    assert not loaded, f'{module} imports {", ".join(loaded)}'
+
+
+def test_import_within_budget(import_times):
+    module, cumulative = import_times
+    assert cumulative[module] <= IMPORT_BUDGET_MS, f'{module} takes {cumulative[module]:.0f}ms'
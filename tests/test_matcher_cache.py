@@ -0,0 +1,27 @@
+""" Validation and isolation of the params MatcherCache hands out. """
+import pytest
+
+from src.depth.matcher_config import MatcherCache, MatcherConfig
+from src.depth.stereo_depth import DEFAULT_BM_CONFIG
+
+
+@pytest.fixture
+def params():
+    return MatcherConfig.from_file(DEFAULT_BM_CONFIG, 'bm').params
+
+
+def test_unhashable_value_is_a_validation_error(params):
+    cache = MatcherCache('bm')
+    with pytest.raises(ValueError, match='LMBDA'):
+        cache.get({**params, 'LMBDA': [8000]})
+
+
+def test_returned_params_do_not_alias_the_cache(params):
+    cache = MatcherCache('bm')
+    cached, matchers = cache.get(params)
+    cached['MinDISP'] += 16
+
+    again, matchers_again = cache.get(params)
+    assert again == params
+    assert matchers_again is matchers
+    assert cache.get_stats()['hits'] == 1
@@ -0,0 +1,59 @@
+""" Ordering and shared-memory cleanup of the multi-process disparity pool. """
+import gc
+import numpy as np
+import pytest
+
+from multiprocessing import shared_memory
+
+from src.benchmark.synthetic import make_synthetic_pair
+from src.depth import ParallelDisparity, get_stereo_depth_algo
+
+
+def _pairs(count):
+    frame_l, frame_r, _ = make_synthetic_pair(height=120, width=200)
+    return [(np.roll(frame_l, shift, axis=1), np.roll(frame_r, shift, axis=1)) for shift in range(count)]
+
+
+def _segment_names(parallel):
+    return [shm.name for slot in parallel._shms for shm in slot]
+
+
+def _exists(name):
+    try:
+        shared_memory.SharedMemory(name=name).close()
+    except FileNotFoundError:
+        return False
+    return True
+
+
+def test_results_in_submission_order():
+    depth_algo = get_stereo_depth_algo('bm', False, pyramid_level=0)
+    pairs = _pairs(6)
+    expected = [depth_algo.compute_disparity(frame_l, frame_r) for frame_l, frame_r in pairs]
+    with ParallelDisparity(depth_algo, workers=2) as parallel:
+        results = list(parallel.imap(pairs))
+    assert len(results) == len(expected)
+    for result, disparity in zip(results, expected):
+        np.testing.assert_array_equal(result, disparity)
+
+
+def test_shared_memory_released_on_error():
+    depth_algo = get_stereo_depth_algo('bm', False, pyramid_level=0)
+    (frame_l, frame_r), = _pairs(1)
+    with pytest.raises(ValueError):
+        with ParallelDisparity(depth_algo, workers=1) as parallel:
+            parallel.submit(frame_l, frame_r)
+            names = _segment_names(parallel)
+            parallel.submit(frame_l[:, :-1], frame_r[:, :-1]) # wrong shape
+    assert names and not any(_exists(name) for name in names)
+
+
+def test_shared_memory_released_when_collected():
+    depth_algo = get_stereo_depth_algo('bm', False, pyramid_level=0)
+    (frame_l, frame_r), = _pairs(1)
+    parallel = ParallelDisparity(depth_algo, workers=1)
+    parallel.submit(frame_l, frame_r)
+    names = _segment_names(parallel)
+    del parallel
+    gc.collect()
+    assert names and not any(_exists(name) for name in names)
@@ -0,0 +1,47 @@
+""" Pixel thresholds of the post-processor in fixed-point and rescaled disparity units. """
+import numpy as np
+
+from src.benchmark.synthetic import make_synthetic_pair
+from src.depth import get_stereo_depth_algo
+from src.depth.depth_map import DISP_SCALE
+from src.depth.postprocessing import DisparityPostProcessor
+
+
+def _fixed_point_disparity(seed=0, shape=(48, 64)):
+    # whole pixels in fixed point, with invalid (-1 px) pixels mixed in
+    rng = np.random.default_rng(seed)
+    disparity = rng.integers(0, 24, shape) * DISP_SCALE
+    disparity[rng.random(shape) < 0.2] = -DISP_SCALE
+    return disparity.astype(np.int16)
+
+
+def test_thresholds_follow_disp_scale():
+    scale = 0.25 # like the per-frame int16 rescale before the WLS filter
+    first, second = _fixed_point_disparity(0), _fixed_point_disparity(1)
+    fixed_point = DisparityPostProcessor(median=False, temporal_alpha=0.5)
+    rescaled = DisparityPostProcessor(median=False, temporal_alpha=0.5)
+
+    for disparity in (first, second):
+        expected = fixed_point.process(disparity)
+        result = rescaled.process((disparity * scale).astype(np.int16), disp_scale=DISP_SCALE * scale)
+        np.testing.assert_array_equal(rescaled.confidence, fixed_point.confidence)
+        np.testing.assert_allclose(result, expected * scale, atol=1)
+
+
+class RecordingPostProcessor(DisparityPostProcessor):
+    def process(self, disparity, right_disparity=None, confidence=None, guide=None, disp_scale=DISP_SCALE):
+        self.disp_scale = disp_scale
+        return super().process(disparity, right_disparity, confidence, guide, disp_scale)
+
+
+def test_wls_path_passes_rescaled_units():
+    frame_l, frame_r, _ = make_synthetic_pair(height=200, width=320)
+    postprocessor = RecordingPostProcessor()
+    depth_algo = get_stereo_depth_algo('bm', smoothen=True, pyramid_level=0, postprocessor=postprocessor)
+    frame_l, frame_r = depth_algo._prepare_frames(frame_l, frame_r)
+    left_disp = depth_algo._match(frame_l, frame_r)[0].astype(np.float64)
+
+    depth_algo._compute_raw_disparity(frame_l, frame_r, metric=True)
+    assert postprocessor.disp_scale == DISP_SCALE
+    depth_algo._compute_raw_disparity(frame_l, frame_r)
+    assert np.isclose(postprocessor.disp_scale, DISP_SCALE * 255 / (left_disp.max() - left_disp.min()))